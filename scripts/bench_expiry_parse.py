@@ -0,0 +1,103 @@
+# scripts/bench_expiry_parse.py
+"""
+Micro-benchmark: per-row expiry parse cost, legacy strptime loop vs the
+memoized, format-detecting parser in service.engine.instruments.
+
+  python scripts/bench_expiry_parse.py                 # rows from data/angel_instruments.json
+  python scripts/bench_expiry_parse.py --src dump.json --repeat 5
+"""
+import argparse
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from service.engine import instruments as I  # noqa: E402
+
+# ---------- Legacy implementation (verbatim copy, for the "before" number) ----------
+def _legacy_try_parse_expiry(s: str) -> Optional[datetime]:
+    s = s.strip()
+    if not s:
+        return None
+    fmts = [
+        "%Y-%m-%d",
+        "%d-%b-%Y", "%d %b %Y",
+        "%d-%B-%Y", "%d %B %Y",
+        "%d/%m/%Y", "%m/%d/%Y",
+    ]
+    for f in fmts:
+        try:
+            return datetime.strptime(s, f)
+        except Exception:
+            pass
+    return None
+
+def _legacy_expiry_from_symbol(ts: str) -> Optional[datetime]:
+    TS = ts.upper()
+    m = re.search(r"NIFTY(?P<yy>\d{2})(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)", TS)
+    if m:
+        try:
+            return I._last_thursday_of_month(datetime(2000 + int(m.group("yy")), I._RE_MON[m.group("mon")], 1))
+        except Exception:
+            return None
+    m = re.search(
+        r"(?P<day>\d{1,2})\s*-?(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)\s*-?(?P<yy>\d{2,4})",
+        TS
+    )
+    if m:
+        yr = int(m.group("yy"))
+        if yr < 100:
+            yr += 2000
+        try:
+            return datetime(yr, I._RE_MON[m.group("mon")], int(m.group("day")))
+        except Exception:
+            return None
+    return None
+
+def _legacy_parse(expiry_raw: Optional[str], ts: str) -> Optional[datetime]:
+    dt = _legacy_try_parse_expiry(expiry_raw) if expiry_raw else None
+    return dt or _legacy_expiry_from_symbol(ts)
+
+# ---------- Bench ----------
+def _load_rows(src: Path) -> List[Tuple[Optional[str], str]]:
+    with src.open(encoding="utf-8") as f:
+        return [
+            (I._strip(r.get("expiry")) or None, I._strip(r.get("symbol")))
+            for r in I.iter_scrip_master(f)
+        ]
+
+def _time_per_row(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for raw, ts in rows:
+            fn(raw, ts)
+        best = min(best, time.perf_counter() - t0)
+    return best / max(1, len(rows)) * 1e6  # µs/row
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--src", type=Path, default=I.INSTR_JSON)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    rows = _load_rows(args.src)
+    distinct = len({raw for raw, _ in rows if raw})
+    print(f"rows: {len(rows):,}  distinct expiry strings: {distinct:,}")
+
+    before = _time_per_row(_legacy_parse, rows, args.repeat)
+    I._try_parse_expiry.cache_clear()
+    cold = _time_per_row(I._parse_expiry_any, rows, 1)
+    after = _time_per_row(I._parse_expiry_any, rows, args.repeat)
+
+    print(f"legacy:          {before:8.2f} µs/row")
+    print(f"memoized (cold): {cold:8.2f} µs/row")
+    print(f"memoized (warm): {after:8.2f} µs/row   ({before / after if after else float('inf'):.1f}x)")
+    print(f"cache: {I._try_parse_expiry.cache_info()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# scripts/bench_trade_paths.py
+"""
+Benchmark the quote-bound parts of the buy/sell path and dashboard polling
+against a SmartAPI endpoint (normally scripts/smartapi_standin.py).
+
+  python scripts/smartapi_standin.py --latency default=lognormal:40,0.5 &
+  SMARTAPI_BASE_URL=http://127.0.0.1:8765 SMARTAPI_API_KEY=x SMARTAPI_CLIENT_CODE=x \
+    SMARTAPI_PIN=x SMARTAPI_TOTP_SECRET=JBSWY3DPEHPK3PXP \
+    python scripts/bench_trade_paths.py --viewers 20 --seconds 10
+
+Runs symbol selection (spot + option pick) and the TRADE-lane entry/exit leg
+quotes a few times, then N dashboard viewers polling the legs' MTM every 3s
+in the UI lane. Nothing is written to reports/: positions are not opened.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from urllib.request import urlopen
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from service.engine import metrics  # noqa: E402
+from service.engine.instruments import pick_monthly_option_symbols  # noqa: E402
+from service.engine.positions import _aleg_ltps  # noqa: E402
+from service.engine.ratelimit import Priority, priority  # noqa: E402
+from service.engine.session import base_url  # noqa: E402
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else float("nan")
+
+def _summary(name, ms):
+    print(f"{name:<22} n={len(ms):<5} p50={_pct(ms, .5):7.1f} ms  p95={_pct(ms, .95):7.1f} ms  max={max(ms or [0]):7.1f} ms")
+
+async def _viewer(ce, pe, until, lat, poll_s):
+    with priority(Priority.UI):
+        while time.monotonic() < until:
+            t0 = time.perf_counter()
+            await _aleg_ltps(ce, pe)
+            lat.append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(poll_s)
+
+async def _main(args):
+    t0 = time.perf_counter()
+    ce, ce_lbl, pe, pe_lbl = await asyncio.to_thread(pick_monthly_option_symbols, "UP")
+    print(f"symbols: {ce_lbl} / {pe_lbl}  (selection {1000 * (time.perf_counter() - t0):.0f} ms)")
+
+    trade = []
+    for _ in range(args.trades):
+        t0 = time.perf_counter()
+        with priority(Priority.TRADE):
+            await _aleg_ltps(ce, pe, max_age_s=0)
+        trade.append((time.perf_counter() - t0) * 1000)
+
+    polls = []
+    until = time.monotonic() + args.seconds
+    await asyncio.gather(*(_viewer(ce, pe, until, polls, args.poll) for _ in range(args.viewers)))
+
+    _summary("trade leg quotes", trade)
+    _summary(f"{args.viewers} viewers polling", polls)
+    c = metrics.snapshot()["counters"]
+    print("client:", json.dumps({k: v for k, v in c.items() if k.startswith(("quotes.", "ratelimit."))}))
+    try:
+        print("server:", urlopen(f"{base_url()}/__stats", timeout=2).read().decode())
+    except Exception:
+        pass
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--trades", type=int, default=10, help="entry/exit quote rounds")
+    ap.add_argument("--viewers", type=int, default=10, help="concurrent dashboard viewers")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--poll", type=float, default=3.0, help="dashboard poll interval (s)")
+    asyncio.run(_main(ap.parse_args()))
+
+if __name__ == "__main__":
+    main()
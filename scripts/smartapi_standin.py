@@ -0,0 +1,249 @@
+# scripts/smartapi_standin.py
+"""
+Local SmartAPI REST stand-in for load tests without credentials or network.
+
+  python scripts/smartapi_standin.py                                  # http://127.0.0.1:8765, no faults
+  python scripts/smartapi_standin.py --latency default=lognormal:40,0.5 --latency search=fixed:250
+  python scripts/smartapi_standin.py --error-rate 0.02 --rate-limit ltp=10 --rate-limit quote=10
+
+Point the service at it with
+  SMARTAPI_BASE_URL=http://127.0.0.1:8765 SMARTAPI_API_KEY=x SMARTAPI_CLIENT_CODE=x \
+  SMARTAPI_PIN=x SMARTAPI_TOTP_SECRET=JBSWY3DPEHPK3PXP
+
+Implements loginByPassword, generateTokens, getLtpData, searchScrip and the
+market-quote endpoint. Symbols come from data/angel_instruments.json: NIFTY
+spot random-walks from --spot, option LTPs follow it (intrinsic + a decaying
+time value + noise). Latency distributions (ms) per endpoint name:
+fixed:MS, uniform:LO,HI, normal:MEAN,SD, lognormal:MEDIAN,SIGMA. Rate limits
+answer HTTP 429 with Angel's "exceeding access rate" body. GET /__stats
+returns per-endpoint request/error/429 counts.
+"""
+import argparse
+import base64
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from service.engine.instruments import INSTR_JSON, iter_scrip_master  # noqa: E402
+from service.engine.ratelimit import TokenBucket  # noqa: E402
+
+ENDPOINTS = {
+    "/rest/auth/angelbroking/user/v1/loginByPassword": "login",
+    "/rest/auth/angelbroking/jwt/v1/generateTokens": "refresh",
+    "/rest/secure/angelbroking/order/v1/getLtpData": "ltp",
+    "/rest/secure/angelbroking/order/v1/searchScrip": "search",
+    "/rest/secure/angelbroking/market/v1/quote/": "quote",
+}
+MARKET_QUOTE_MAX = 50
+
+# ---------- Latency ----------
+def _parse_dist(spec: str):
+    kind, _, args = spec.partition(":")
+    a = [float(x) for x in args.split(",") if x]
+    if kind == "fixed":
+        return lambda: a[0]
+    if kind == "uniform":
+        return lambda: random.uniform(a[0], a[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(a[0], a[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(a[0]), a[1])
+    raise SystemExit(f"unknown latency distribution {spec!r}")
+
+def _per_endpoint(items: List[str], parse) -> Dict[str, Any]:
+    out = {}
+    for item in items:
+        name, _, spec = item.partition("=")
+        out[name] = parse(spec)
+    return out
+
+# ---------- Market ----------
+class Market:
+    """Tokens from the instruments file; spot random-walks, options follow it."""
+
+    def __init__(self, path: Path, spot: float, vol_pts: float):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                for r in iter_scrip_master(f):
+                    self.rows[str(r.get("token", "")).strip()] = r
+        self.spot = spot
+        self.vol_pts = vol_pts
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _walk(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            dt = now - self.updated
+            if dt > 0:
+                self.spot = max(1.0, self.spot + random.gauss(0, self.vol_pts * math.sqrt(dt)))
+                self.updated = now
+            return self.spot
+
+    def ltp(self, token: str) -> Optional[float]:
+        r = self.rows.get(token)
+        if r is None:
+            return None
+        spot = self._walk()
+        ts = str(r.get("symbol", "")).upper()
+        if "OPT" not in str(r.get("instrumenttype", "")).upper():
+            return round(spot, 2)
+        try:
+            strike = float(r.get("strike") or 0) / 100.0
+        except ValueError:
+            strike = 0.0
+        intrinsic = max(0.0, spot - strike) if ts.endswith("CE") else max(0.0, strike - spot)
+        time_value = 120.0 * math.exp(-abs(spot - strike) / 400.0)
+        return round(max(0.05, intrinsic + time_value + random.gauss(0, 0.5)), 2)
+
+    def search(self, exchange: str, query: str) -> List[Dict[str, str]]:
+        q = query.upper()
+        hits = []
+        for tok, r in self.rows.items():
+            ts = str(r.get("symbol", "")).upper()
+            if str(r.get("exch_seg", "")).upper() == exchange and q in ts:
+                hits.append({"exchange": exchange, "tradingsymbol": ts, "symboltoken": tok})
+                if ts == q or len(hits) >= 20:
+                    break
+        return hits
+
+# ---------- HTTP ----------
+def _jwt(ttl_s: float) -> str:
+    def b64(d):
+        return base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip("=")
+    return f"{b64({'alg': 'none'})}.{b64({'exp': int(time.time() + ttl_s)})}.standin"
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, args):
+        super().__init__(addr, Handler)
+        self.args = args
+        self.market = Market(args.instruments, args.spot, args.vol)
+        self.latency = _per_endpoint(args.latency, _parse_dist)
+        self.limits = {k: TokenBucket(v, burst=v) for k, v in _per_endpoint(args.rate_limit, float).items()}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, ep: str, what: str) -> None:
+        with self.stats_lock:
+            d = self.stats.setdefault(ep, {"requests": 0, "errors": 0, "rate_limited": 0})
+            d[what] += 1
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    server: StandIn
+
+    def log_message(self, *a):
+        pass
+
+    def _reply(self, code: int, payload: Dict[str, Any]) -> None:
+        out = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_GET(self):
+        if self.path == "/__stats":
+            with self.server.stats_lock:
+                return self._reply(200, self.server.stats)
+        self._reply(404, {"status": False, "message": "not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        ep = ENDPOINTS.get(self.path)
+        if ep is None:
+            return self._reply(404, {"status": False, "message": "not found"})
+        srv = self.server
+        srv.count(ep, "requests")
+
+        dist = srv.latency.get(ep) or srv.latency.get("default")
+        if dist:
+            time.sleep(dist() / 1000.0)
+        bucket = srv.limits.get(ep) or srv.limits.get("default")
+        if bucket is not None and bucket.try_take(0.0):
+            srv.count(ep, "rate_limited")
+            return self._reply(429, {"status": False, "message": "Access denied because of exceeding access rate",
+                                     "errorcode": "", "data": None})
+        if random.random() < srv.args.error_rate:
+            srv.count(ep, "errors")
+            return self._reply(503, {"status": False, "message": "Service Unavailable", "errorcode": "", "data": None})
+
+        self._reply(200, getattr(self, f"_{ep}")(body))
+
+    # ---- endpoints ----
+    def _tokens(self) -> Dict[str, Any]:
+        ttl = self.server.args.session_ttl
+        return {"jwtToken": _jwt(ttl), "refreshToken": _jwt(ttl * 4), "feedToken": "standin-feed"}
+
+    def _login(self, body):
+        return {"status": True, "message": "SUCCESS", "errorcode": "", "data": self._tokens()}
+
+    def _refresh(self, body):
+        return self._login(body)
+
+    def _ltp(self, body):
+        tok = str(body.get("symboltoken", ""))
+        ltp = self.server.market.ltp(tok)
+        if ltp is None:
+            return {"status": False, "message": "Invalid Token", "errorcode": "", "data": None}
+        return {"status": True, "message": "SUCCESS", "errorcode": "", "data": {
+            "exchange": body.get("exchange"), "tradingsymbol": body.get("tradingsymbol"),
+            "symboltoken": tok, "ltp": ltp}}
+
+    def _search(self, body):
+        hits = self.server.market.search(str(body.get("exchange", "")).upper(), str(body.get("searchsymbol", "")))
+        return {"status": True, "message": "SUCCESS", "errorcode": "", "data": hits}
+
+    def _quote(self, body):
+        ex_tokens: Dict[str, List[str]] = body.get("exchangeTokens") or {}
+        if sum(len(v) for v in ex_tokens.values()) > MARKET_QUOTE_MAX:
+            return {"status": False, "message": f"at most {MARKET_QUOTE_MAX} tokens per request", "errorcode": "", "data": None}
+        fetched, unfetched = [], []
+        for ex, toks in ex_tokens.items():
+            for tok in toks:
+                ltp = self.server.market.ltp(str(tok))
+                if ltp is None:
+                    unfetched.append({"exchange": ex, "symbolToken": tok, "message": "Invalid Token"})
+                    continue
+                r = self.server.market.rows[str(tok)]
+                fetched.append({"exchange": ex, "tradingSymbol": r.get("symbol"), "symbolToken": str(tok),
+                                "ltp": ltp, "open": ltp, "high": ltp, "low": ltp, "close": ltp})
+        return {"status": True, "message": "SUCCESS", "errorcode": "", "data": {"fetched": fetched, "unfetched": unfetched}}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--instruments", type=Path, default=INSTR_JSON)
+    ap.add_argument("--spot", type=float, default=24500.0, help="starting NIFTY spot")
+    ap.add_argument("--vol", type=float, default=3.0, help="spot random-walk points per sqrt(second)")
+    ap.add_argument("--latency", action="append", default=[], metavar="EP=DIST",
+                    help="latency per endpoint (login/refresh/ltp/search/quote/default), e.g. ltp=lognormal:40,0.5")
+    ap.add_argument("--rate-limit", action="append", default=[], metavar="EP=RPS",
+                    help="requests/second before HTTP 429, e.g. ltp=10")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered HTTP 503")
+    ap.add_argument("--session-ttl", type=float, default=3600.0, help="JWT lifetime (s) in issued tokens")
+    args = ap.parse_args()
+
+    srv = StandIn((args.host, args.port), args)
+    print(f"🧪 SmartAPI stand-in on http://{args.host}:{srv.server_address[1]} "
+          f"({len(srv.market.rows):,} symbols from {args.instruments})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
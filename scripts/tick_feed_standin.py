@@ -0,0 +1,114 @@
+# scripts/tick_feed_standin.py
+"""
+Local stand-in for SmartAPI's WebSocket v2 tick feed.
+
+  python scripts/tick_feed_standin.py                         # ws://127.0.0.1:8766, random-walk LTPs
+  python scripts/tick_feed_standin.py --replay ticks.ndjson   # replay recorded ticks in a loop
+  python scripts/tick_feed_standin.py --drop-every 20         # kill connections every 20s (reconnect test)
+
+Point the service at it with SMARTAPI_WS=1 SMARTAPI_WS_URL=ws://127.0.0.1:8766.
+Clients subscribe with the usual {"action": 1, "params": {"tokenList": [...]}}
+JSON; each subscribed token then receives LTP-mode binary frames. A replay file
+has one JSON object per line: {"token": "...", "exchangeType": 2, "ltp": 123.45}.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import websockets
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from service.engine.ticks import encode_ltp_frame, SUBSCRIBE_ACTION  # noqa: E402
+
+def _load_replay(path: Optional[Path]) -> List[dict]:
+    if not path:
+        return []
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def _serve_client(ws, args, replay: List[dict]) -> None:
+    subs: Set[Tuple[int, str]] = set()     # (exchangeType, token)
+    prices: Dict[Tuple[int, str], float] = {}
+    seq = 0
+
+    async def reader():
+        async for msg in ws:
+            if msg == "ping":
+                await ws.send("pong")
+                continue
+            try:
+                req = json.loads(msg)
+            except Exception:
+                continue
+            for group in (req.get("params") or {}).get("tokenList") or []:
+                for tok in group.get("tokens") or []:
+                    key = (int(group.get("exchangeType", 1)), str(tok))
+                    if req.get("action") == SUBSCRIBE_ACTION:
+                        subs.add(key)
+                    else:
+                        subs.discard(key)
+
+    async def writer():
+        nonlocal seq
+        i = 0
+        while True:
+            await asyncio.sleep(args.interval)
+            if replay:
+                r = replay[i % len(replay)]
+                i += 1
+                key = (int(r.get("exchangeType", 2)), str(r["token"]))
+                if key not in subs:
+                    continue
+                frames = [(key[1], key[0], float(r["ltp"]))]
+            else:
+                frames = []
+                for key in list(subs):
+                    p = prices.get(key, random.uniform(50, 300))
+                    prices[key] = p = max(0.05, p + random.gauss(0, 0.5))
+                    frames.append((key[1], key[0], round(p, 2)))
+            for tok, exch, ltp in frames:
+                seq += 1
+                await ws.send(encode_ltp_frame(tok, exch, ltp, seq))
+
+    async def dropper():
+        await asyncio.sleep(args.drop_every)
+        await ws.close()
+
+    tasks = [asyncio.ensure_future(reader()), asyncio.ensure_future(writer())]
+    if args.drop_every:
+        tasks.append(asyncio.ensure_future(dropper()))
+    try:
+        await tasks[0]
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        for t in tasks:
+            t.cancel()
+
+async def _main(args) -> None:
+    replay = _load_replay(args.replay)
+    async with websockets.serve(lambda ws: _serve_client(ws, args, replay), args.host, args.port):
+        print(f"📡 tick feed stand-in on ws://{args.host}:{args.port} "
+              f"({'replay ' + str(args.replay) if replay else 'random walk'}, every {args.interval}s)")
+        await asyncio.Future()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--interval", type=float, default=0.25, help="seconds between tick rounds")
+    ap.add_argument("--replay", type=Path, help="NDJSON ticks to replay in a loop")
+    ap.add_argument("--drop-every", type=float, default=0, help="close each connection after N seconds")
+    args = ap.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
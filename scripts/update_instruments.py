@@ -1,16 +1,42 @@
 # scripts/update_instruments.py
+"""
+Refresh data/angel_instruments.json (NFO/NSE index rows only).
+
+  python scripts/update_instruments.py                    # conditional GET, stream, diff
+  python scripts/update_instruments.py --force            # ignore ETag / Last-Modified
+  python scripts/update_instruments.py --src dump.json    # local file or any URL (e.g. a test server)
+
+The download is sent with If-None-Match / If-Modified-Since from the previous
+run (data/angel_instruments.meta.json); a 304 leaves everything untouched.
+Otherwise rows are streamed through the index-row filter into a temp file that
+is atomically renamed over the old snapshot. As each row is written it is
+compared with a token -> row-hash map of the previous snapshot, and the diff is
+written to data/angel_instruments.delta.json so the instrument cache can be
+patched instead of rebuilt; only added/changed rows are held in memory.
+"""
+import argparse
+import hashlib
+import io
 import json
-import os
+import resource
+import sys
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import HTTPError
 from urllib.request import urlopen, Request
 
 IST = timezone(timedelta(hours=5, minutes=30))
 ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = ROOT / "data"
 DEST = DATA_DIR / "angel_instruments.json"
+META = DEST.with_suffix(".meta.json")
+DELTA = DEST.with_suffix(".delta.json")
 URL = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
 
+sys.path.insert(0, str(ROOT))
+from service.engine.instruments import iter_scrip_master, is_index_row  # noqa: E402
+
 def _last_thursday_of_month(dt: datetime) -> datetime:
     nxt = (dt.replace(day=28) + timedelta(days=4)).replace(day=1)
     last = nxt - timedelta(days=1)
@@ -21,33 +47,185 @@ def _last_thursday_of_month(dt: datetime) -> datetime:
 def _current_month_prefix() -> str:
     return _last_thursday_of_month(datetime.now(tz=IST)).strftime("%Y-%m")  # YYYY-MM
 
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _sha256(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _write_json_atomic(path: Path, payload: Any) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(path)
+
+# ---------- Download ----------
+def _read_meta() -> Dict[str, Any]:
+    try:
+        return json.loads(META.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def _open_source(src: str, validators: Dict[str, Any]) -> Tuple[Optional[Any], Dict[str, str]]:
+    """Binary stream for src plus response validators; (None, {}) when the server says 304."""
+    if not src.startswith(("http://", "https://")):
+        return open(src, "rb"), {}
+
+    headers = {"User-Agent": "Mozilla/5.0"}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    try:
+        r = urlopen(Request(src, headers=headers), timeout=60)
+    except HTTPError as e:
+        if e.code == 304:
+            return None, {}
+        raise
+    return r, {"etag": r.headers.get("ETag") or "", "last_modified": r.headers.get("Last-Modified") or ""}
+
+# ---------- Ingest ----------
+def _row_token(row: Dict[str, Any]) -> str:
+    return str(row.get("token", "")).strip()
+
+def _row_hash(row: Dict[str, Any]) -> bytes:
+    return hashlib.blake2b(json.dumps(row, sort_keys=True).encode("utf-8"), digest_size=16).digest()
+
+class _Sink:
+    """
+    Takes kept rows one at a time: writes them to the temp file, diffs them
+    against the previous snapshot's token -> row hash map and tallies the NIFTY
+    option stats, so no full list of rows is ever held.
+    """
+
+    def __init__(self, out, prev: Dict[str, bytes], month: str):
+        self.out = out
+        self.prev = prev
+        self.month = month
+        self.kept = 0
+        self.seen_tokens = set()
+        self.added: List[Dict[str, Any]] = []
+        self.changed: List[Dict[str, Any]] = []
+        self.nifty_opts = 0
+        self.month_examples: List[Dict[str, Any]] = []
+        self.month_nifty_opts = 0
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.out.write(("," if self.kept else "") + json.dumps(row))
+        self.kept += 1
+        t = _row_token(row)
+        self.seen_tokens.add(t)
+        h = self.prev.get(t)
+        if h is None:
+            self.added.append(row)
+        elif h != _row_hash(row):
+            self.changed.append(row)
+        if (str(row.get("exch_seg", "")).upper() == "NFO"
+                and "OPT" in str(row.get("instrumenttype", "")).upper()
+                and "NIFTY" in str(row.get("symbol", "")).upper()):
+            self.nifty_opts += 1
+            if str(row.get("expiry", "")).startswith(self.month):
+                self.month_nifty_opts += 1
+                if len(self.month_examples) < 3:
+                    self.month_examples.append(row)
+
+    def delta(self) -> Dict[str, list]:
+        return {
+            "added": self.added,
+            "removed": [t for t in self.prev if t not in self.seen_tokens],
+            "changed": self.changed,
+        }
+
+def _ingest_full(r, sink: _Sink) -> int:
+    """Legacy path: read the whole master, json.loads it, filter in memory."""
+    data = json.loads(r.read())
+    for d in data:
+        if is_index_row(d):
+            sink.add(d)
+    return len(data)
+
+def _ingest_stream(r, sink: _Sink) -> int:
+    """Decode row by row, keep NFO/NSE index rows, hand them straight to the sink."""
+    seen = 0
+
+    def keep(row):
+        nonlocal seen
+        seen += 1
+        return is_index_row(row)
+
+    for row in iter_scrip_master(io.TextIOWrapper(r, encoding="utf-8"), keep=keep):
+        sink.add(row)
+    return seen
+
+# ---------- Diff ----------
+def _snapshot_hashes(path: Path) -> Dict[str, bytes]:
+    """token -> row hash of the previous snapshot (16 bytes a row instead of the parsed rows)."""
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as f:
+        return {_row_token(r): _row_hash(r) for r in iter_scrip_master(f, keep=is_index_row)}
+
 def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--src", default=URL, help="URL or local path of the full scrip master")
+    ap.add_argument("--mode", choices=("stream", "full"), default="stream",
+                    help="stream: decode row by row (bounded memory); full: legacy json.loads")
+    ap.add_argument("--force", action="store_true", help="download even if the server copy is unchanged")
+    args = ap.parse_args()
+
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    print(f"🔽 Downloading Angel instruments JSON → {DEST}")
-    req = Request(URL, headers={"User-Agent": "Mozilla/5.0"})
-    with urlopen(req, timeout=60) as r:
-        payload = r.read()
+    meta = _read_meta()
+    validators = meta if (DEST.exists() and not args.force and meta.get("src") == args.src) else {}
 
-    # Write
-    DEST.write_bytes(payload)
-    print(f"✅ Saved {DEST} ({DEST.stat().st_size/1024/1024:.2f} MB)")
+    rss_before = _peak_rss_mb()
+    print(f"🔽 Ingesting Angel instruments ({args.mode}) {args.src} → {DEST}")
+    r, resp_validators = _open_source(args.src, validators)
+    if r is None:
+        print(f"⏸  Not modified since {validators.get('last_modified') or validators.get('etag')}; keeping {DEST}")
+        return
+
+    prev_sha = _sha256(DEST)
+    month = _current_month_prefix()
+    tmp = DEST.with_suffix(".json.tmp")
+    with r, tmp.open("w", encoding="utf-8") as out:
+        sink = _Sink(out, _snapshot_hashes(DEST), month)
+        out.write("[")
+        total = (_ingest_stream if args.mode == "stream" else _ingest_full)(r, sink)
+        out.write("]")
+    tmp.replace(DEST)
+    rss_after = _peak_rss_mb()
 
-    # Validate & stats
-    data = json.loads(DEST.read_text(encoding="utf-8"))
-    print(f"📦 Total rows: {len(data):,}")
+    delta = sink.delta()
+    _write_json_atomic(DELTA, {
+        "generated_at_ist": datetime.now(tz=IST).strftime("%Y-%m-%d %H:%M:%S"),
+        "from_sha256": prev_sha,
+        "to_sha256": _sha256(DEST),
+        **delta,
+    })
+    _write_json_atomic(META, {
+        "src": args.src,
+        "fetched_at_ist": datetime.now(tz=IST).strftime("%Y-%m-%d %H:%M:%S"),
+        **resp_validators,
+    })
+
+    print(f"✅ Saved {DEST} ({DEST.stat().st_size/1024/1024:.2f} MB)")
+    print(f"📦 Rows read: {total:,}  kept (index rows): {sink.kept:,}")
+    print(f"🧠 Peak RSS: {rss_before:.1f} MB before → {rss_after:.1f} MB after (+{rss_after - rss_before:.1f} MB)")
+    print(f"🔁 Diff vs previous: +{len(delta['added']):,} added, -{len(delta['removed']):,} removed, "
+          f"~{len(delta['changed']):,} changed → {DELTA.name}")
 
     # quick stats
-    month = _current_month_prefix()
-    nifty_opts = [d for d in data
-                  if str(d.get("exch_seg","")).upper()=="NFO"
-                  and "OPT" in str(d.get("instrumenttype","")).upper()
-                  and "NIFTY" in str(d.get("symbol","")).upper()]
-    month_nifty_opts = [d for d in nifty_opts if str(d.get("expiry","")).startswith(month)]
-    print(f"🧩 NIFTY options in file: {len(nifty_opts):,}")
-    print(f"🗓  NIFTY options for {month}: {len(month_nifty_opts):,}")
-    if month_nifty_opts[:3]:
+    print(f"🧩 NIFTY options in file: {sink.nifty_opts:,}")
+    print(f"🗓  NIFTY options for {month}: {sink.month_nifty_opts:,}")
+    if sink.month_examples:
         print("🔎 Examples (first 3):")
-        for r in month_nifty_opts[:3]:
+        for r in sink.month_examples:
             print("   ", r.get("symbol"), r.get("token"), r.get("expiry"), r.get("strike"))
     print("Done.")
 
@@ -1,10 +1,16 @@
 # service/api/app.py
 from __future__ import annotations
 
+import asyncio
+import csv
 import importlib
+import io
+import json
 import pathlib
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from datetime import date, datetime, timedelta
+from typing import Optional
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
@@ -12,10 +18,15 @@ from dotenv import load_dotenv
 # Scheduler hooks (cron + manual triggers)
 from service.engine.scheduler import (
     start_scheduler,
+    stop_scheduler,
     get_next_runs_ist,
     predict_and_buy_1528,
     squareoff_0921,
 )
+from service.engine import history, ledger, metrics, portfolios, reports, risk, selector, ticks
+from service.engine.instruments import IST
+from service.engine.transport import close_async_transport
+from service.engine.ratelimit import Priority, priority
 
 # -----------------------------------------------------------------------------
 # App, static, templates
@@ -50,6 +61,8 @@ def _resolve(*candidates):
 
 # <-- include 'funds_snapshot' here
 get_funds = _resolve("get_funds", "funds", "funds_status", "status", "funds_snapshot")
+# async variant (awaits quotes instead of blocking the event loop), when available
+aget_funds = getattr(_positions, "afunds_snapshot", None)
 
 # -----------------------------------------------------------------------------
 # Startup: start APScheduler (guard against double-start on --reload)
@@ -58,6 +71,19 @@ get_funds = _resolve("get_funds", "funds", "funds_status", "status", "funds_snap
 def _startup() -> None:
     if getattr(app.state, "scheduler_started", False):
         return
+    try:
+        # open position / balance survive restarts (e.g. between 15:28 and 09:21)
+        restore = getattr(_positions, "restore_state", None)
+        if restore:
+            print(f"[startup] restored state: {restore()}")
+        names = portfolios.load_config()
+        if names:
+            print(f"[startup] paper variants: {names}")
+    except Exception as e:
+        print(f"[startup] state restore failed: {e}")
+    # unpickle the direction model now rather than on the 15:28 trade path
+    if selector.load_model() is not None:
+        print(f"[startup] direction model loaded from {selector.MODEL_PATH}")
     try:
         start_scheduler(app=app)
         app.state.scheduler_started = True
@@ -65,6 +91,18 @@ def _startup() -> None:
         # Keep API alive even if scheduler wiring fails
         print(f"[startup] scheduler failed to start: {e}")
 
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    stop_scheduler()
+    ticks.stop_feed()
+    await close_async_transport()
+    reports.flush()
+    try:
+        ledger.snapshot()
+    except Exception as e:
+        print(f"[shutdown] ledger snapshot failed: {e}")
+    ledger.close()
+
 # -----------------------------------------------------------------------------
 # Routes
 # -----------------------------------------------------------------------------
@@ -77,13 +115,61 @@ def api_health():
     return {"ok": True}
 
 @app.get("/api/funds")
-def api_funds():
+async def api_funds():
     try:
-        data = get_funds()
+        # dashboard polling: lowest SmartAPI priority, served stale under pressure
+        with priority(Priority.UI):
+            data = await aget_funds() if aget_funds else await asyncio.to_thread(get_funds)
         return JSONResponse(data)
     except Exception as e:
         return JSONResponse({"error": f"failed to compute funds: {e}"}, status_code=500)
 
+@app.get("/api/risk")
+async def api_risk(
+    chain: bool = Query(False, description="also mark every strike of one expiry"),
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="chain month YYYY-MM (default nearest)"),
+):
+    """IV and Greeks of the open legs (net = per-leg x lots x lot size), optionally a whole NIFTY chain."""
+    try:
+        with priority(Priority.UI):
+            out = {"position": await _positions.arisk_snapshot()}
+            if chain:
+                out["chain"] = await risk.achain_risk(month_key=month)
+        return JSONResponse(out)
+    except Exception as e:
+        return JSONResponse({"error": f"failed to compute risk: {e}"}, status_code=500)
+
+def _instant(s: Optional[str]) -> Optional[float]:
+    """Epoch seconds, or an ISO datetime (IST when no offset is given) -> epoch seconds."""
+    if not s:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        dt = datetime.fromisoformat(s)
+        return (dt if dt.tzinfo else dt.replace(tzinfo=IST)).timestamp()
+
+@app.get("/api/mtm/history")
+def api_mtm_history(
+    start: Optional[str] = Query(None, alias="from", description="epoch seconds or ISO datetime (IST)"),
+    end: Optional[str] = Query(None, alias="to", description="epoch seconds or ISO datetime (IST), exclusive"),
+    points: int = Query(500, ge=4, le=5000, description="max samples returned (min/max-preserving)"),
+):
+    """Intraday MTM samples of the open (or last) position, downsampled to at most `points`."""
+    try:
+        lo, hi = _instant(start), _instant(end)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad time: {e}"}, status_code=400)
+    return history.get_history().query(lo, hi, points)
+
+@app.get("/api/portfolios")
+async def api_portfolios():
+    try:
+        with priority(Priority.UI):
+            return JSONResponse({"portfolios": await portfolios.afunds_all()})
+    except Exception as e:
+        return JSONResponse({"error": f"failed to compute portfolios: {e}"}, status_code=500)
+
 @app.post("/api/buy")
 async def api_buy():
     try:
@@ -100,6 +186,72 @@ async def api_sell():
     except Exception as e:
         return JSONResponse({"detail": str(e)}, status_code=400)
 
+TRADE_COLUMNS = ("id", "portfolio", "side") + ledger.TRADE_FIELDS
+
+def _day_bounds(start: Optional[str], end: Optional[str]):
+    """Inclusive YYYY-MM-DD dates -> [start, end) IST timestamp strings for the ledger."""
+    lo = date.fromisoformat(start).isoformat() if start else None
+    hi = (date.fromisoformat(end) + timedelta(days=1)).isoformat() if end else None
+    return lo, hi
+
+def _csv_lines(rows):
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=TRADE_COLUMNS, extrasaction="ignore")
+    w.writeheader()
+    for row in rows:
+        w.writerow(row)
+        if buf.tell() > 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def _ndjson_lines(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row))
+        if len(chunk) >= 500:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+@app.get("/api/trades")
+def api_trades(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = Query(None, description="next_cursor of the previous page"),
+    start: Optional[str] = Query(None, alias="from", description="YYYY-MM-DD (IST, inclusive)"),
+    end: Optional[str] = Query(None, alias="to", description="YYYY-MM-DD (IST, inclusive)"),
+    side: Optional[str] = Query(None, pattern="^(?i:up|down)$"),
+    portfolio: str = Query("default", description="portfolio name, or 'all'"),
+    format: str = Query("json", pattern="^(json|csv|ndjson)$"),
+):
+    """Trade history, newest first, paged by cursor; format=csv|ndjson streams every matching trade."""
+    try:
+        lo, hi = _day_bounds(start, end)
+    except ValueError as e:
+        return JSONResponse({"error": f"bad date: {e}"}, status_code=400)
+    pf = None if portfolio == "all" else portfolio
+
+    if format == "json":
+        rows = ledger.recent_trades(limit + 1, before_id=cursor, portfolio=pf, start_ist=lo, end_ist=hi, side=side)
+        page = rows[:limit]
+        return {"trades": page, "next_cursor": page[-1]["id"] if len(rows) > limit else None}
+
+    rows = ledger.iter_trades(portfolio=pf, start_ist=lo, end_ist=hi, side=side)
+    if format == "ndjson":
+        body = _ndjson_lines(rows)
+        media = "application/x-ndjson"
+    else:
+        body = _csv_lines(rows)
+        media = "text/csv"
+    return StreamingResponse(body, media_type=media,
+                             headers={"Content-Disposition": f'attachment; filename="trades.{format}"'})
+
+@app.get("/api/metrics")
+def api_metrics():
+    return metrics.snapshot()
+
 @app.get("/api/jobs")
 def api_jobs():
     try:
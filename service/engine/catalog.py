@@ -0,0 +1,191 @@
+# service/engine/catalog.py
+"""
+Persistent catalog of the CSV files under data/, so finding the OHLC input for
+predict() is a lookup instead of opening every CSV.
+"""
+from __future__ import annotations
+
+import csv
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from . import metrics
+from .utils import DATA_DIR, ROOT, _read_json, _write_json, _env_float
+
+log = logging.getLogger("service.catalog")
+
+
+CATALOG_FILE = ROOT / (os.getenv("OHLC_CATALOG_FILE") or "data/ohlc_catalog.json")
+CATALOG_FORMAT = "1"
+OHLC_COLUMNS = {"open", "high", "low", "close"}
+TIME_COLUMNS = ("datetime", "timestamp", "date", "time", "ts")
+_TAIL_BYTES = 64 * 1024
+
+
+# ---------- Sniffing ----------
+def _count_lines(f) -> int:
+    n, last = 0, b"\n"
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        n += chunk.count(b"\n")
+        last = chunk[-1:]
+    return n + (last != b"\n")   # final line without a newline
+
+
+def _last_line(f, size: int) -> str:
+    f.seek(max(0, size - _TAIL_BYTES))
+    lines = [ln for ln in f.read().splitlines() if ln.strip()]
+    return lines[-1].decode("utf-8", "replace") if lines else ""
+
+
+def _cell(line: str, i: int) -> Optional[str]:
+    try:
+        row = next(csv.reader([line]))
+        return row[i].strip() if i < len(row) else None
+    except (StopIteration, csv.Error):
+        return None
+
+
+def sniff(path: Path, size: int) -> Dict[str, Any]:
+    """Columns, OHLC flag, data rows and first/last time value of one CSV."""
+    with path.open("rb") as f:
+        header = f.readline().decode("utf-8-sig", "replace").strip()
+        first = f.readline().decode("utf-8", "replace").strip()
+        f.seek(0)
+        lines = _count_lines(f)
+        last = _last_line(f, size) if first else ""
+    columns = [c.strip() for c in next(csv.reader([header]))] if header else []
+    lower = [c.lower() for c in columns]
+    t = next((lower.index(c) for c in TIME_COLUMNS if c in lower), None)
+    return {
+        "columns": columns,
+        "ohlc": OHLC_COLUMNS.issubset(lower),
+        "rows": max(0, lines - 1),
+        "time_column": None if t is None else columns[t],
+        "start": None if t is None or not first else _cell(first, t),
+        "end": None if t is None or not last else _cell(last, t),
+    }
+
+
+# ---------- Catalog ----------
+class Catalog:
+    def __init__(self, root: Path = DATA_DIR, path: Path = CATALOG_FILE, ttl_s: Optional[float] = None):
+        self.root = root
+        self.path = path
+        self.ttl_s = _env_float("OHLC_CATALOG_TTL_S", 60.0) if ttl_s is None else ttl_s
+        self.files: Dict[str, Dict[str, Any]] = {}    # path relative to root -> entry
+        self._newest: Optional[str] = None             # newest OHLC entry, kept by refresh()
+        self._dirs: Dict[str, int] = {}                # directory -> mtime_ns at the last walk
+        self._loaded = False
+        self._walked = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        saved = _read_json(self.path, {})
+        if saved.get("format") == CATALOG_FORMAT:
+            self.files = dict(saved.get("files") or {})
+        self._loaded = True
+
+    def refresh(self) -> int:
+        """Stat-walk root, re-sniff changed CSVs, drop vanished ones; returns how many entries changed."""
+        with self._lock, metrics.timed("catalog.refresh_ms"):
+            if not self._loaded:
+                self._load()
+            seen, changed, dirs = set(), 0, {}
+            for dirpath, _, names in os.walk(self.root):
+                try:
+                    dirs[dirpath] = os.stat(dirpath).st_mtime_ns
+                except OSError:
+                    continue
+                for name in names:
+                    if not name.lower().endswith(".csv"):
+                        continue
+                    p = Path(dirpath) / name
+                    rel = p.relative_to(self.root).as_posix()
+                    try:
+                        st = p.stat()
+                    except OSError:
+                        continue
+                    seen.add(rel)
+                    old = self.files.get(rel)
+                    if old and (old.get("mtime_ns"), old.get("size")) == (st.st_mtime_ns, st.st_size):
+                        continue
+                    try:
+                        entry = sniff(p, st.st_size)
+                    except Exception as e:
+                        log.debug("catalog: cannot read %s: %s", p, e)
+                        entry = {"columns": [], "ohlc": False, "rows": 0, "time_column": None,
+                                 "start": None, "end": None, "error": str(e)}
+                    entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+                    self.files[rel] = entry
+                    changed += 1
+            gone = [rel for rel in self.files if rel not in seen]
+            for rel in gone:
+                del self.files[rel]
+            if changed or gone:
+                metrics.inc("catalog.sniffed", changed)
+                try:
+                    _write_json(self.path, {"format": CATALOG_FORMAT, "files": self.files})
+                    saved_in = str(self.path.parent)
+                    if saved_in in dirs:                # our own save is not a change to re-walk for
+                        dirs[saved_in] = os.stat(saved_in).st_mtime_ns
+                except Exception as e:
+                    log.warning("catalog save failed: %s", e)
+            ohlc = [(e["mtime_ns"], rel) for rel, e in self.files.items() if e.get("ohlc")]
+            self._newest = max(ohlc)[1] if ohlc else None
+            self._dirs = dirs
+            metrics.set_gauge("catalog.files", len(self.files))
+            self._walked = time.monotonic()
+            return changed + len(gone)
+
+    def _dirs_changed(self) -> bool:
+        """Whether a file was added, removed or renamed in a walked directory since the last walk."""
+        for d, mtime_ns in self._dirs.items():
+            try:
+                if os.stat(d).st_mtime_ns != mtime_ns:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _pick(self, candidates: Sequence[str]) -> Optional[str]:
+        # a handful of stats, so a candidate dropped in after the last walk wins right away
+        for name in candidates:
+            if (self.root / name).is_file():
+                return name
+        return self._newest
+
+    def find_ohlc(self, candidates: Sequence[str] = ()) -> Optional[Path]:
+        """Preferred OHLC CSV: first of `candidates` (names at the top of root), else the newest OHLC file."""
+        if not self._loaded or time.monotonic() - self._walked > self.ttl_s:
+            self.refresh()
+        elif self._dirs_changed():
+            metrics.inc("catalog.dir_changes")
+            self.refresh()
+        rel = self._pick(candidates)
+        if rel is not None and not (self.root / rel).exists():
+            metrics.inc("catalog.stale_picks")
+            self.refresh()
+            rel = self._pick(candidates)
+        else:
+            metrics.inc("catalog.lookups")
+        return None if rel is None else self.root / rel
+
+    def entries(self, ohlc_only: bool = False) -> List[Dict[str, Any]]:
+        return [{"path": rel, **e} for rel, e in sorted(self.files.items()) if e.get("ohlc") or not ohlc_only]
+
+
+_CATALOG: Optional[Catalog] = None
+_CATALOG_LOCK = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    global _CATALOG
+    if _CATALOG is None:
+        with _CATALOG_LOCK:
+            if _CATALOG is None:
+                _CATALOG = Catalog()
+    return _CATALOG
@@ -0,0 +1,121 @@
+# service/engine/history.py
+"""
+Intraday MTM history of the open position in a fixed-size NumPy ring buffer;
+query() downsamples a window with min/max buckets so spikes survive.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from . import metrics
+from .instruments import IST
+from .utils import _env_float
+
+
+FIELDS = ("spot", "ce", "pe", "mtm")
+IST_OFFSET_S = int(IST.utcoffset(None).total_seconds())
+
+
+def _f(x: Optional[float]) -> float:
+    return np.nan if x is None else float(x)
+
+
+class MtmHistory:
+    def __init__(self, size: Optional[int] = None, min_interval_s: Optional[float] = None):
+        self.size = max(2, int(size or _env_float("MTM_HISTORY_SIZE", 65536)))
+        self.min_interval_s = _env_float("MTM_HISTORY_MIN_S", 1.0) if min_interval_s is None else min_interval_s
+        self._ts = np.zeros(self.size)                                   # epoch seconds
+        self._cols = {k: np.full(self.size, np.nan) for k in FIELDS}
+        self._head = 0          # next slot to write
+        self._count = 0
+        self.position_id: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def reset(self, position_id: Optional[int] = None) -> None:
+        """Start a new history (a position was opened)."""
+        with self._lock:
+            self._head = self._count = 0
+            self.position_id = position_id
+
+    def record(self, spot: Optional[float], ce: Optional[float], pe: Optional[float], mtm: Optional[float],
+               ts: Optional[float] = None, force: bool = False) -> bool:
+        """Append a sample; False when it is within min_interval_s of the last one (unless force)."""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            if self._count:
+                last = self._ts[self._head - 1]
+                if not force and ts - last < self.min_interval_s:
+                    metrics.inc("mtm.history_skipped")
+                    return False
+                ts = max(ts, last)   # keep the ring sorted by time for searchsorted
+            i = self._head
+            self._ts[i] = ts
+            for k, v in zip(FIELDS, (spot, ce, pe, mtm)):
+                self._cols[k][i] = _f(v)
+            self._head = (i + 1) % self.size
+            self._count = min(self._count + 1, self.size)
+        metrics.set_gauge("mtm.history_samples", self._count)
+        return True
+
+    def _ordered(self, start: float, end: float) -> Dict[str, np.ndarray]:
+        """Samples with start <= ts < end, oldest first (copies, taken under the lock)."""
+        with self._lock:
+            n, h = self._count, self._head
+            order = np.arange(h - n, h) % self.size    # ring slots, oldest -> newest
+            ts = self._ts[order]
+            lo, hi = np.searchsorted(ts, start, "left"), np.searchsorted(ts, end, "left")
+            sel = order[lo:hi]
+            out = {k: v[sel] for k, v in self._cols.items()}
+        out["ts"] = ts[lo:hi]
+        return out
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              points: int = 500) -> Dict[str, Any]:
+        with metrics.timed("mtm.history_query_ms"):
+            s = self._ordered(-np.inf if start is None else start, np.inf if end is None else end)
+            n = len(s["ts"])
+            keep = _minmax_indices(s["mtm"], points) if n > points else np.arange(n)
+            ts = s["ts"][keep]
+            ist = (ts.astype(np.int64) + IST_OFFSET_S).astype("datetime64[s]")
+            # np.char.replace cannot size its output for an empty window (just reset, or no samples in range)
+            ts_ist = np.char.replace(np.datetime_as_string(ist), "T", " ").tolist() if len(ist) else []
+            ts = np.round(ts, 3).tolist()
+            cols = {k: np.round(s[k][keep], 2).tolist() for k in FIELDS}
+        samples: List[Dict[str, Any]] = []
+        for i, t in enumerate(ts):
+            row = {"ts": t, "ts_ist": ts_ist[i]}
+            for k in FIELDS:
+                v = cols[k][i]
+                row[k] = None if v != v else v   # NaN -> null
+            samples.append(row)
+        return {"position_id": self.position_id, "count": n, "samples": samples}
+
+
+def _minmax_indices(values: np.ndarray, points: int) -> np.ndarray:
+    """Indices of each bucket's min and max (points // 2 equal-count buckets) plus both ends, in time order."""
+    n = len(values)
+    k = -(-n // max(1, (points - 2) // 2))         # bucket width (ceil); 2 slots for the ends
+    buckets = -(-n // k)
+    pad = buckets * k - n
+    lo = np.concatenate((np.where(np.isnan(values), np.inf, values), np.full(pad, np.inf))).reshape(buckets, k)
+    hi = np.concatenate((np.where(np.isnan(values), -np.inf, values), np.full(pad, -np.inf))).reshape(buckets, k)
+    base = np.arange(buckets) * k
+    idx = np.concatenate(([0, n - 1], base + lo.argmin(axis=1), base + hi.argmax(axis=1)))
+    return np.unique(idx[idx < n])
+
+
+_HISTORY: Optional[MtmHistory] = None
+_HISTORY_LOCK = threading.Lock()
+
+
+def get_history() -> MtmHistory:
+    global _HISTORY
+    if _HISTORY is None:
+        with _HISTORY_LOCK:
+            if _HISTORY is None:
+                _HISTORY = MtmHistory()
+    return _HISTORY
@@ -10,13 +10,33 @@ Download once (or refresh anytime):
 
 from __future__ import annotations
 
+import hashlib
 import json
+import logging
 import os
 import re
+import threading
+from bisect import bisect_left
 from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Optional: columnar on-disk cache of the parsed scrip master
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.ipc as pa_ipc  # type: ignore
+except Exception:  # pragma: no cover
+    pa = None  # graceful fallback: parse JSON every time
+    pa_ipc = None
+
+from . import metrics, ticks
+from .session import get_session
+
+log = logging.getLogger("service.instruments")
 
 # ---------- Time / Paths ----------
 IST = timezone(timedelta(hours=5, minutes=30))
@@ -33,10 +53,276 @@ class Instrument:
     instrumenttype: str     # "OPTIDX" / "FUTIDX" / "AMXIDX" / "" ...
     expiry_raw: Optional[str]   # raw expiry string
     expiry_dt: Optional[datetime]  # parsed expiry date (UTC-naive)
-    strike: Optional[int]
+    strike: Optional[int]   # index points (the dump's x100 value already scaled)
     lotsize: Optional[int]
     optiontype: Optional[str]  # "CE"/"PE" when detectable
 
+# ---------- Columnar table ----------
+_NA_INT = int(np.iinfo(np.int32).min)   # missing strike / lotsize
+_NAT_D = np.datetime64("NaT", "D")
+_NAT_M = np.datetime64("NaT", "M")
+
+
+class InstrumentTable:
+    """
+    Struct-of-arrays scrip master. Exchange and instrument type are integer codes
+    into small vocabularies, option type is 0/1/2 for ""/CE/PE, strikes (index
+    points) and lot sizes are int32 (_NA_INT when missing) and expiries
+    datetime64[D] (NaT when unknown). `month` (expiry month, falling back to the
+    symbol text) and `core_nifty` are derived once at build time so pool filters
+    are plain masks.
+
+    Iterating, or indexing with an int, yields InstrumentRow views that expose the
+    same attributes as Instrument; indexing with a mask/array gives a sub-table.
+    """
+
+    OPTION_TYPES = ("", "CE", "PE")
+    _ARRAYS = (
+        "exchange_code", "token", "tradingsymbol", "name", "itype_code", "expiry_raw",
+        "expiry", "strike", "lotsize", "opt_code", "month", "core_nifty",
+    )
+
+    __slots__ = ("exchanges", "itypes") + _ARRAYS
+
+    def __init__(self, exchanges: Tuple[str, ...], itypes: Tuple[str, ...], **arrays: np.ndarray):
+        self.exchanges = tuple(exchanges)
+        self.itypes = tuple(itypes)
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+
+    # ----- construction -----
+    @classmethod
+    def from_rows(cls, rows: Iterable[Any]) -> "InstrumentTable":
+        rows = list(rows)
+        exchanges: Dict[str, int] = {}
+        itypes: Dict[str, int] = {}
+        cols: Dict[str, list] = {name: [] for name in cls._ARRAYS}
+        for i in rows:
+            ts = _ts_of(i)
+            itype = getattr(i, "instrumenttype", "") or ""
+            exp = getattr(i, "expiry_dt", None)
+            opt = getattr(i, "optiontype", None) or _infer_option_type(ts, itype)
+            mk = _month_key(exp) or _month_key_from_symbol_text(ts.upper())
+            cols["exchange_code"].append(exchanges.setdefault(getattr(i, "exchange", "") or "", len(exchanges)))
+            cols["token"].append(getattr(i, "token", "") or "")
+            cols["tradingsymbol"].append(getattr(i, "tradingsymbol", "") or "")
+            cols["name"].append(getattr(i, "name", "") or "")
+            cols["itype_code"].append(itypes.setdefault(itype, len(itypes)))
+            cols["expiry_raw"].append(getattr(i, "expiry_raw", None))
+            cols["expiry"].append(np.datetime64(exp.date(), "D") if exp is not None else _NAT_D)
+            cols["strike"].append(_NA_INT if getattr(i, "strike", None) is None else int(i.strike))
+            cols["lotsize"].append(_NA_INT if getattr(i, "lotsize", None) is None else int(i.lotsize))
+            cols["opt_code"].append(cls.OPTION_TYPES.index(opt) if opt in ("CE", "PE") else 0)
+            cols["month"].append(np.datetime64(mk, "M") if mk else _NAT_M)
+            cols["core_nifty"].append(_is_core_nifty(i))
+        return cls(
+            tuple(exchanges), tuple(itypes),
+            exchange_code=np.array(cols["exchange_code"], dtype=np.int8),
+            token=np.array(cols["token"], dtype=object),
+            tradingsymbol=np.array(cols["tradingsymbol"], dtype=object),
+            name=np.array(cols["name"], dtype=object),
+            itype_code=np.array(cols["itype_code"], dtype=np.int16),
+            expiry_raw=np.array(cols["expiry_raw"], dtype=object),
+            expiry=np.array(cols["expiry"], dtype="datetime64[D]"),
+            strike=np.array(cols["strike"], dtype=np.int32),
+            lotsize=np.array(cols["lotsize"], dtype=np.int32),
+            opt_code=np.array(cols["opt_code"], dtype=np.int8),
+            month=np.array(cols["month"], dtype="datetime64[M]"),
+            core_nifty=np.array(cols["core_nifty"], dtype=bool),
+        )
+
+    def take(self, idx: Any) -> "InstrumentTable":
+        return InstrumentTable(self.exchanges, self.itypes, **{n: getattr(self, n)[idx] for n in self._ARRAYS})
+
+    def concat(self, other: "InstrumentTable") -> "InstrumentTable":
+        """Rows of self followed by rows of other, re-coding other's vocabularies onto ours."""
+        exchanges, itypes = list(self.exchanges), list(self.itypes)
+
+        def recode(vocab: List[str], theirs: Tuple[str, ...], codes: np.ndarray) -> np.ndarray:
+            lut = []
+            for v in theirs:
+                if v not in vocab:
+                    vocab.append(v)
+                lut.append(vocab.index(v))
+            return np.asarray(lut, dtype=codes.dtype)[codes] if len(codes) else codes
+
+        arrays = {n: np.concatenate((getattr(self, n), getattr(other, n))) for n in self._ARRAYS}
+        arrays["exchange_code"] = np.concatenate(
+            (self.exchange_code, recode(exchanges, other.exchanges, other.exchange_code)))
+        arrays["itype_code"] = np.concatenate(
+            (self.itype_code, recode(itypes, other.itypes, other.itype_code)))
+        return InstrumentTable(tuple(exchanges), tuple(itypes), **arrays)
+
+    # ----- sequence protocol -----
+    def __len__(self) -> int:
+        return len(self.token)
+
+    def __iter__(self) -> Iterator["InstrumentRow"]:
+        return (InstrumentRow(self, n) for n in range(len(self)))
+
+    def __getitem__(self, key: Any) -> Any:
+        if isinstance(key, (int, np.integer)):
+            n = int(key)
+            if n < 0:
+                n += len(self)
+            if not 0 <= n < len(self):
+                raise IndexError(key)
+            return InstrumentRow(self, n)
+        return self.take(key)
+
+    def row(self, n: int) -> "InstrumentRow":
+        return InstrumentRow(self, int(n))
+
+    # ----- vectorized filters -----
+    def exchange_is(self, exchange: str) -> np.ndarray:
+        codes = [c for c, e in enumerate(self.exchanges) if e.upper() == exchange.upper()]
+        return np.isin(self.exchange_code, codes)
+
+    def itype_where(self, pred: Callable[[str], bool]) -> np.ndarray:
+        codes = [c for c, it in enumerate(self.itypes) if pred(it.upper())]
+        return np.isin(self.itype_code, codes)
+
+    def month_is(self, month_key: Optional[str]) -> np.ndarray:
+        """Rows whose month is `month_key` ("YYYY-MM"); None selects rows with no known month."""
+        if month_key is None:
+            return np.isnat(self.month)
+        try:
+            return self.month == np.datetime64(month_key, "M")
+        except ValueError:
+            return np.zeros(len(self), dtype=bool)
+
+    def strikes(self, idx: Any = None) -> np.ndarray:
+        """
+        int64 strikes in points (of rows `idx`, default all) with the trailing-digits
+        symbol fallback applied; _NA_INT where still unknown.
+        """
+        pos = np.arange(len(self)) if idx is None else np.asarray(idx, dtype=np.int64)
+        out = self.strike[pos].astype(np.int64)
+        for n in np.flatnonzero(out == _NA_INT):
+            m = _RX_TRAILING_STRIKE.search(self.tradingsymbol[pos[n]] or "")
+            if m:
+                out[n] = int(m.group(1))
+        return out
+
+    # ----- persistence -----
+    def to_arrow(self) -> "pa.Table":
+        return pa.table({
+            "exchange_code": self.exchange_code,
+            "token": pa.array(self.token, type=pa.string()),
+            "tradingsymbol": pa.array(self.tradingsymbol, type=pa.string()),
+            "name": pa.array(self.name, type=pa.string()),
+            "itype_code": self.itype_code,
+            "expiry_raw": pa.array(self.expiry_raw, type=pa.string()),
+            "expiry": self.expiry.view(np.int64),        # NaT kept as its int64 sentinel
+            "strike": self.strike,
+            "lotsize": self.lotsize,
+            "opt_code": self.opt_code,
+            "month": self.month.view(np.int64),
+            "core_nifty": self.core_nifty,
+        }).replace_schema_metadata({
+            "exchanges": json.dumps(self.exchanges),
+            "itypes": json.dumps(self.itypes),
+        })
+
+    @classmethod
+    def from_arrow(cls, table: "pa.Table") -> "InstrumentTable":
+        meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+
+        def col(name: str) -> np.ndarray:
+            return table.column(name).combine_chunks().to_numpy(zero_copy_only=False)
+
+        return cls(
+            tuple(json.loads(meta["exchanges"])), tuple(json.loads(meta["itypes"])),
+            exchange_code=col("exchange_code"),
+            token=col("token"),
+            tradingsymbol=col("tradingsymbol"),
+            name=col("name"),
+            itype_code=col("itype_code"),
+            expiry_raw=col("expiry_raw"),
+            expiry=col("expiry").view("datetime64[D]"),
+            strike=col("strike"),
+            lotsize=col("lotsize"),
+            opt_code=col("opt_code"),
+            month=col("month").view("datetime64[M]"),
+            core_nifty=col("core_nifty"),
+        )
+
+
+class InstrumentRow:
+    """Read-only view of one InstrumentTable row; duck-types as Instrument."""
+
+    __slots__ = ("_t", "_i")
+
+    def __init__(self, table: InstrumentTable, index: int):
+        self._t = table
+        self._i = index
+
+    @property
+    def exchange(self) -> str:
+        return self._t.exchanges[self._t.exchange_code[self._i]]
+
+    @property
+    def token(self) -> str:
+        return self._t.token[self._i]
+
+    @property
+    def tradingsymbol(self) -> str:
+        return self._t.tradingsymbol[self._i]
+
+    @property
+    def name(self) -> str:
+        return self._t.name[self._i]
+
+    @property
+    def instrumenttype(self) -> str:
+        return self._t.itypes[self._t.itype_code[self._i]]
+
+    @property
+    def expiry_raw(self) -> Optional[str]:
+        return self._t.expiry_raw[self._i]
+
+    @property
+    def expiry_dt(self) -> Optional[datetime]:
+        d = self._t.expiry[self._i]
+        if np.isnat(d):
+            return None
+        return datetime.combine(d.astype(object), datetime.min.time())
+
+    @property
+    def strike(self) -> Optional[int]:
+        s = int(self._t.strike[self._i])
+        return None if s == _NA_INT else s
+
+    @property
+    def lotsize(self) -> Optional[int]:
+        s = int(self._t.lotsize[self._i])
+        return None if s == _NA_INT else s
+
+    @property
+    def optiontype(self) -> Optional[str]:
+        return self._t.OPTION_TYPES[self._t.opt_code[self._i]] or None
+
+    def to_instrument(self) -> Instrument:
+        return Instrument(
+            exchange=self.exchange, token=self.token, tradingsymbol=self.tradingsymbol,
+            name=self.name, instrumenttype=self.instrumenttype, expiry_raw=self.expiry_raw,
+            expiry_dt=self.expiry_dt, strike=self.strike, lotsize=self.lotsize,
+            optiontype=self.optiontype,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, InstrumentRow) and other._t is self._t and other._i == self._i
+
+    def __hash__(self) -> int:
+        return hash((id(self._t), self._i))
+
+    def __repr__(self) -> str:
+        return f"InstrumentRow({self.exchange}:{self.tradingsymbol} token={self.token})"
+
+
+def _as_table(instruments: Iterable[Any]) -> InstrumentTable:
+    return instruments if isinstance(instruments, InstrumentTable) else InstrumentTable.from_rows(instruments)
+
 # ---------- Helpers ----------
 _RE_MON = {
     "JAN": 1, "FEB": 2, "MAR": 3, "APR": 4, "MAY": 5, "JUN": 6,
@@ -56,6 +342,14 @@ def _parse_int(x: object) -> Optional[int]:
     except Exception:
         return None
 
+# Angel lists strikes x100 ("2535000.000000" is 25350); non-options carry -1.
+STRIKE_SCALE = 100
+
+
+def _strike_points(x: object) -> Optional[int]:
+    f = _parse_float(x)
+    return int(round(f / STRIKE_SCALE)) if f is not None and f > 0 else None
+
 def _strip(s: object) -> str:
     return f"{s}".strip() if s is not None else ""
 
@@ -68,21 +362,41 @@ def _infer_option_type(ts: str, itype: str = ""):
     if "PUT" in IT:  return "PE"
     return None
 
+# Common formats seen in dumps, in the order they are tried
+_EXPIRY_FMTS = (
+    "%d%b%Y",                 # 25SEP2025 (Angel scrip master)
+    "%Y-%m-%d",
+    "%d-%b-%Y", "%d %b %Y",   # 25-Sep-2025 / 25 Sep 2025
+    "%d-%B-%Y", "%d %B %Y",   # 25-September-2025
+    "%d/%m/%Y", "%m/%d/%Y",
+)
+
+# Shape -> candidate formats, so each distinct string goes straight to the format(s) it can be
+_EXPIRY_SHAPES = (
+    (re.compile(r"\d{1,2}[A-Za-z]{3}\d{4}"), ("%d%b%Y",)),
+    (re.compile(r"\d{4}-\d{1,2}-\d{1,2}"), ("%Y-%m-%d",)),
+    (re.compile(r"\d{1,2}-[A-Za-z]{3}-\d{4}"), ("%d-%b-%Y",)),
+    (re.compile(r"\d{1,2} [A-Za-z]{3} \d{4}"), ("%d %b %Y",)),
+    (re.compile(r"\d{1,2}-[A-Za-z]{4,}-\d{4}"), ("%d-%B-%Y",)),
+    (re.compile(r"\d{1,2} [A-Za-z]{4,} \d{4}"), ("%d %B %Y",)),
+    (re.compile(r"\d{1,2}/\d{1,2}/\d{4}"), ("%d/%m/%Y", "%m/%d/%Y")),
+)
+
+@lru_cache(maxsize=4096)
 def _try_parse_expiry(s: str) -> Optional[datetime]:
+    """Parse a raw expiry string. Only a few hundred distinct values exist per dump, so results are memoized."""
     s = s.strip()
     if not s:
         return None
-    # Common formats seen in dumps
-    fmts = [
-        "%Y-%m-%d",
-        "%d-%b-%Y", "%d %b %Y",   # 25-Sep-2025 / 25 Sep 2025
-        "%d-%B-%Y", "%d %B %Y",   # 25-September-2025
-        "%d/%m/%Y", "%m/%d/%Y",
-    ]
+    fmts = _EXPIRY_FMTS
+    for pat, cands in _EXPIRY_SHAPES:
+        if pat.fullmatch(s):
+            fmts = cands
+            break
     for f in fmts:
         try:
             return datetime.strptime(s, f)
-        except Exception:
+        except ValueError:
             pass
     return None
 
@@ -97,23 +411,31 @@ def _ts_of(i):
     return " ".join([p for p in parts if p]).strip().upper()
 
 
+# --- precompiled symbol patterns ---
+_MON_ALT = "JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC"
+_RX_NIFTY_YY_MON = re.compile(rf"NIFTY(?P<yy>\d{{2}})(?P<mon>{_MON_ALT})")
+_RX_NIFTY_MON_YY = re.compile(rf"NIFTY(?P<mon>{_MON_ALT})(?P<yy>\d{{2}})")
+_RX_DD_MON_YR_WORD = re.compile(rf"\b\d{{1,2}}\s*-?(?P<mon>{_MON_ALT})\s*-?(?P<yr>\d{{2,4}})\b")
+_RX_DD_MON_YY = re.compile(rf"(?P<day>\d{{1,2}})\s*-?(?P<mon>{_MON_ALT})\s*-?(?P<yy>\d{{2,4}})")
+_RX_TRAILING_STRIKE = re.compile(r"(\d{4,6})(?:CE|PE)?\s*$")
+
 # --- map month from text inside the symbol ---
 def _month_key_from_symbol_text(ts: str):
     """Derive YYYY-MM from popular Angel symbol formats."""
     TS = ts.upper()
 
     # NIFTY<YY><MON>...
-    m = re.search(r"NIFTY(?P<yy>\d{2})(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)", TS)
+    m = _RX_NIFTY_YY_MON.search(TS)
     if m:
         return f"{2000 + int(m.group('yy')):04d}-{_RE_MON[m.group('mon')]:02d}"
 
     # NIFTY<MON><YY>...
-    m = re.search(r"NIFTY(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)(?P<yy>\d{2})", TS)
+    m = _RX_NIFTY_MON_YY.search(TS)
     if m:
         return f"{2000 + int(m.group('yy')):04d}-{_RE_MON[m.group('mon')]:02d}"
 
     # DD[- ]?MON[- ]?YYYY anywhere
-    m = re.search(r"\b\d{1,2}\s*-?(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)\s*-?(?P<yr>\d{2,4})\b", TS)
+    m = _RX_DD_MON_YR_WORD.search(TS)
     if m:
         yr = int(m.group("yr"))
         if yr < 100:
@@ -133,7 +455,7 @@ def _expiry_from_symbol(ts: str) -> Optional[datetime]:
     TS = ts.upper()
 
     # Pattern A: NIFTY25SEP...  (YY + MON, monthly)
-    m = re.search(r"NIFTY(?P<yy>\d{2})(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)", TS)
+    m = _RX_NIFTY_YY_MON.search(TS)
     if m:
         yy = int(m.group("yy"))
         mon = _RE_MON[m.group("mon")]
@@ -145,10 +467,7 @@ def _expiry_from_symbol(ts: str) -> Optional[datetime]:
             return None
 
     # Pattern B: DD-MON-YYYY or DD MON YYYY (with or without separators)
-    m = re.search(
-        r"(?P<day>\d{1,2})\s*-?(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)\s*-?(?P<yy>\d{2,4})",
-        TS
-    )
+    m = _RX_DD_MON_YY.search(TS)
     if m:
         day = int(m.group("day"))
         mon = _RE_MON[m.group("mon")]
@@ -171,42 +490,297 @@ def _parse_expiry_any(expiry_raw: Optional[str], tradingsymbol: str) -> Optional
         dt = _expiry_from_symbol(tradingsymbol)
     return dt
 
+# ---------- Streaming scrip master ----------
+# The master is one big JSON array of flat objects. Decoding it object by object
+# lets us drop equities/other segments as we go instead of materialising ~100k
+# dicts first.
+_STREAM_CHUNK = 1 << 16
+
+
+def iter_scrip_master(fp: IO[str], keep: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """Yield rows of a JSON-array scrip master from a text stream, optionally filtered by `keep`."""
+    dec = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # skip whitespace / separators, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            chunk = fp.read(_STREAM_CHUNK)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+
+        if pos >= len(buf):
+            if started:
+                raise ValueError("scrip master truncated: missing closing ']'")
+            return
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("scrip master is not a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+
+        try:
+            row, end = dec.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = fp.read(_STREAM_CHUNK)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+            continue
+        pos = end
+        if keep is None or keep(row):
+            yield row
+
+
+# NSE instrument types the spot probe accepts (plus untyped NIFTY rows); is_index_row keeps all of them.
+_NSE_INDEX_ITYPES = ("INDEX", "AMXIDX", "FUTIDX")
+
+
+def is_index_row(row: Dict[str, Any]) -> bool:
+    """NFO index derivatives and NSE index rows: everything the pickers and spot probe read."""
+    exch = _strip(row.get("exch_seg")).upper()
+    itype = _strip(row.get("instrumenttype")).upper()
+    if exch == "NFO":
+        return itype in ("OPTIDX", "FUTIDX")
+    if exch == "NSE":
+        if itype in _NSE_INDEX_ITYPES:
+            return True
+        sym = _strip(row.get("symbol")).upper()
+        nm = _strip(row.get("name")).upper()
+        return itype == "" and ("NIFTY" in sym or "NIFTY" in nm) and not sym.endswith("-EQ")
+    return False
+
+
 # ---------- Load instruments ----------
-def load_instruments() -> List[Instrument]:
+def _instrument_from_row(row: Dict[str, Any]) -> Instrument:
+    exchange = _strip(row.get("exch_seg"))
+    token = _strip(row.get("token"))
+    tradingsymbol = _strip(row.get("symbol"))
+    name = _strip(row.get("name"))
+    instrumenttype = _strip(row.get("instrumenttype"))
+    expiry_raw = _strip(row.get("expiry")) or None
+    strike = _strike_points(row.get("strike"))
+    lotsize = _parse_int(row.get("lotsize"))
+    opt = _infer_option_type(tradingsymbol, instrumenttype)
+    expiry_dt = _parse_expiry_any(expiry_raw, tradingsymbol)
+
+    return Instrument(
+        exchange=exchange,
+        token=token,
+        tradingsymbol=tradingsymbol,
+        name=name,
+        instrumenttype=instrumenttype,
+        expiry_raw=expiry_raw,
+        expiry_dt=expiry_dt,
+        strike=strike,
+        lotsize=lotsize,
+        optiontype=opt,
+    )
+
+def _parse_instruments_json(path: Path) -> List[Instrument]:
+    with path.open(encoding="utf-8") as f:
+        return [_instrument_from_row(row) for row in iter_scrip_master(f, keep=is_index_row)]
+
+# ---------- Compiled cache ----------
+# The parsed scrip master is written once to an Arrow IPC file next to the JSON
+# and memory-mapped on later loads. The source file's mtime/size/sha256 are kept
+# in the schema metadata; a touched-but-identical JSON (same hash) is still a hit.
+_CACHE_FORMAT = "6"
+_CACHE_LOCK = threading.Lock()
+_MEMO: Dict[str, Any] = {"key": None, "version": None, "rows": None, "chains": None}
+_VERSION: Dict[str, Any] = {"key": None, "version": None}   # instruments_version() memo
+
+
+def _cache_path() -> Path:
+    return INSTR_JSON.with_suffix(".arrow")
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat_key(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _write_cache(table: InstrumentTable, key: Tuple[int, int], sha: str) -> None:
+    tbl = table.to_arrow()
+    tbl = tbl.replace_schema_metadata({
+        **{k.decode(): v.decode() for k, v in (tbl.schema.metadata or {}).items()},
+        "format": _CACHE_FORMAT,
+        "mtime_ns": str(key[0]),
+        "size": str(key[1]),
+        "sha256": sha,
+    })
+    dest = _cache_path()
+    tmp = dest.with_suffix(".arrow.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa_ipc.new_file(sink, tbl.schema) as writer:
+            writer.write_table(tbl)
+    tmp.replace(dest)
+
+
+def _read_cache_meta(path: Path) -> Optional[Dict[str, str]]:
+    try:
+        with pa.memory_map(str(path), "r") as src:
+            meta = pa_ipc.open_file(src).schema.metadata or {}
+        return {k.decode(): v.decode() for k, v in meta.items()}
+    except Exception:
+        return None
+
+
+def _read_cache(path: Path) -> InstrumentTable:
+    # Left open on purpose: numeric columns are zero-copy views into the mapping.
+    src = pa.memory_map(str(path), "r")
+    return InstrumentTable.from_arrow(pa_ipc.open_file(src).read_all())
+
+
+def _delta_path() -> Path:
+    return INSTR_JSON.with_suffix(".delta.json")
+
+
+def _patch_from_delta(cache: Path, from_sha: str, to_sha: str) -> Optional[InstrumentTable]:
+    """
+    Apply the token diff written by scripts/update_instruments.py to the cached
+    table instead of reparsing the whole file. Only used when the delta was taken
+    exactly between the cached snapshot and the current file.
+    """
+    path = _delta_path()
+    if not path.exists():
+        return None
+    try:
+        delta = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if delta.get("from_sha256") != from_sha or delta.get("to_sha256") != to_sha:
+        return None
+
+    base = _read_cache(cache)
+    upserts = [r for r in (delta.get("changed") or []) + (delta.get("added") or []) if is_index_row(r)]
+    drop = {str(t) for t in delta.get("removed") or []} | {_strip(r.get("token")) for r in upserts}
+    keep = ~np.isin(base.token, list(drop)) if drop else np.ones(len(base), dtype=bool)
+    patched = base.take(keep)
+    if upserts:
+        patched = patched.concat(InstrumentTable.from_rows(_instrument_from_row(r) for r in upserts))
+        # changed rows go back to the slot they had in the snapshot; new tokens stay at the end
+        where = {tok: n for n, tok in enumerate(base.token[~keep].tolist())}
+        slots = np.flatnonzero(~keep)
+        at = np.concatenate((
+            np.flatnonzero(keep),
+            [slots[where[_strip(r.get("token"))]] if _strip(r.get("token")) in where else len(base) + n
+             for n, r in enumerate(upserts)],
+        ))
+        patched = patched.take(np.argsort(at, kind="stable"))
+    log.info("instrument cache patched from delta: -%d +%d", int((~keep).sum()), len(upserts))
+    return patched
+
+
+def _cache_is_valid(meta: Optional[Dict[str, str]], key: Tuple[int, int], sha: Optional[str]) -> bool:
+    if not meta or meta.get("format") != _CACHE_FORMAT:
+        return False
+    if (meta.get("mtime_ns"), meta.get("size")) == (str(key[0]), str(key[1])):
+        return True
+    return sha is not None and meta.get("sha256") == sha
+
+
+def instruments_version() -> Optional[str]:
+    """
+    Short content hash of the current instruments file (None if missing).
+    Memoized per (mtime_ns, size), so callers on the request path pay one stat();
+    the cache metadata is read, or the file hashed, only once per file change.
+    """
+    try:
+        key = _stat_key(INSTR_JSON)
+    except FileNotFoundError:
+        return None
+    if _VERSION["key"] == key:
+        return _VERSION["version"]
+    if _MEMO["key"] == key and _MEMO["version"]:
+        version = _MEMO["version"]
+    else:
+        meta = _read_cache_meta(_cache_path()) if pa is not None else None
+        version = (meta["sha256"] if meta and _cache_is_valid(meta, key, None) else _file_sha256(INSTR_JSON))[:16]
+    _VERSION.update(key=key, version=version)
+    return version
+
+
+def load_instruments() -> InstrumentTable:
+    """
+    Parsed Angel scrip master as an InstrumentTable. Cold loads parse the JSON and
+    build the Arrow cache; warm loads memory-map the cache, and repeat calls within
+    the process return the in-memory table while the file is unchanged.
+    """
     if not INSTR_JSON.exists():
         raise FileNotFoundError(f"Angel instruments file missing at {INSTR_JSON}")
 
-    with INSTR_JSON.open(encoding="utf-8") as f:
-        raw = json.load(f)
-
-    out: List[Instrument] = []
-    for row in raw:
-        exchange = _strip(row.get("exch_seg"))
-        token = _strip(row.get("token"))
-        tradingsymbol = _strip(row.get("symbol"))
-        name = _strip(row.get("name"))
-        instrumenttype = _strip(row.get("instrumenttype"))
-        expiry_raw = _strip(row.get("expiry")) or None
-        strike = _parse_int(row.get("strike"))
-        lotsize = _parse_int(row.get("lotsize"))
-        opt = _infer_option_type(tradingsymbol, instrumenttype)
-        expiry_dt = _parse_expiry_any(expiry_raw, tradingsymbol)
-
-        out.append(
-            Instrument(
-                exchange=exchange,
-                token=token,
-                tradingsymbol=tradingsymbol,
-                name=name,
-                instrumenttype=instrumenttype,
-                expiry_raw=expiry_raw,
-                expiry_dt=expiry_dt,
-                strike=strike,
-                lotsize=lotsize,
-                optiontype=opt,
-            )
-        )
-    return out
+    with _CACHE_LOCK:
+        key = _stat_key(INSTR_JSON)
+        if _MEMO["key"] == key and _MEMO["rows"] is not None:
+            return _MEMO["rows"]
+
+        if pa is None:
+            rows = InstrumentTable.from_rows(_parse_instruments_json(INSTR_JSON))
+            _MEMO.update(key=key, version=None, rows=rows)
+            return rows
+
+        cache = _cache_path()
+        meta = _read_cache_meta(cache) if cache.exists() else None
+        sha: Optional[str] = None
+        if meta and not _cache_is_valid(meta, key, None):
+            sha = _file_sha256(INSTR_JSON)  # mtime/size moved; content may not have
+
+        rows: Optional[InstrumentTable] = None
+        if _cache_is_valid(meta, key, sha):
+            try:
+                rows = _read_cache(cache)
+                sha = meta["sha256"]
+            except Exception as e:
+                log.warning("instrument cache unreadable (%s); rebuilding", e)
+                rows = None
+            if rows is not None and (meta.get("mtime_ns"), meta.get("size")) != (str(key[0]), str(key[1])):
+                # touched but identical: store the new stat key so later cold loads skip the hash
+                try:
+                    _write_cache(rows, key, sha)
+                except Exception as e:
+                    log.warning("failed to refresh instrument cache key %s: %s", cache, e)
+        elif meta and meta.get("format") == _CACHE_FORMAT and sha:
+            try:
+                rows = _patch_from_delta(cache, meta.get("sha256", ""), sha)
+            except Exception as e:
+                log.warning("instrument delta not applied (%s); rebuilding", e)
+                rows = None
+            if rows is not None:
+                try:
+                    _write_cache(rows, key, sha)
+                except Exception as e:
+                    log.warning("failed to write instrument cache %s: %s", cache, e)
+
+        if rows is None:
+            sha = sha or _file_sha256(INSTR_JSON)
+            rows = InstrumentTable.from_rows(_parse_instruments_json(INSTR_JSON))
+            try:
+                _write_cache(rows, key, sha)
+            except Exception as e:
+                log.warning("failed to write instrument cache %s: %s", cache, e)
+
+        _MEMO.update(key=key, version=sha[:16] if sha else None, rows=rows)
+        if sha:
+            _VERSION.update(key=key, version=sha[:16])
+        return rows
 
 # ---------- Expiry helpers ----------
 def _last_thursday_of_month(dt: datetime) -> datetime:
@@ -231,197 +805,347 @@ def _next_month(d: datetime) -> datetime:
     if m == 12: return datetime(y+1, 1, 1)
     return datetime(y, m+1, 1)
 
+_NON_CORE_NIFTY_TOKENS = (
+    "BANKNIFTY", "FINNIFTY", "MIDCP", "MIDCAP", "SML", "SMALL", "MICRO", "IT ",
+    "AUTO", "PHARMA", "PSU", "NXT", "NEXT", "NIFTYNXT", "NIFTY NEXT 50", "NIFTYNXT50",
+)
+
+def _is_core_nifty(i) -> bool:
+    """NIFTY 50 itself, not NEXT 50 / BANKNIFTY / sectoral indices starting with 'NIFTY'."""
+    ts = _ts_of(i).upper()
+    nm = (getattr(i, "name", "") or "").upper()
+    return (
+        nm.replace(" ", "") in {"NIFTY", "NIFTY50", "NIFTY-50", "NIFTY_50"}
+        or (ts.startswith("NIFTY") and all(tok not in ts for tok in _NON_CORE_NIFTY_TOKENS))
+    )
+
 def _nifty_monthly_pool(instruments, month_key: str):
     """
     NIFTY 50 index options monthly only (strict). Avoids NIFTY NEXT 50, BANKNIFTY, FINNIFTY,
     and sectoral indices that also start with 'NIFTY'.
     """
-    BAD_TOKENS = (
-        "BANKNIFTY", "FINNIFTY", "MIDCP", "MIDCAP", "SML", "SMALL", "MICRO", "IT ",
-        "AUTO", "PHARMA", "PSU", "NXT", "NEXT", "NIFTYNXT", "NIFTY NEXT 50", "NIFTYNXT50",
+    t = _as_table(instruments)
+    mask = (
+        t.exchange_is("NFO")
+        & t.itype_where(lambda it: "OPTIDX" in it)
+        & t.core_nifty
+        & t.month_is(month_key)
     )
-    pool = []
-    for i in instruments:
-        if (getattr(i, "exchange", "") or "").upper() != "NFO":
-            continue
-        itype = (getattr(i, "instrumenttype", "") or "").upper()
-        if "OPTIDX" not in itype:
-            continue
+    return t[mask]
 
-        ts = _ts_of(i).upper()
-        nm = (getattr(i, "name", "") or "").upper()
 
-        is_core_nifty = (
-            nm.replace(" ", "") in {"NIFTY", "NIFTY50", "NIFTY-50", "NIFTY_50"}
-            or (ts.startswith("NIFTY") and all(tok not in ts for tok in BAD_TOKENS))
-        )
-        if not is_core_nifty:
-            continue
+def _strike_of(i) -> int | None:
+    if getattr(i, "strike", None) is not None:
+        try:
+            return int(i.strike)
+        except Exception:
+            pass
+    m = _RX_TRAILING_STRIKE.search(_ts_of(i))
+    return int(m.group(1)) if m else None
 
-        mk = _month_key(getattr(i, "expiry_dt", None)) or _month_key_from_symbol_text(ts)
-        if mk != month_key:
-            continue
+def _token_rank(tokens: np.ndarray) -> np.ndarray:
+    """Rank of each token in numeric order (shorter digit strings first): the strike tie-breaker."""
+    tok = tokens.astype(str)
+    rank = np.empty(len(tok), dtype=np.int64)
+    rank[np.lexsort((tok, np.char.str_len(tok)))] = np.arange(len(tok))
+    return rank
+
+def _best_match_option_strict(pool: Iterable[Any], opt: str, strike: int) -> Optional[InstrumentRow]:
+    """Exact strike, else the nearest one of that CE/PE in `pool`; ties go to the lower token."""
+    # only accept within ±150 to avoid silly mismatches
+    return _index_for(pool).lookup(opt, strike, max_dist=150)
 
-        pool.append(i)
-    return pool
 
+# ---------- Option chain index ----------
+class _Chain:
+    """One (underlying, month, CE/PE) chain: table positions ordered by (strike, token)."""
 
+    __slots__ = ("table", "strikes", "ranks", "order")
 
-def _month_key_from_symbol(ts: str) -> Optional[str]:
+    def __init__(self, table: InstrumentTable, strikes: List[int], ranks: List[int], order: List[int]):
+        self.table = table
+        self.strikes = strikes
+        self.ranks = ranks
+        self.order = order
+
+    def rows(self) -> List[InstrumentRow]:
+        return [self.table.row(n) for n in self.order]
+
+    def nearest(self, strike: int) -> Optional[Tuple[int, int, int]]:
+        """(distance, token rank, table position) of the closest strike; ties go to the lower token."""
+        ks = self.strikes
+        if not ks:
+            return None
+        pos = bisect_left(ks, strike)
+        best = None
+        if pos < len(ks):
+            best = (ks[pos] - strike, self.ranks[pos], self.order[pos])
+        if pos > 0 and (best is None or best[0] > 0):
+            lo = bisect_left(ks, ks[pos - 1])  # lowest token carrying that strike
+            cand = (strike - ks[lo], self.ranks[lo], self.order[lo])
+            if best is None or cand < best:
+                best = cand
+        return best
+
+
+class OptionChainIndex:
     """
-    Return 'YYYY-MM' by reading the month/year from Angel tradingsymbols.
-    Handles all of these:
-      NIFTY25SEP25350CE      -> 2025-09
-      NIFTYSEP25 25350 CE    -> 2025-09
-      NIFTY 26-Sep-2025 CE   -> 2025-09
+    NFO option rows grouped by (underlying, month "YYYY-MM", "CE"/"PE") with sorted
+    strike lists, so exact and nearest-strike lookups are a bisect per chain.
+    Core NIFTY 50 contracts use the underlying "NIFTY"; everything else uses its name.
+    Rows sharing a strike are ordered by token rather than dump position, so a
+    table patched from a delta answers exactly like a full rebuild.
     """
-    TS = ts.upper()
 
-    # A) NIFTY<YY><MON>...
-    m = re.search(r"NIFTY(?P<yy>\d{2})(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)", TS)
-    if m:
-        yy = int(m.group("yy"))
-        mon = _RE_MON[m.group("mon")]
-        year = 2000 + yy
-        return f"{year:04d}-{mon:02d}"
+    def __init__(self, instruments: Iterable[Any]):
+        t = self.table = _as_table(instruments)
+        strikes = t.strikes()
+        sel = np.flatnonzero(
+            t.exchange_is("NFO")
+            & t.itype_where(lambda it: "OPT" in it)
+            & (t.opt_code > 0)
+            & (strikes != _NA_INT)
+        )
 
-    # B) NIFTY<MON><YY>...  (order reversed, also seen in dumps)
-    m = re.search(r"NIFTY(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)(?P<yy>\d{2})", TS)
-    if m:
-        yy = int(m.group("yy"))
-        mon = _RE_MON[m.group("mon")]
-        year = 2000 + yy
-        return f"{year:04d}-{mon:02d}"
+        und = _underlying_labels(t, sel)
+        und_vocab, und_code = np.unique(und, return_inverse=True)
+        opt = t.opt_code[sel]
+        month = t.month[sel].view(np.int64)
+        k = strikes[sel]
+        rank = _token_rank(t.token[sel])
+        srt = np.lexsort((rank, k, month, opt, und_code))
+        sel, k, rank, month, opt, und_code = sel[srt], k[srt], rank[srt], month[srt], opt[srt], und_code[srt]
+
+        # chain boundaries: wherever (underlying, opt, month) changes
+        brk = np.flatnonzero((np.diff(und_code) != 0) | (np.diff(opt) != 0) | (np.diff(month) != 0)) + 1
+        starts = np.concatenate(([0], brk)) if len(sel) else np.array([], dtype=np.int64)
+        ends = np.concatenate((brk, [len(sel)])) if len(sel) else np.array([], dtype=np.int64)
+
+        # (underlying, opt) -> {month: chain}
+        self._chains: Dict[Tuple[str, str], Dict[Optional[str], _Chain]] = {}
+        for a, b in zip(starts.tolist(), ends.tolist()):
+            m = t.month[sel[a]]
+            mk = None if np.isnat(m) else str(m)
+            key = (str(und_vocab[und_code[a]]), t.OPTION_TYPES[opt[a]])
+            self._chains.setdefault(key, {})[mk] = _Chain(t, k[a:b].tolist(), rank[a:b].tolist(), sel[a:b].tolist())
+
+    def underlyings(self) -> List[str]:
+        return sorted({und for und, _ in self._chains})
+
+    def months(self, underlying: str) -> List[Optional[str]]:
+        mks = set()
+        for opt in ("CE", "PE"):
+            mks.update(self._chains.get((underlying, opt), {}))
+        return sorted(mks, key=lambda m: m or "")
+
+    def size(self, underlying: str, month_key: Optional[str]) -> int:
+        return sum(
+            len(self._chains[(underlying, opt)][month_key].order)
+            for opt in ("CE", "PE")
+            if month_key in self._chains.get((underlying, opt), {})
+        )
 
-    # C) DD[- ]?MON[- ]?YYYY inside the symbol
-    m = re.search(
-        r"(?P<day>\d{1,2})\s*-?(?P<mon>JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)\s*-?(?P<yy>\d{2,4})",
-        TS
-    )
-    if m:
-        mon = _RE_MON[m.group("mon")]
-        yr = int(m.group("yy"))
-        if yr < 100:
-            yr += 2000
-        return f"{yr:04d}-{mon:02d}"
+    def chain(self, underlying: str, month_key: Optional[str], opt: str) -> List[InstrumentRow]:
+        c = self._chains.get((underlying, opt.upper()), {}).get(month_key)
+        return c.rows() if c else []
+
+    def chain_positions(self, underlying: str, month_key: Optional[str], opt: str) -> np.ndarray:
+        """Table positions of chain()'s rows, in strike order, for reading whole columns at once."""
+        c = self._chains.get((underlying, opt.upper()), {}).get(month_key)
+        return np.asarray(c.order if c else [], dtype=np.int64)
+
+    def lookup(
+        self,
+        opt: str,
+        strike: int,
+        *,
+        underlying: Optional[Iterable[str] | str] = None,
+        months: Optional[Iterable[Optional[str]]] = None,
+        max_dist: Optional[int] = None,
+    ) -> Optional[InstrumentRow]:
+        """
+        Exact strike if listed, else the nearest one (within max_dist when given).
+        `underlying`/`months` restrict the chains searched; None means any.
+        """
+        opt = opt.upper()
+        strike = int(strike)
+        if underlying is None:
+            unds: Iterable[str] = [und for und, o in self._chains if o == opt]
+        else:
+            unds = [underlying] if isinstance(underlying, str) else underlying
 
-    return None
+        best = None
+        for und in unds:
+            by_month = self._chains.get((und, opt))
+            if not by_month:
+                continue
+            chains = by_month.values() if months is None else [by_month[m] for m in months if m in by_month]
+            for c in chains:
+                cand = c.nearest(strike)
+                if cand is not None and (best is None or cand < best):
+                    best = cand
+        if best is None or (max_dist is not None and best[0] > max_dist):
+            return None
+        return self.table.row(best[2])
 
 
+def _underlying_labels(t: InstrumentTable, sel: np.ndarray) -> np.ndarray:
+    """"NIFTY" for core NIFTY 50 index options, else the name without spaces (symbol if unnamed)."""
+    names = np.char.replace(np.char.upper(t.name[sel].astype(str)), " ", "")
+    names = np.where(names == "", np.char.upper(t.tradingsymbol[sel].astype(str)), names)
+    core = t.core_nifty[sel] & t.itype_where(lambda it: "OPTIDX" in it)[sel]
+    return np.where(core, "NIFTY", names)
 
-def _strike_of(i) -> int | None:
-    if getattr(i, "strike", None) is not None:
-        try:
-            return int(i.strike)
-        except Exception:
-            pass
-    m = re.search(r"(\d{4,6})(?:CE|PE)?\s*$", _ts_of(i))
-    return int(m.group(1)) if m else None
 
-def _best_match_option_strict(pool: List[Instrument], opt: str, strike: int) -> Optional[Instrument]:
-    opt = opt.upper()
-    # CE/PE detection stays robust
-    def is_opt(i: Instrument) -> bool:
-        t = (i.optiontype or _infer_option_type(i.tradingsymbol, i.instrumenttype) or "").upper()
-        return t == opt
+def option_chain_index() -> OptionChainIndex:
+    """Shared index over load_instruments(); rebuilt only when the instruments file changes."""
+    rows = load_instruments()
+    with _CACHE_LOCK:
+        built = _MEMO.get("chains")
+        if built is None or built[0] is not rows:
+            built = (rows, OptionChainIndex(rows))
+            _MEMO["chains"] = built
+        return built[1]
 
-    exact = [i for i in pool if is_opt(i) and _strike_of(i) == strike]
-    if exact:
-        return exact[0]
 
-    near = [i for i in pool if is_opt(i) and (_strike_of(i) is not None)]
-    if not near:
-        return None
-    near.sort(key=lambda i: abs((_strike_of(i) or strike) - strike))
-    # only accept within ±150 to avoid silly mismatches
-    if abs((_strike_of(near[0]) or strike) - strike) <= 150:
-        return near[0]
-    return None
+def _index_for(instruments: Iterable[Any]) -> OptionChainIndex:
+    built = _MEMO.get("chains")
+    if built is not None and built[0] is instruments:
+        return built[1]
+    if instruments is _MEMO.get("rows"):
+        return option_chain_index()
+    return OptionChainIndex(instruments)
 
 
 # ---------- SmartAPI client (supports both env naming styles) ----------
-try:
-    from SmartApi import SmartConnect  # type: ignore
-except Exception:
-    SmartConnect = None  # type: ignore
-
 def _smart_client():
-    """
-    Supports:
-    - SMARTAPI_KEY / SMARTAPI_CLIENT_ID / SMARTAPI_PASSWORD / SMARTAPI_TOTP
-    - SMARTAPI_API_KEY / SMARTAPI_CLIENT_CODE / SMARTAPI_PIN / SMARTAPI_TOTP_SECRET
-    If SMARTAPI_TOTP absent but SMARTAPI_TOTP_SECRET present -> generate code via pyotp.
-    """
-    if not SmartConnect:
+    """SmartConnect on the shared, background-refreshed session (see service.engine.session)."""
+    return get_session().smart_client()
+
+# ---------- NIFTY spot ----------
+def _possible_nifty_index_rows(instruments: Iterable[Any]) -> List[InstrumentRow]:
+    t = _as_table(instruments)
+    idx = np.flatnonzero(t.exchange_is("NSE") & t.itype_where(lambda it: it in _NSE_INDEX_ITYPES or it == ""))
+    ts = np.char.upper(t.tradingsymbol[idx].astype(str))
+    nm = np.char.upper(t.name[idx].astype(str))
+    ok = ((np.char.find(ts, "NIFTY") >= 0) | (np.char.find(nm, "NIFTY") >= 0)) & ~np.char.endswith(ts, "-EQ")
+    return [t.row(n) for n in idx[ok]]
+
+# The winning (exchange, symbol, token) from the probe below is remembered on disk,
+# keyed by instruments_version(), so later calls make one ltpData call instead of
+# walking every candidate row.
+def _spot_cache_path() -> Path:
+    return INSTR_JSON.with_name("nifty_spot_token.json")
+
+
+def _read_spot_cache(version: Optional[str]) -> Optional[Dict[str, str]]:
+    try:
+        d = json.loads(_spot_cache_path().read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not version or d.get("version") != version:
         return None
+    return d
 
-    key = os.getenv("SMARTAPI_KEY") or os.getenv("SMARTAPI_API_KEY")
-    uid = os.getenv("SMARTAPI_CLIENT_ID") or os.getenv("SMARTAPI_CLIENT_CODE")
-    pwd = os.getenv("SMARTAPI_PASSWORD") or os.getenv("SMARTAPI_PIN")
-    totp = os.getenv("SMARTAPI_TOTP")
-    if not totp:
-        secret = os.getenv("SMARTAPI_TOTP_SECRET")
-        if secret:
-            try:
-                import pyotp
-                totp = pyotp.TOTP(secret).now()
-            except Exception:
-                totp = None
 
-    if not (key and uid and pwd):
-        return None
+def _write_spot_cache(version: Optional[str], row: Any) -> None:
+    payload = {
+        "version": version,
+        "exchange": row.exchange,
+        "tradingsymbol": row.tradingsymbol,
+        "token": row.token,
+        "resolved_at_ist": datetime.now(tz=IST).strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    try:
+        path = _spot_cache_path()
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        tmp.replace(path)
+    except Exception as e:
+        log.warning("failed to save NIFTY spot token cache: %s", e)
 
+
+def _clear_spot_cache() -> None:
     try:
-        c = SmartConnect(key)
-        if totp:
-            c.generateSession(uid, pwd, totp)
-        else:
-            c.generateSession(uid, pwd)
-        return c
+        _spot_cache_path().unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _spot_ltp(client, exchange: str, tradingsymbol: str, token: str) -> Optional[float]:
+    try:
+        d = client.ltpData(exchange=exchange, tradingsymbol=tradingsymbol, symboltoken=token)
+        if d and "data" in d and "ltp" in d["data"]:
+            return float(d["data"]["ltp"])
     except Exception:
+        pass
+    return None
+
+
+def nifty_spot_symbol(version: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    The NSE index symbol get_nifty_spot() reads, as a quote symbol dict: the
+    NIFTY_SPOT_* env pair, else the probe's cached winner; None until a probe ran.
+    """
+    env_ts = os.getenv("NIFTY_SPOT_TRADINGSYMBOL")
+    env_token = os.getenv("NIFTY_SPOT_TOKEN")
+    if env_ts and env_token:
+        return {"exchange": os.getenv("NIFTY_SPOT_EXCHANGE", "NSE"), "tradingsymbol": env_ts, "symboltoken": env_token}
+    cached = _read_spot_cache(version if version is not None else instruments_version())
+    if not cached:
         return None
+    return {"exchange": cached["exchange"], "tradingsymbol": cached["tradingsymbol"], "symboltoken": cached["token"]}
 
-# ---------- NIFTY spot ----------
-def _possible_nifty_index_rows(instruments: Iterable[Instrument]) -> List[Instrument]:
-    cands: List[Instrument] = []
-    for i in instruments:
-        if i.exchange.upper() == "NSE":
-            ts = i.tradingsymbol.upper()
-            nm = i.name.upper()
-            it = i.instrumenttype.upper()
-            if ("NIFTY" in ts or "NIFTY" in nm) and it in ("INDEX", "AMXIDX", "FUTIDX", ""):
-                if not ts.endswith("-EQ"):
-                    cands.append(i)
-    return cands
 
 def get_nifty_spot() -> Optional[float]:
     env_ts = os.getenv("NIFTY_SPOT_TRADINGSYMBOL")
     env_token = os.getenv("NIFTY_SPOT_TOKEN")
     env_exch = os.getenv("NIFTY_SPOT_EXCHANGE", "NSE")
 
+    # Fresh tick from the streaming feed: no login, no REST
+    if ticks.feed_enabled():
+        try:
+            src = {"exchange": env_exch, "token": env_token} if (env_ts and env_token) else \
+                _read_spot_cache(instruments_version()) or {}
+            ltp = ticks.fresh_ltp(src.get("exchange", ""), src.get("token", ""))
+            if ltp is not None:
+                metrics.inc("spot.tick_hits")
+                return ltp
+        except Exception:
+            pass
+
     client = _smart_client()
     if not client:
         return None
 
     if env_ts and env_token:
-        try:
-            d = client.ltpData(exchange=env_exch, tradingsymbol=env_ts, symboltoken=env_token)
-            if d and "data" in d and "ltp" in d["data"]:
-                return float(d["data"]["ltp"])
-        except Exception:
-            pass
+        ltp = _spot_ltp(client, env_exch, env_ts, env_token)
+        if ltp is not None:
+            ticks.watch([{"exchange": env_exch, "symboltoken": env_token}])
+            return ltp
 
     try:
+        version = instruments_version()
+        cached = _read_spot_cache(version)
+        if cached:
+            metrics.inc("spot.cache_calls")
+            ltp = _spot_ltp(client, cached["exchange"], cached["tradingsymbol"], cached["token"])
+            if ltp is not None and ltp > 100:
+                metrics.inc("spot.cache_hits")
+                ticks.watch([cached])
+                return ltp
+            # stale or failing token -> forget it and re-probe
+            metrics.inc("spot.reprobes")
+            _clear_spot_cache()
+
         ins = load_instruments()
         for row in _possible_nifty_index_rows(ins):
-            try:
-                d = client.ltpData(exchange=row.exchange, tradingsymbol=row.tradingsymbol, symboltoken=row.token)
-                if d and "data" in d and "ltp" in d["data"]:
-                    ltp = float(d["data"]["ltp"])
-                    if ltp > 100:
-                        return ltp
-            except Exception:
-                continue
+            metrics.inc("spot.probe_calls")
+            ltp = _spot_ltp(client, row.exchange, row.tradingsymbol, row.token)
+            if ltp is not None and ltp > 100:
+                _write_spot_cache(version, row)
+                ticks.watch([{"exchange": row.exchange, "symboltoken": row.token}])
+                return ltp
     except Exception:
         return None
     return None
@@ -430,63 +1154,17 @@ def get_nifty_spot() -> Optional[float]:
 def _nearest_50(x: float) -> int:
     return int(round(x / 50.0) * 50)
 
-def _filter_nifty_options_for_month(instruments: Iterable[Instrument], month_key: str) -> List[Instrument]:
-    out: List[Instrument] = []
-    for i in instruments:
-        if i.exchange.upper() != "NFO":
-            continue
-        if "OPT" not in i.instrumenttype.upper():
-            continue
-        ts = i.tradingsymbol.upper()
-        if "NIFTY" not in ts:
-            continue
-        # Prefer same-month matches, but include rows with unknown expiry as soft fallback.
-        if _month_key(i.expiry_dt) == month_key or i.expiry_dt is None:
-            out.append(i)
-    return out
-
-def _strike_of(i) -> int | None:
-    if getattr(i, "strike", None) is not None:
-        try:
-            return int(i.strike)
-        except Exception:
-            pass
-    m = re.search(r"(\d{4,6})(?:CE|PE)?\s*$", _ts_of(i))
-    return int(m.group(1)) if m else None
-
-def _best_match_option(instruments: List[Instrument], opt: str, strike: int, month_key: str) -> Optional[Instrument]:
-    opt = opt.upper()
-    strike = int(strike)
-
-    month_pool = _filter_nifty_options_for_month(instruments, month_key)
+def _best_match_option(instruments: Iterable[Any], opt: str, strike: int, month_key: str) -> Optional[InstrumentRow]:
+    idx = _index_for(instruments)
+    nifty_family = [u for u in idx.underlyings() if "NIFTY" in u]
 
-    def is_opt(i: Instrument) -> bool:
-        t = (i.optiontype or _infer_option_type(i.tradingsymbol, i.instrumenttype) or "").upper()
-        return t == opt
+    # 1) Same-month (or unknown expiry) NIFTY options: exact, else nearest within ±100
+    hit = idx.lookup(opt, strike, underlying=nifty_family, months=(month_key, None), max_dist=100)
+    if hit:
+        return hit
 
-    # 1) Same-month & exact strike
-    exact = [i for i in month_pool if is_opt(i) and _strike_of(i) == strike]
-    if exact:
-        return exact[0]
-
-    # 2) Same-month & nearest strike within ±100
-    near = [i for i in month_pool if is_opt(i) and (s := _strike_of(i)) is not None and abs(s - strike) <= 100]
-    if near:
-        near.sort(key=lambda i: abs((_strike_of(i) or strike) - strike))
-        return near[0]
-
-    # 3) Any expiry & exact strike
-    any_exp = [i for i in instruments if is_opt(i) and _strike_of(i) == strike]
-    if any_exp:
-        return any_exp[0]
-
-    # 4) Any expiry & nearest strike within ±100
-    any_near = [i for i in instruments if is_opt(i) and (s := _strike_of(i)) is not None and abs(s - strike) <= 100]
-    if any_near:
-        any_near.sort(key=lambda i: abs((_strike_of(i) or strike) - strike))
-        return any_near[0]
-
-    return None
+    # 2) Any expiry: exact, else nearest within ±100
+    return idx.lookup(opt, strike, max_dist=100)
 
 def pick_monthly_option_symbols(direction: str, offset_points: int = 0):
     """
@@ -510,34 +1188,18 @@ def pick_monthly_option_symbols(direction: str, offset_points: int = 0):
         _month_key(_last_thursday_of_month(_next_month(_next_month(now)))),
     ]
 
-    ins = load_instruments()
+    idx = option_chain_index()
     diagnostics = {}
 
-    def _pick(pool, opt, strike):
-        opt = opt.upper()
-        def is_opt(i):
-            t = (getattr(i, "optiontype", None) or _infer_option_type(_ts_of(i), getattr(i, "instrumenttype", "")) or "").upper()
-            return t == opt
-
-        exact = [i for i in pool if is_opt(i) and _strike_of(i) == strike]
-        if exact:
-            return exact[0]
-
-        cand = [i for i in pool if is_opt(i) and (_strike_of(i) is not None)]
-        if not cand:
-            return None
-
-        cand.sort(key=lambda i: abs((_strike_of(i) or strike) - strike))
-        return cand[0]  # accept best even if far; dump can be sparse
-
     for mk in month_keys:
-        pool = _nifty_monthly_pool(ins, mk or "")
-        diagnostics[mk or "None"] = len(pool)
-        if not pool:
+        size = idx.size("NIFTY", mk)
+        diagnostics[mk or "None"] = size
+        if not size:
             continue
 
-        ce_i = _pick(pool, "CE", base)
-        pe_i = _pick(pool, "PE", base)
+        # exact strike, else nearest; accept best even if far since the dump can be sparse
+        ce_i = idx.lookup("CE", base, underlying="NIFTY", months=(mk,))
+        pe_i = idx.lookup("PE", base, underlying="NIFTY", months=(mk,))
         if ce_i and pe_i:
             ce_lbl, pe_lbl = _ts_of(ce_i), _ts_of(pe_i)
             ce = {"exchange": ce_i.exchange, "tradingsymbol": ce_lbl, "symboltoken": ce_i.token}
@@ -566,26 +1228,12 @@ def pick_option_symbols_any_expiry(direction: str, offset_points: int = 0) -> Tu
         )
 
     base = _nearest_50(spot) + int(offset_points)
-    ins = load_instruments()
-
-    def is_opt(i: Instrument, opt: str) -> bool:
-        t = (i.optiontype or _infer_option_type(i.tradingsymbol, i.instrumenttype) or "").upper()
-        return (
-            i.exchange.upper() == "NFO"
-            and "OPT" in i.instrumenttype.upper()
-            and "NIFTY" in i.tradingsymbol.upper()
-            and t == opt.upper()
-        )
+    idx = option_chain_index()
+    nifty_family = [u for u in idx.underlyings() if "NIFTY" in u]
 
-    def nearest_opt(opt: str) -> Optional[Instrument]:
-        cands = [i for i in ins if is_opt(i, opt) and _strike_of(i) is not None]
-        if not cands:
-            return None
-        # choose the one whose strike is closest to base
-        cands.sort(key=lambda i: abs((_strike_of(i) or base) - base))
-        # soft guard: prefer within ±100 if available
-        close = [i for i in cands if abs((_strike_of(i) or base) - base) <= 100]
-        return (close[0] if close else cands[0])
+    def nearest_opt(opt: str) -> Optional[InstrumentRow]:
+        # choose the one whose strike is closest to base, across every expiry
+        return idx.lookup(opt, base, underlying=nifty_family)
 
     ce_i = nearest_opt("CE")
     pe_i = nearest_opt("PE")
@@ -0,0 +1,654 @@
+# service/engine/ledger.py
+"""
+SQLite (WAL) ledger for the paper account: positions, legs, fills, funds
+snapshots and trades, plus a journal of account-state events compacted into
+snapshots. Opening or closing a position is a single transaction.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .utils import ROOT, FUNDS_FILE, POSITIONS_FILE, TRADES_CSV, _now_ist_str, _read_json, _env_float
+
+log = logging.getLogger("service.ledger")
+
+DB_PATH = ROOT / (os.getenv("DB_PATH") or "data/trades.db")
+STARTING_FUNDS = _env_float("STARTING_FUNDS", 500000.0)
+SNAPSHOT_EVERY = max(1, int(_env_float("LEDGER_SNAPSHOT_EVERY", 100)))
+
+TRADE_FIELDS = (
+    "ts_ist", "action", "symbol_ce", "symbol_pe",
+    "lots_ce", "lots_pe", "entry_ce", "entry_pe",
+    "exit_ce", "exit_pe", "pnl_ce", "pnl_pe", "pnl_total", "note",
+)
+KINDS = ("ce", "pe")
+DEFAULT_PORTFOLIO = "default"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+CREATE TABLE IF NOT EXISTS positions (
+    id          INTEGER PRIMARY KEY,
+    portfolio   TEXT NOT NULL DEFAULT 'default',
+    side        TEXT NOT NULL,
+    ratio_ce    INTEGER NOT NULL,
+    ratio_pe    INTEGER NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'open',      -- open | closed
+    opened_at   TEXT NOT NULL,
+    closed_at   TEXT,
+    used        REAL,
+    pnl         REAL,
+    note        TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_positions_status ON positions(status, id);
+CREATE INDEX IF NOT EXISTS ix_positions_opened ON positions(opened_at);
+CREATE TABLE IF NOT EXISTS legs (
+    id            INTEGER PRIMARY KEY,
+    position_id   INTEGER NOT NULL REFERENCES positions(id),
+    kind          TEXT NOT NULL,                   -- ce | pe
+    exchange      TEXT,
+    tradingsymbol TEXT,
+    symboltoken   TEXT,
+    lots          INTEGER NOT NULL,
+    entry         REAL,
+    exit          REAL,
+    UNIQUE (position_id, kind)
+);
+CREATE INDEX IF NOT EXISTS ix_legs_symbol ON legs(tradingsymbol);
+CREATE TABLE IF NOT EXISTS fills (
+    id            INTEGER PRIMARY KEY,
+    position_id   INTEGER NOT NULL REFERENCES positions(id),
+    leg_id        INTEGER NOT NULL REFERENCES legs(id),
+    ts_ist        TEXT NOT NULL,
+    side          TEXT NOT NULL,                   -- BUY | SELL
+    lots          INTEGER NOT NULL,
+    price         REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_fills_position ON fills(position_id);
+CREATE INDEX IF NOT EXISTS ix_fills_ts ON fills(ts_ist);
+CREATE TABLE IF NOT EXISTS funds_snapshots (
+    id          INTEGER PRIMARY KEY,
+    portfolio   TEXT NOT NULL DEFAULT 'default',
+    ts_ist      TEXT NOT NULL,
+    balance     REAL NOT NULL,
+    realized    REAL NOT NULL,
+    used        REAL NOT NULL,
+    mtm         REAL
+);
+CREATE INDEX IF NOT EXISTS ix_funds_ts ON funds_snapshots(ts_ist);
+CREATE TABLE IF NOT EXISTS trades (
+    id          INTEGER PRIMARY KEY,
+    portfolio   TEXT NOT NULL DEFAULT 'default',
+    side        TEXT,                            -- UP | DOWN
+    position_id INTEGER REFERENCES positions(id),
+    ts_ist      TEXT NOT NULL,
+    action      TEXT,
+    symbol_ce   TEXT,
+    symbol_pe   TEXT,
+    lots_ce     INTEGER,
+    lots_pe     INTEGER,
+    entry_ce    REAL,
+    entry_pe    REAL,
+    exit_ce     REAL,
+    exit_pe     REAL,
+    pnl_ce      REAL,
+    pnl_pe      REAL,
+    pnl_total   REAL,
+    note        TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_trades_ts ON trades(ts_ist);
+CREATE INDEX IF NOT EXISTS ix_trades_position ON trades(position_id);
+CREATE TABLE IF NOT EXISTS journal (
+    seq         INTEGER PRIMARY KEY,
+    ts_ist      TEXT NOT NULL,
+    kind        TEXT NOT NULL,                   -- open | close | funds
+    payload     TEXT NOT NULL                    -- JSON
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    seq         INTEGER PRIMARY KEY,             -- last journal seq folded in
+    ts_ist      TEXT NOT NULL,
+    state       TEXT NOT NULL                    -- JSON
+);
+"""
+# Columns added after the first release: (table, column, type), each with an index on (column, id)
+ADDED_COLUMNS = (
+    ("positions", "portfolio", "TEXT NOT NULL DEFAULT 'default'"),
+    ("funds_snapshots", "portfolio", "TEXT NOT NULL DEFAULT 'default'"),
+    ("trades", "portfolio", "TEXT NOT NULL DEFAULT 'default'"),
+    ("trades", "side", "TEXT"),
+)
+SNAPSHOTS_KEPT = 3
+
+_LOCAL = threading.local()
+_CONNS: List[sqlite3.Connection] = []
+_INIT_LOCK = threading.Lock()
+_READY = False
+_GEN = 0  # bumped by close(); threads reopen when their connection is from an older generation
+# Whether trades.ts_ist never decreases with id (checked on open, kept up to date by _insert_trade);
+# the trade-history date filters only turn into id ranges while it holds.
+_TS_ORDERED = True
+
+
+# ---------- Connections ----------
+def _open() -> sqlite3.Connection:
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # autocommit mode; transaction() issues BEGIN/COMMIT itself
+    conn = sqlite3.connect(str(DB_PATH), isolation_level=None, check_same_thread=False, timeout=10.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")   # durable at checkpoints; fine for a paper ledger
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def _conn() -> sqlite3.Connection:
+    """This thread's connection (schema created and legacy files imported on first use)."""
+    _init()
+    if getattr(_LOCAL, "gen", None) != _GEN:
+        _LOCAL.conn, _LOCAL.gen = _open(), _GEN
+        with _INIT_LOCK:
+            _CONNS.append(_LOCAL.conn)
+    return _LOCAL.conn
+
+
+def _init() -> None:
+    global _READY
+    if _READY:
+        return
+    with _INIT_LOCK:
+        if _READY:
+            return
+        conn = _open()
+        try:
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+            _import_legacy(conn)
+            _seed_journal(conn)
+            _check_trade_order(conn)
+        finally:
+            conn.close()
+        _READY = True
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    for table, column, decl in ADDED_COLUMNS:
+        cols = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table}({column}, id)")
+    # trade direction: from the position, else from the lots ratio (2:1 UP, 1:2 DOWN)
+    conn.execute("UPDATE trades SET side = (SELECT side FROM positions p WHERE p.id = trades.position_id) "
+                 "WHERE side IS NULL AND position_id IS NOT NULL")
+    conn.execute("UPDATE trades SET side = CASE WHEN lots_ce > lots_pe THEN 'UP' WHEN lots_ce < lots_pe THEN 'DOWN' END "
+                 "WHERE side IS NULL")
+
+
+def _check_trade_order(conn: sqlite3.Connection) -> None:
+    global _TS_ORDERED
+    bad = conn.execute("SELECT id FROM (SELECT id, ts_ist, LAG(ts_ist) OVER (ORDER BY id) AS prev FROM trades) "
+                       "WHERE ts_ist < prev LIMIT 1").fetchone()
+    _TS_ORDERED = bad is None
+    if bad is not None:
+        log.warning("trades.ts_ist decreases at id %d; trade history date filters scan by timestamp", bad["id"])
+
+
+def close() -> None:
+    """Close every connection (shutdown); the next call reopens."""
+    global _READY, _GEN
+    with _INIT_LOCK:
+        for conn in _CONNS:
+            try:
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            except Exception:
+                pass
+        _CONNS.clear()
+        _READY = False
+        _GEN += 1
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """One write transaction: everything in the block commits together or not at all."""
+    conn = _conn()
+    with metrics.timed("ledger.txn_ms"):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            metrics.inc("ledger.rollbacks")
+            raise
+        conn.execute("COMMIT")
+    metrics.inc("ledger.commits")
+
+
+# ---------- Rows ----------
+def _num(v: Any) -> Optional[float]:
+    if v is None or v == "":
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _insert_position(conn: sqlite3.Connection, position: Dict[str, Any], opened_at: str,
+                     portfolio: str = DEFAULT_PORTFOLIO) -> int:
+    ratio = position.get("ratio") or (position["ce"]["lots"], position["pe"]["lots"])
+    cur = conn.execute(
+        "INSERT INTO positions (portfolio, side, ratio_ce, ratio_pe, status, opened_at, used) "
+        "VALUES (?, ?, ?, ?, 'open', ?, ?)",
+        (portfolio, position.get("side"), int(ratio[0]), int(ratio[1]), opened_at, _num(position.get("used"))),
+    )
+    pid = int(cur.lastrowid)
+    for kind in KINDS:
+        leg = position[kind]
+        sym = leg.get("symbol") or {}
+        cur = conn.execute(
+            "INSERT INTO legs (position_id, kind, exchange, tradingsymbol, symboltoken, lots, entry) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (pid, kind, sym.get("exchange"), sym.get("tradingsymbol"), sym.get("symboltoken"),
+             int(leg["lots"]), _num(leg.get("entry"))),
+        )
+        if leg.get("entry") is not None:
+            conn.execute(
+                "INSERT INTO fills (position_id, leg_id, ts_ist, side, lots, price) VALUES (?, ?, ?, 'BUY', ?, ?)",
+                (pid, cur.lastrowid, opened_at, int(leg["lots"]), float(leg["entry"])),
+            )
+    return pid
+
+
+def _insert_funds(conn: sqlite3.Connection, funds: Dict[str, Any], ts: Optional[str] = None,
+                  portfolio: str = DEFAULT_PORTFOLIO) -> None:
+    mtm = _num(funds.get("mtm"))
+    conn.execute(
+        "INSERT INTO funds_snapshots (portfolio, ts_ist, balance, realized, used, mtm) VALUES (?, ?, ?, ?, ?, ?)",
+        (portfolio, ts or _now_ist_str(), round(float(funds["balance"]), 2), round(float(funds["realized"]), 2),
+         round(float(funds["used"]), 2), None if mtm is None else round(mtm, 2)),
+    )
+
+
+def _side_of(row: Dict[str, Any]) -> Optional[str]:
+    try:
+        ce, pe = int(row.get("lots_ce") or 0), int(row.get("lots_pe") or 0)
+    except (TypeError, ValueError):
+        return None
+    return "UP" if ce > pe else "DOWN" if ce < pe else None
+
+
+def _insert_trade(conn: sqlite3.Connection, row: Dict[str, Any], position_id: Optional[int],
+                  portfolio: str = DEFAULT_PORTFOLIO) -> int:
+    side = row.get("side")
+    if side is None and position_id is not None:
+        found = conn.execute("SELECT side FROM positions WHERE id = ?", (position_id,)).fetchone()
+        side = found["side"] if found else None
+    global _TS_ORDERED
+    if _TS_ORDERED:
+        last = conn.execute("SELECT ts_ist FROM trades ORDER BY id DESC LIMIT 1").fetchone()
+        if last is not None and (row.get("ts_ist") or "") < last["ts_ist"]:
+            _TS_ORDERED = False
+            log.warning("trade at %r is older than the last one (%r); trade history date filters scan by timestamp",
+                        row.get("ts_ist"), last["ts_ist"])
+    cols = ("portfolio", "position_id", "side") + TRADE_FIELDS
+    vals = [portfolio, position_id, side or _side_of(row)] + [row.get(k) for k in TRADE_FIELDS]
+    cur = conn.execute(f"INSERT INTO trades ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", vals)
+    return int(cur.lastrowid)
+
+
+# ---------- Writes used by positions.py / portfolios.py ----------
+def _open_in(conn: sqlite3.Connection, position: Dict[str, Any], ts: str, portfolio: str) -> int:
+    pid = _insert_position(conn, position, ts, portfolio)
+    _append_event(conn, "open", {"portfolio": portfolio, "position": dict(position, id=pid)}, ts)
+    return pid
+
+
+def _close_in(conn: sqlite3.Connection, position_id: Optional[int], exits: Dict[str, float], trade: Dict[str, Any],
+              balance: float, realized: float, ts: str, portfolio: str) -> int:
+    trade = dict(trade, ts_ist=ts)
+    if position_id is not None:
+        for leg in conn.execute("SELECT id, kind, lots FROM legs WHERE position_id = ?", (position_id,)).fetchall():
+            price = exits.get(leg["kind"])
+            if price is None:
+                continue
+            conn.execute("UPDATE legs SET exit = ? WHERE id = ?", (float(price), leg["id"]))
+            conn.execute(
+                "INSERT INTO fills (position_id, leg_id, ts_ist, side, lots, price) VALUES (?, ?, ?, 'SELL', ?, ?)",
+                (position_id, leg["id"], ts, leg["lots"], float(price)),
+            )
+        conn.execute(
+            "UPDATE positions SET status = 'closed', closed_at = ?, pnl = ?, note = ? WHERE id = ?",
+            (ts, trade.get("pnl_total"), trade.get("note"), position_id),
+        )
+    tid = _insert_trade(conn, trade, position_id, portfolio)
+    _append_event(conn, "close", {"portfolio": portfolio, "position_id": position_id,
+                                  "balance": balance, "realized": realized}, ts)
+    return tid
+
+
+def record_open(position: Dict[str, Any], portfolio: str = DEFAULT_PORTFOLIO) -> int:
+    """
+    Position, both legs, their BUY fills and the journal event in one commit.
+    `position` is {"side", "ratio", "used", "ce"/"pe": {"symbol", "lots", "entry"}}.
+    """
+    with transaction() as conn:
+        return _open_in(conn, position, _now_ist_str(), portfolio)
+
+
+def record_opens(items: List[Tuple[str, Dict[str, Any]]]) -> List[int]:
+    """record_open() for several (portfolio, position) pairs in one commit; position ids in order."""
+    ts = _now_ist_str()
+    with transaction() as conn:
+        return [_open_in(conn, position, ts, portfolio) for portfolio, position in items]
+
+
+def record_close(position_id: Optional[int], exits: Dict[str, float], trade: Dict[str, Any],
+                 balance: float, realized: float, portfolio: str = DEFAULT_PORTFOLIO) -> int:
+    """Leg exits, SELL fills, the position's close, its trade row and the journal event in one commit."""
+    with transaction() as conn:
+        return _close_in(conn, position_id, exits, trade, balance, realized, _now_ist_str(), portfolio)
+
+
+def record_closes(items: List[Tuple[str, Optional[int], Dict[str, float], Dict[str, Any], float, float]]) -> List[int]:
+    """
+    record_close() for several (portfolio, position_id, exits, trade, balance, realized)
+    tuples in one commit; trade ids in order.
+    """
+    ts = _now_ist_str()
+    with transaction() as conn:
+        return [_close_in(conn, pid, exits, trade, balance, realized, ts, portfolio)
+                for portfolio, pid, exits, trade, balance, realized in items]
+
+
+def record_funds(funds: Dict[str, Any], ts: Optional[str] = None, portfolio: str = DEFAULT_PORTFOLIO) -> None:
+    """Funds snapshot only (written by the report writer); account state is unchanged."""
+    with transaction() as conn:
+        _insert_funds(conn, funds, ts, portfolio)
+
+
+def record_funds_many(rows: List[Tuple[str, Optional[str], Dict[str, Any]]]) -> None:
+    """Several (portfolio, ts_ist, funds) snapshots in one commit."""
+    with transaction() as conn:
+        for portfolio, ts, funds in rows:
+            _insert_funds(conn, funds, ts, portfolio)
+
+
+def record_funds_change(balance: float, realized: float, used: Optional[float] = None,
+                        portfolio: str = DEFAULT_PORTFOLIO) -> None:
+    """Set a book's balance/realized (and used) outside a trade, e.g. a top-up, reset or new portfolio."""
+    funds: Dict[str, Any] = {"portfolio": portfolio, "balance": balance, "realized": realized}
+    if used is not None:
+        funds["used"] = used
+    with transaction() as conn:
+        _append_event(conn, "funds", funds)
+
+
+# ---------- Journal / snapshots ----------
+def initial_state() -> Dict[str, Any]:
+    return {"balance": STARTING_FUNDS, "realized": 0.0, "used": 0.0, "open": None}
+
+
+def apply_event(states: Dict[str, Dict[str, Any]], kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fold one journal event into its portfolio's state in `states` (in place) and return that state.
+    Events carry absolute values, so replay is exact.
+    """
+    state = states.setdefault(payload.get("portfolio") or DEFAULT_PORTFOLIO, initial_state())
+    if kind == "open":
+        state["open"] = payload["position"]
+        state["used"] = float(payload["position"].get("used") or 0.0)
+    elif kind == "close":
+        state["open"] = None
+        state["used"] = 0.0
+        state["balance"] = float(payload["balance"])
+        state["realized"] = float(payload["realized"])
+    elif kind == "funds":
+        for k in ("balance", "realized", "used"):
+            if payload.get(k) is not None:
+                state[k] = float(payload[k])
+    else:
+        log.warning("unknown journal event %r ignored", kind)
+    return state
+
+
+def _state_at(conn: sqlite3.Connection) -> Tuple[Dict[str, Dict[str, Any]], int, int]:
+    """({portfolio: state}, last seq, events replayed): latest snapshot plus the journal tail after it."""
+    row = conn.execute("SELECT seq, state FROM snapshots ORDER BY seq DESC LIMIT 1").fetchone()
+    states: Dict[str, Dict[str, Any]] = {}
+    seq = 0
+    if row:
+        snap, seq = json.loads(row["state"]), int(row["seq"])
+        # single-book snapshots predate portfolios
+        states = snap["portfolios"] if "portfolios" in snap else {DEFAULT_PORTFOLIO: snap}
+    replayed = 0
+    for ev in conn.execute("SELECT seq, kind, payload FROM journal WHERE seq > ? ORDER BY seq", (seq,)):
+        apply_event(states, ev["kind"], json.loads(ev["payload"]))
+        seq = int(ev["seq"])
+        replayed += 1
+    return states, seq, replayed
+
+
+def _write_snapshot(conn: sqlite3.Connection, states: Dict[str, Dict[str, Any]], seq: int) -> None:
+    conn.execute("INSERT OR REPLACE INTO snapshots (seq, ts_ist, state) VALUES (?, ?, ?)",
+                 (seq, _now_ist_str(), json.dumps({"portfolios": states})))
+    conn.execute("DELETE FROM snapshots WHERE seq NOT IN (SELECT seq FROM snapshots ORDER BY seq DESC LIMIT ?)",
+                 (SNAPSHOTS_KEPT,))
+    metrics.inc("ledger.snapshots")
+
+
+def _append_event(conn: sqlite3.Connection, kind: str, payload: Dict[str, Any], ts: Optional[str] = None) -> int:
+    seq = int(conn.execute("INSERT INTO journal (ts_ist, kind, payload) VALUES (?, ?, ?)",
+                           (ts or _now_ist_str(), kind, json.dumps(payload))).lastrowid)
+    last = conn.execute("SELECT MAX(seq) FROM snapshots").fetchone()[0] or 0
+    if seq - last >= SNAPSHOT_EVERY:
+        states, at, _ = _state_at(conn)
+        _write_snapshot(conn, states, at)
+    return seq
+
+
+def load_states() -> Dict[str, Dict[str, Any]]:
+    """Every book's state for startup: latest snapshot + replay of the (at most SNAPSHOT_EVERY) newer events."""
+    with metrics.timed("ledger.restore_ms"):
+        states, seq, replayed = _state_at(_conn())
+    metrics.set_gauge("ledger.replayed_events", replayed)
+    log.info("ledger state at journal seq %d (%d event(s) replayed)", seq, replayed)
+    return states
+
+
+def load_state(portfolio: str = DEFAULT_PORTFOLIO) -> Dict[str, Any]:
+    return load_states().get(portfolio) or initial_state()
+
+
+def snapshot() -> None:
+    """Compact the journal tail into a snapshot now (on shutdown), if there is one."""
+    with transaction() as conn:
+        states, seq, replayed = _state_at(conn)
+        if replayed:
+            _write_snapshot(conn, states, seq)
+
+
+def _position_payload(conn: sqlite3.Connection, pid: int) -> Dict[str, Any]:
+    row = conn.execute("SELECT * FROM positions WHERE id = ?", (pid,)).fetchone()
+    out: Dict[str, Any] = {"id": pid, "side": row["side"], "ratio": [row["ratio_ce"], row["ratio_pe"]],
+                           "used": row["used"]}
+    for leg in conn.execute("SELECT * FROM legs WHERE position_id = ?", (pid,)):
+        out[leg["kind"]] = {
+            "symbol": {"exchange": leg["exchange"], "tradingsymbol": leg["tradingsymbol"],
+                       "symboltoken": leg["symboltoken"]},
+            "lots": leg["lots"], "entry": leg["entry"],
+        }
+    return out
+
+
+def _seed_journal(conn: sqlite3.Connection) -> None:
+    """Start an empty journal from what the tables already hold (new DB, or a pre-journal one)."""
+    if conn.execute("SELECT 1 FROM journal LIMIT 1").fetchone():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        f = conn.execute("SELECT balance, realized FROM funds_snapshots WHERE portfolio = ? ORDER BY id DESC LIMIT 1",
+                         (DEFAULT_PORTFOLIO,)).fetchone()
+        _append_event(conn, "funds", {"balance": f["balance"] if f else STARTING_FUNDS,
+                                      "realized": f["realized"] if f else 0.0, "used": 0.0})
+        for pid, pf in conn.execute("SELECT id, portfolio FROM positions WHERE status = 'open' ORDER BY id").fetchall():
+            _append_event(conn, "open", {"portfolio": pf, "position": _position_payload(conn, pid)})
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# ---------- History ----------
+def _dicts(rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+    return [dict(r) for r in rows]
+
+
+def _where(clauses: List[Tuple[str, Any]]) -> Tuple[str, List[Any]]:
+    """WHERE clause and params from (sql, value) pairs, skipping None values."""
+    used = [(sql, v) for sql, v in clauses if v is not None]
+    if not used:
+        return "", []
+    return " WHERE " + " AND ".join(sql for sql, _ in used), [v for _, v in used]
+
+
+def _first_id_at(conn: sqlite3.Connection, ts_ist: Optional[str]) -> Optional[int]:
+    if ts_ist is None:
+        return None
+    row = conn.execute("SELECT id FROM trades WHERE ts_ist >= ? ORDER BY ts_ist, id LIMIT 1", (ts_ist,)).fetchone()
+    return row["id"] if row else None
+
+
+def _trade_filters(conn: sqlite3.Connection, start_ist: Optional[str], end_ist: Optional[str],
+                   side: Optional[str], portfolio: Optional[str]) -> List[Tuple[str, Any]]:
+    # Trades are appended at close time, so ts_ist normally grows with id: the date range then
+    # becomes an id range found with two seeks on ix_trades_ts, and pages walk the primary key
+    # from there. If an import or a clock step ever broke that order (_TS_ORDERED), the range
+    # is left to the ts_ist clauses alone, which are always applied.
+    lo = hi = None
+    if _TS_ORDERED:
+        lo, hi = _first_id_at(conn, start_ist), _first_id_at(conn, end_ist)
+        if start_ist is not None and lo is None:
+            lo = hi = 0  # nothing at or after start
+    return [("id >= ?", lo), ("id < ?", hi), ("ts_ist >= ?", start_ist), ("ts_ist < ?", end_ist),
+            ("side = ?", side.upper() if side else None), ("portfolio = ?", portfolio)]
+
+
+def recent_trades(limit: int = 100, before_id: Optional[int] = None, portfolio: Optional[str] = None,
+                  start_ist: Optional[str] = None, end_ist: Optional[str] = None,
+                  side: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Newest first (every portfolio unless one is given); pass the last id seen as
+    before_id for the next page. Walks the id index backwards, so a page costs
+    the same however long the history is. "Newest" is id (close) order, which is
+    also ts_ist order unless the trades were written out of time order.
+    """
+    conn = _conn()
+    where, params = _where([("id < ?", before_id)] + _trade_filters(conn, start_ist, end_ist, side, portfolio))
+    return _dicts(conn.execute(f"SELECT * FROM trades{where} ORDER BY id DESC LIMIT ?", params + [limit]).fetchall())
+
+
+def iter_trades(portfolio: Optional[str] = None, start_ist: Optional[str] = None, end_ist: Optional[str] = None,
+                side: Optional[str] = None, chunk: int = 500) -> Iterator[Dict[str, Any]]:
+    """Every matching trade, oldest first, read `chunk` rows at a time (for streaming downloads)."""
+    after = 0
+    filters = _trade_filters(_conn(), start_ist, end_ist, side, portfolio)
+    while True:
+        where, params = _where([("id > ?", after)] + filters)
+        rows = _conn().execute(f"SELECT * FROM trades{where} ORDER BY id LIMIT ?", params + [chunk]).fetchall()
+        for r in rows:
+            yield dict(r)
+        if len(rows) < chunk:
+            return
+        after = rows[-1]["id"]
+
+
+def trades_between(start_ist: str, end_ist: str, portfolio: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Trades with start <= ts_ist < end ("YYYY-MM-DD[ HH:MM:SS]" strings), oldest first."""
+    where, params = _where([("ts_ist >= ?", start_ist), ("ts_ist < ?", end_ist), ("portfolio = ?", portfolio)])
+    return _dicts(_conn().execute(f"SELECT * FROM trades{where} ORDER BY ts_ist, id", params).fetchall())
+
+
+def funds_history(since_ist: Optional[str] = None, limit: int = 500,
+                  portfolio: str = DEFAULT_PORTFOLIO) -> List[Dict[str, Any]]:
+    """A book's funds snapshots, oldest first (the latest `limit` when since_ist is not given)."""
+    conn = _conn()
+    if since_ist is not None:
+        rows = conn.execute("SELECT * FROM funds_snapshots WHERE portfolio = ? AND ts_ist >= ? "
+                            "ORDER BY ts_ist, id LIMIT ?", (portfolio, since_ist, limit)).fetchall()
+        return _dicts(rows)
+    rows = conn.execute("SELECT * FROM funds_snapshots WHERE portfolio = ? ORDER BY id DESC LIMIT ?",
+                        (portfolio, limit)).fetchall()
+    return _dicts(rows[::-1])
+
+
+def latest_funds(portfolio: str = DEFAULT_PORTFOLIO) -> Optional[Dict[str, Any]]:
+    row = _conn().execute("SELECT * FROM funds_snapshots WHERE portfolio = ? ORDER BY id DESC LIMIT 1",
+                          (portfolio,)).fetchone()
+    return dict(row) if row else None
+
+
+def position(position_id: int) -> Optional[Dict[str, Any]]:
+    """A position with its legs and fills."""
+    conn = _conn()
+    row = conn.execute("SELECT * FROM positions WHERE id = ?", (position_id,)).fetchone()
+    if row is None:
+        return None
+    out = dict(row)
+    out["legs"] = _dicts(conn.execute("SELECT * FROM legs WHERE position_id = ? ORDER BY kind",
+                                      (position_id,)).fetchall())
+    out["fills"] = _dicts(conn.execute("SELECT * FROM fills WHERE position_id = ? ORDER BY id",
+                                       (position_id,)).fetchall())
+    return out
+
+
+def open_positions(portfolio: Optional[str] = None) -> List[Dict[str, Any]]:
+    where, params = _where([("status = ?", "open"), ("portfolio = ?", portfolio)])
+    ids = [r[0] for r in _conn().execute(f"SELECT id FROM positions{where} ORDER BY id", params).fetchall()]
+    return [p for p in (position(i) for i in ids) if p]
+
+
+# ---------- One-time import of the pre-ledger report files ----------
+def _import_legacy(conn: sqlite3.Connection) -> None:
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_import'").fetchone():
+        return
+    counts = {"trades": 0, "funds": 0, "open_position": 0}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if TRADES_CSV.exists():
+            with TRADES_CSV.open(newline="") as f:
+                for r in csv.DictReader(f):
+                    row = {k: r.get(k) or None for k in TRADE_FIELDS}
+                    for k in TRADE_FIELDS[4:13]:
+                        row[k] = _num(row[k])
+                    row["ts_ist"] = row["ts_ist"] or ""
+                    _insert_trade(conn, row, None)
+                    counts["trades"] += 1
+
+        funds = _read_json(FUNDS_FILE, None)
+        if isinstance(funds, dict) and funds.get("balance") is not None:
+            _insert_funds(conn, funds, funds.get("updated_at_ist"))
+            counts["funds"] = 1
+
+        pos = _read_json(POSITIONS_FILE, None)
+        if isinstance(pos, dict) and all(isinstance(pos.get(k), dict) for k in KINDS):
+            _insert_position(conn, pos, pos.get("opened_at_ist") or _now_ist_str())
+            counts["open_position"] = 1
+
+        conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_import', ?)",
+                     (json.dumps({"at": _now_ist_str(), **counts}),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if any(counts.values()):
+        log.info("imported legacy reports into %s: %s", DB_PATH, counts)
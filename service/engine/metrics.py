@@ -0,0 +1,108 @@
+# service/engine/metrics.py
+"""
+Tiny in-process metrics: counters, gauges and latency histograms.
+Everything is keyed by a dotted name (e.g. "spot.probe_calls") and exposed as
+one JSON snapshot at /api/metrics.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is +inf
+BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_LOCK = threading.Lock()
+_COUNTERS: Dict[str, float] = {}
+_GAUGES: Dict[str, float] = {}
+_HISTS: Dict[str, "_Histogram"] = {}
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, v)] += 1
+        self.count += 1
+        self.total += v
+        self.max = max(self.max, v)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (max for the +inf bucket)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 2) if self.count else None,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": round(self.max, 2),
+            "buckets": {("le_%g" % b): c for b, c in zip(BUCKETS_MS, self.counts)} | {"le_inf": self.counts[-1]},
+        }
+
+
+def inc(name: str, value: float = 1.0) -> None:
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0.0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _LOCK:
+        _GAUGES[name] = float(value)
+
+
+def observe_ms(name: str, ms: float) -> None:
+    with _LOCK:
+        h = _HISTS.get(name)
+        if h is None:
+            h = _HISTS[name] = _Histogram()
+        h.observe(ms)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Record the wall time of the block into histogram `name`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_ms(name, (time.perf_counter() - t0) * 1000.0)
+
+
+def counter(name: str) -> float:
+    with _LOCK:
+        return _COUNTERS.get(name, 0.0)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _LOCK:
+        return {
+            "counters": dict(sorted(_COUNTERS.items())),
+            "gauges": dict(sorted(_GAUGES.items())),
+            "histograms": {k: h.to_dict() for k, h in sorted(_HISTS.items())},
+        }
+
+
+def reset() -> None:
+    with _LOCK:
+        _COUNTERS.clear()
+        _GAUGES.clear()
+        _HISTS.clear()
@@ -0,0 +1,315 @@
+# service/engine/portfolios.py
+"""
+Paper variants run next to the main book in positions.py ("default"), each with
+its own book in the ledger; quotes and marks for all of them share one batched pass.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import ledger, positions, reports, ticks
+from .instruments import pick_monthly_option_symbols
+from .positions import LOT_SIZE, Leg, Position, _calc_used, _position_from
+from .quotes import aget_quotes, get_quotes, quote_key
+from .ratelimit import Priority, priority
+from .utils import ROOT, _read_json
+
+log = logging.getLogger("service.portfolios")
+
+PORTFOLIOS_FILE = ROOT / (os.getenv("PORTFOLIOS_FILE") or "data/portfolios.json")
+
+
+@dataclass
+class Variant:
+    min_confidence: float = 0.0
+    ratio: Optional[Tuple[int, int]] = None   # None -> the scheduler's ratio_for(direction)
+    strike_offset: int = 0                    # points from the ATM strike (multiples of 50)
+    starting_funds: Optional[float] = None    # None -> STARTING_FUNDS
+
+
+@dataclass
+class Portfolio:
+    name: str
+    variant: Variant = field(default_factory=Variant)
+    balance: float = ledger.STARTING_FUNDS
+    realized: float = 0.0
+    used: float = 0.0
+    open: Optional[Position] = None
+
+    def funds(self, mtm: Optional[float] = None) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "balance": round(self.balance, 2),
+            "realized": round(self.realized, 2),
+            "pnl": None if mtm is None else round(mtm, 2),
+            "used": round(self.used, 2),
+            "open": None if not self.open else {
+                "side": self.open.side,
+                "ce": {"symbol": self.open.ce.symbol.get("tradingsymbol"), "lots": self.open.ce.lots,
+                       "entry": self.open.ce.entry},
+                "pe": {"symbol": self.open.pe.symbol.get("tradingsymbol"), "lots": self.open.pe.lots,
+                       "entry": self.open.pe.entry},
+            },
+        }
+
+
+_REGISTRY: Dict[str, Portfolio] = {}
+_LOCK = threading.Lock()
+
+
+# ---------- Registry ----------
+def register(name: str, variant: Optional[Variant] = None) -> Portfolio:
+    """Add (or reconfigure) a variant; its book is restored from the ledger or funded afresh."""
+    return _register(name, variant, None)
+
+
+def _register(name: str, variant: Optional[Variant], states: Optional[Dict[str, Dict[str, Any]]]) -> Portfolio:
+    if name == ledger.DEFAULT_PORTFOLIO:
+        raise ValueError(f"{name!r} is the main book in positions.py")
+    variant = variant or Variant()
+    with _LOCK:
+        pf = _REGISTRY.get(name)
+        if pf is not None:
+            pf.variant = variant
+            return pf
+        st = (ledger.load_states() if states is None else states).get(name)
+        if st is None:
+            start = ledger.STARTING_FUNDS if variant.starting_funds is None else float(variant.starting_funds)
+            ledger.record_funds_change(start, 0.0, 0.0, portfolio=name)
+            st = dict(ledger.initial_state(), balance=start)
+        pf = Portfolio(name=name, variant=variant, balance=float(st["balance"]), realized=float(st["realized"]),
+                       used=float(st["used"]), open=_position_from(st["open"]) if st.get("open") else None)
+        _REGISTRY[name] = pf
+    if pf.open:
+        ticks.watch([pf.open.ce.symbol, pf.open.pe.symbol])
+    return pf
+
+
+def get(name: str) -> Optional[Portfolio]:
+    return _REGISTRY.get(name)
+
+
+def all_portfolios() -> List[Portfolio]:
+    with _LOCK:
+        return list(_REGISTRY.values())
+
+
+def load_config(path: Optional[Path] = None) -> List[str]:
+    """
+    Register every variant in PORTFOLIOS_FILE (missing file: none), a JSON list such as
+      [{"name": "conf60", "min_confidence": 0.6},
+       {"name": "otm100", "strike_offset": 100, "ratio": [1, 1], "starting_funds": 200000}]
+    """
+    names = []
+    items = _read_json(Path(path) if path else PORTFOLIOS_FILE, []) or []
+    states = ledger.load_states() if items else {}
+    for item in items:
+        try:
+            ratio = item.get("ratio")
+            _register(str(item["name"]), Variant(
+                min_confidence=float(item.get("min_confidence") or 0.0),
+                ratio=(int(ratio[0]), int(ratio[1])) if ratio else None,
+                strike_offset=int(item.get("strike_offset") or 0),
+                starting_funds=item.get("starting_funds"),
+            ), states)
+            names.append(str(item["name"]))
+        except Exception as e:
+            log.warning("bad portfolio entry %r: %s", item, e)
+    return names
+
+
+# ---------- Vectorized marks ----------
+class _Books:
+    """Open books as arrays: entry/lots (n, 2) and each leg's column in the union of symbols."""
+
+    def __init__(self, books: Sequence[Tuple[str, Position]]):
+        self.names = [name for name, _ in books]
+        self.symbols: List[Dict[str, str]] = []
+        col: Dict[str, int] = {}
+        idx = np.zeros((len(books), 2), dtype=np.intp)
+        self.entry = np.full((len(books), 2), np.nan)
+        self.lots = np.zeros((len(books), 2))
+        for i, (_, pos) in enumerate(books):
+            for j, leg in enumerate((pos.ce, pos.pe)):
+                key = quote_key(leg.symbol)
+                if key not in col:
+                    col[key] = len(self.symbols)
+                    self.symbols.append(leg.symbol)
+                idx[i, j] = col[key]
+                self.entry[i, j] = np.nan if leg.entry is None else leg.entry
+                self.lots[i, j] = leg.lots
+        self.idx = idx
+
+    def prices(self, quotes: Dict[str, Optional[float]]) -> np.ndarray:
+        """(n, 2) LTPs per book leg; NaN where the quote is missing."""
+        px = np.array([np.nan if quotes.get(quote_key(s)) is None else quotes[quote_key(s)]
+                       for s in self.symbols], dtype=float)
+        return px[self.idx] if len(px) else np.full(self.idx.shape, np.nan)
+
+    def pnl(self, ltp: np.ndarray) -> np.ndarray:
+        """(n, 2) per-leg P&L; a book's MTM is the row sum (NaN if any leg is unpriced)."""
+        return (ltp - self.entry) * self.lots * LOT_SIZE
+
+
+def _open_books(include_default: bool = True) -> List[Tuple[str, Position]]:
+    books = [(pf.name, pf.open) for pf in all_portfolios() if pf.open]
+    main = positions.current_position() if include_default else None
+    if main is not None:
+        books.insert(0, (ledger.DEFAULT_PORTFOLIO, main))
+    return books
+
+
+def _marks(books: _Books, quotes: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    mtm = books.pnl(books.prices(quotes)).sum(axis=1)
+    return {name: (float(v) if np.isfinite(v) else None) for name, v in zip(books.names, mtm)}
+
+
+def mark_all(include_default: bool = True, max_age_s: Optional[float] = None) -> Dict[str, Optional[float]]:
+    """MTM of every open book from one batched quote pass."""
+    books = _Books(_open_books(include_default))
+    if not books.symbols:
+        return {}
+    return _marks(books, get_quotes(books.symbols, max_age_s=max_age_s))
+
+
+async def amark_all(include_default: bool = True, max_age_s: Optional[float] = None) -> Dict[str, Optional[float]]:
+    books = _Books(_open_books(include_default))
+    if not books.symbols:
+        return {}
+    return _marks(books, await aget_quotes(books.symbols, max_age_s=max_age_s))
+
+
+async def afunds_all() -> List[Dict[str, Any]]:
+    """Funds of every variant with MTM (dashboard; UI lane is the caller's)."""
+    marks = await amark_all(include_default=False)
+    out = []
+    for pf in all_portfolios():
+        mtm = marks.get(pf.name)
+        if mtm is not None:
+            reports.submit_funds(pf.balance, pf.realized, pf.used, mtm, portfolio=pf.name)
+        out.append(pf.funds(mtm))
+    return out
+
+
+# ---------- Trading ----------
+def _eligible(confidence: float) -> List[Portfolio]:
+    return [pf for pf in all_portfolios() if pf.open is None and confidence >= pf.variant.min_confidence]
+
+
+async def aopen_all(direction: str, confidence: float, default_ratio: Tuple[int, int]) -> Dict[str, Any]:
+    """
+    Open every flat variant whose confidence threshold is met; one TRADE-lane quote
+    pass for all variant legs (the main book is opened separately by positions.aopen_position).
+    """
+    todo = _eligible(confidence)
+    if not todo:
+        return {}
+    # one option pick per distinct strike offset
+    picks: Dict[int, Tuple[Dict[str, str], Dict[str, str]]] = {}
+    for off in sorted({pf.variant.strike_offset for pf in todo}):
+        ce, _, pe, _ = await asyncio.to_thread(pick_monthly_option_symbols, direction, off)
+        picks[off] = (ce, pe)
+
+    staged = []
+    for pf in todo:
+        ce, pe = picks[pf.variant.strike_offset]
+        lots_ce, lots_pe = pf.variant.ratio or default_ratio
+        staged.append((pf, Position(ce=Leg(symbol=ce, lots=lots_ce), pe=Leg(symbol=pe, lots=lots_pe),
+                                    side=direction, ratio=(lots_ce, lots_pe))))
+    books = _Books([(pf.name, pos) for pf, pos in staged])
+    with priority(Priority.TRADE):
+        ltp = books.prices(await aget_quotes(books.symbols, max_age_s=0))
+
+    out: Dict[str, Any] = {}
+    ready = []
+    for i, (pf, pos) in enumerate(staged):
+        if not np.isfinite(ltp[i]).all():
+            out[pf.name] = {"status": "error", "message": "no LTP for CE/PE"}
+            continue
+        pos.ce.entry, pos.pe.entry = float(ltp[i, 0]), float(ltp[i, 1])
+        ready.append((pf, pos, _calc_used(pos)))
+    if ready:
+        # every variant's position in one commit, off the event loop
+        try:
+            ids = await asyncio.to_thread(ledger.record_opens, [(pf.name, {
+                "side": pos.side,
+                "ce": {"symbol": pos.ce.symbol, "lots": pos.ce.lots, "entry": pos.ce.entry},
+                "pe": {"symbol": pos.pe.symbol, "lots": pos.pe.lots, "entry": pos.pe.entry},
+                "ratio": list(pos.ratio),
+                "used": used,
+            }) for pf, pos, used in ready])
+        except Exception as e:
+            out.update({pf.name: {"status": "error", "message": str(e)} for pf, _, _ in ready})
+            ready, ids = [], []
+        for (pf, pos, used), pid in zip(ready, ids):
+            pos.id = pid
+            pf.open, pf.used = pos, used
+            reports.submit_funds(pf.balance, pf.realized, pf.used, 0.0, portfolio=pf.name)
+            out[pf.name] = {"status": "ok", "entry": {"ce": pos.ce.entry, "pe": pos.pe.entry}, "used": used}
+    ticks.watch(books.symbols)
+    return out
+
+
+async def aclose_all(note: str = "scheduled_squareoff") -> Dict[str, Any]:
+    """Close every open variant at one TRADE-lane quote pass (the main book closes via positions.aclose_position)."""
+    todo = [pf for pf in all_portfolios() if pf.open]
+    if not todo:
+        return {}
+    books = _Books([(pf.name, pf.open) for pf in todo])
+    with priority(Priority.TRADE):
+        ltp = books.prices(await aget_quotes(books.symbols, max_age_s=0))
+    pnl = books.pnl(ltp)
+
+    out: Dict[str, Any] = {}
+    ready = []
+    for i, pf in enumerate(todo):
+        pos = pf.open
+        if not np.isfinite(ltp[i]).all():
+            out[pf.name] = {"status": "error", "message": "no LTP for CE/PE"}
+            continue
+        pnl_ce, pnl_pe = float(pnl[i, 0]), float(pnl[i, 1])
+        pnl_total = pnl_ce + pnl_pe
+        ready.append((pf, pnl_total, {
+            "action": "SQUAREOFF",
+            "symbol_ce": pos.ce.symbol.get("tradingsymbol"),
+            "symbol_pe": pos.pe.symbol.get("tradingsymbol"),
+            "lots_ce": pos.ce.lots,
+            "lots_pe": pos.pe.lots,
+            "entry_ce": pos.ce.entry,
+            "entry_pe": pos.pe.entry,
+            "exit_ce": float(ltp[i, 0]),
+            "exit_pe": float(ltp[i, 1]),
+            "pnl_ce": round(pnl_ce, 2),
+            "pnl_pe": round(pnl_pe, 2),
+            "pnl_total": round(pnl_total, 2),
+            "note": note,
+        }))
+    if ready:
+        # every variant's close in one commit, off the event loop
+        try:
+            await asyncio.to_thread(ledger.record_closes, [
+                (pf.name, pf.open.id, {"ce": trade["exit_ce"], "pe": trade["exit_pe"]}, trade,
+                 pf.balance + pnl_total, pf.realized + pnl_total)
+                for pf, pnl_total, trade in ready])
+        except Exception as e:
+            out.update({pf.name: {"status": "error", "message": str(e)} for pf, _, _ in ready})
+            ready = []
+        for pf, pnl_total, trade in ready:
+            pf.open.ce.exit, pf.open.pe.exit = trade["exit_ce"], trade["exit_pe"]
+            pf.balance += pnl_total
+            pf.realized += pnl_total
+            pf.open, pf.used = None, 0.0
+            reports.submit_funds(pf.balance, pf.realized, pf.used, None, portfolio=pf.name)
+            out[pf.name] = {"status": "ok", "pnl": pnl_total}
+
+    still = {quote_key(s) for _, p in _open_books() for s in (p.ce.symbol, p.pe.symbol)}
+    ticks.unwatch([s for s in books.symbols if quote_key(s) not in still])
+    return out
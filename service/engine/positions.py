@@ -1,11 +1,13 @@
 # service/engine/positions.py
+import asyncio
+import threading
 from dataclasses import dataclass
 from typing import Dict, Optional, Tuple
 
-from .utils import (
-    _write_funds, _write_position_open, _write_position_clear, _append_trade_row
-)
-from .quotes import get_quote
+from . import history, ledger, metrics, reports, risk
+from .quotes import get_quotes, aget_quotes, quote_key, quote_age
+from . import ticks
+from .ratelimit import Priority, priority
 
 LOT_SIZE = 75  # NIFTY monthly lot
 
@@ -22,12 +24,39 @@ class Position:
     pe: Leg
     side: str                 # "UP" or "DOWN"
     ratio: Tuple[int,int]     # (ce, pe) lots ratio ex. (2,1) or (1,2)
+    id: Optional[int] = None  # ledger positions.id
 
-# ---- Funds state in memory (mirrors reports/funds.json) ----
-_balance = 500000.0   # initial virtual balance (paper)
+# ---- Funds state in memory (rebuilt from the ledger journal by restore_state()) ----
+_balance = ledger.STARTING_FUNDS   # initial virtual balance (paper)
 _realized = 0.0
 _used = 0.0
 _open: Optional[Position] = None
+# held across each open/close commit so concurrent callers can't both act on the same book
+_BOOK_LOCK = threading.Lock()
+
+def _position_from(d: Dict) -> Position:
+    return Position(
+        ce=Leg(symbol=d["ce"]["symbol"], lots=int(d["ce"]["lots"]), entry=d["ce"].get("entry")),
+        pe=Leg(symbol=d["pe"]["symbol"], lots=int(d["pe"]["lots"]), entry=d["pe"].get("entry")),
+        side=d["side"],
+        ratio=tuple(d.get("ratio") or (d["ce"]["lots"], d["pe"]["lots"])),
+        id=d.get("id"),
+    )
+
+def current_position() -> Optional[Position]:
+    return _open
+
+def restore_state() -> Dict:
+    """Reload balance/realized/used and any open position after a restart (call once on startup)."""
+    global _open, _balance, _realized, _used
+    st = ledger.load_state()
+    _balance, _realized, _used = float(st["balance"]), float(st["realized"]), float(st["used"])
+    _open = _position_from(st["open"]) if st.get("open") else None
+    if _open:
+        ticks.watch([_open.ce.symbol, _open.pe.symbol])
+        history.get_history().reset(_open.id)   # in-memory only: restarts begin a fresh chart
+    return {"balance": _balance, "realized": _realized, "used": _used,
+            "open": None if not _open else _open.id}
 
 def _calc_used(pos: Position) -> float:
     # Approx used = (entry_price_ce * lots_ce + entry_price_pe * lots_pe) * LOT_SIZE
@@ -35,46 +64,90 @@ def _calc_used(pos: Position) -> float:
     e_pe = pos.pe.entry or 0.0
     return (e_ce * pos.ce.lots + e_pe * pos.pe.lots) * LOT_SIZE
 
+def _leg_ltps(ce_symbol: Dict[str, str], pe_symbol: Dict[str, str],
+              max_age_s: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+    """Both legs in one batched quote call (cached for QUOTE_TTL_S unless max_age_s says otherwise)."""
+    q = get_quotes([ce_symbol, pe_symbol], max_age_s=max_age_s)
+    return q.get(quote_key(ce_symbol)), q.get(quote_key(pe_symbol))
+
+async def _aleg_ltps(ce_symbol: Dict[str, str], pe_symbol: Dict[str, str],
+                     max_age_s: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+    q = await aget_quotes([ce_symbol, pe_symbol], max_age_s=max_age_s)
+    return q.get(quote_key(ce_symbol)), q.get(quote_key(pe_symbol))
+
 def _mtm(pos: Position) -> Optional[float]:
+    return _mtm_at(pos, *_leg_ltps(pos.ce.symbol, pos.pe.symbol))
+
+async def _amtm(pos: Position) -> Optional[float]:
+    return _mtm_at(pos, *await _aleg_ltps(pos.ce.symbol, pos.pe.symbol))
+
+def _mtm_at(pos: Position, l_ce: Optional[float], l_pe: Optional[float]) -> Optional[float]:
     # MTM only when position is open and current LTPs available
     from math import isfinite
-    l_ce = get_quote(pos.ce.symbol)
-    l_pe = get_quote(pos.pe.symbol)
     if l_ce is None or l_pe is None or pos.ce.entry is None or pos.pe.entry is None:
         return None
     pnl = ((l_ce - pos.ce.entry) * pos.ce.lots + (l_pe - pos.pe.entry) * pos.pe.lots) * LOT_SIZE
     return float(pnl) if isfinite(pnl) else None
 
-def _write_funds_snapshot():
-    mtm_val = _mtm(_open) if _open else None
-    _write_funds(_balance, _realized, _used, mtm_val)
+def _risk_at(pos: Position, l_ce: Optional[float], l_pe: Optional[float], spot: Optional[float]) -> Optional[Dict]:
+    # IV/Greeks per leg and net; never fails the funds call
+    try:
+        return risk.legs_risk([("ce", pos.ce.symbol, pos.ce.lots, l_ce), ("pe", pos.pe.symbol, pos.pe.lots, l_pe)],
+                              spot, LOT_SIZE)
+    except Exception:
+        metrics.inc("risk.failures")
+        return None
 
 # ---------- API called by strategy ----------
 def open_position(side: str, ce_symbol: Dict[str,str], pe_symbol: Dict[str,str], ratio: Tuple[int,int]) -> Dict:
     """Open both legs using live LTP as entry."""
+    with priority(Priority.TRADE):
+        ltp_ce, ltp_pe = _leg_ltps(ce_symbol, pe_symbol, max_age_s=0)
+    return _apply_open(side, ce_symbol, pe_symbol, ratio, ltp_ce, ltp_pe)
+
+async def aopen_position(side: str, ce_symbol: Dict[str,str], pe_symbol: Dict[str,str], ratio: Tuple[int,int]) -> Dict:
+    """open_position() for the event loop: quotes are awaited and the ledger write runs on a worker thread."""
+    with priority(Priority.TRADE):
+        ltp_ce, ltp_pe = await _aleg_ltps(ce_symbol, pe_symbol, max_age_s=0)
+    # the ledger commit is blocking SQLite: keep it off the event loop
+    return await asyncio.to_thread(_apply_open, side, ce_symbol, pe_symbol, ratio, ltp_ce, ltp_pe)
+
+def _apply_open(side: str, ce_symbol: Dict[str,str], pe_symbol: Dict[str,str], ratio: Tuple[int,int],
+                ltp_ce: Optional[float], ltp_pe: Optional[float]) -> Dict:
+    with _BOOK_LOCK:
+        return _apply_open_locked(side, ce_symbol, pe_symbol, ratio, ltp_ce, ltp_pe)
+
+def _apply_open_locked(side: str, ce_symbol: Dict[str,str], pe_symbol: Dict[str,str], ratio: Tuple[int,int],
+                       ltp_ce: Optional[float], ltp_pe: Optional[float]) -> Dict:
     global _open, _used
 
     lots_ce, lots_pe = ratio
-    ltp_ce = get_quote(ce_symbol)
-    ltp_pe = get_quote(pe_symbol)
     if ltp_ce is None or ltp_pe is None:
         raise RuntimeError("Failed to fetch LTP for CE/PE while opening position")
 
-    _open = Position(
+    pos = Position(
         ce=Leg(symbol=ce_symbol, lots=lots_ce, entry=float(ltp_ce)),
         pe=Leg(symbol=pe_symbol, lots=lots_pe, entry=float(ltp_pe)),
         side=side,
         ratio=ratio,
     )
-    _used = _calc_used(_open)
-    _write_position_open({
+    used = _calc_used(pos)
+    # position, legs and BUY fills commit together; memory follows the commit
+    pos.id = ledger.record_open({
         "side": side,
-        "ce": {"symbol": ce_symbol, "lots": lots_ce, "entry": _open.ce.entry},
-        "pe": {"symbol": pe_symbol, "lots": lots_pe, "entry": _open.pe.entry},
+        "ce": {"symbol": ce_symbol, "lots": lots_ce, "entry": pos.ce.entry},
+        "pe": {"symbol": pe_symbol, "lots": lots_pe, "entry": pos.pe.entry},
         "ratio": list(ratio),
-        "used": _used,
+        "used": used,
     })
-    _write_funds_snapshot()
+    _open, _used = pos, used
+    ticks.watch([ce_symbol, pe_symbol])
+    mtm = _mtm_at(pos, ltp_ce, ltp_pe)
+    hist = history.get_history()
+    hist.reset(pos.id)
+    hist.record(None, ltp_ce, ltp_pe, mtm, force=True)
+    # funds snapshot goes to the background writer, with the MTM at the entry prices just fetched
+    reports.submit_funds(_balance, _realized, _used, mtm)
     return {
         "status": "ok",
         "entry": {"ce": _open.ce.entry, "pe": _open.pe.entry},
@@ -83,13 +156,33 @@ def open_position(side: str, ce_symbol: Dict[str,str], pe_symbol: Dict[str,str],
 
 def close_position(note: str = "scheduled_squareoff") -> Dict:
     """Close both legs using live LTP as exit and realize P&L."""
-    global _open, _balance, _realized, _used
+    pos = _open
+    if not pos:
+        return {"status": "noop", "message": "no open position"}
+    with priority(Priority.TRADE):
+        ltp_ce, ltp_pe = _leg_ltps(pos.ce.symbol, pos.pe.symbol, max_age_s=0)
+    return _apply_close(note, ltp_ce, ltp_pe, pos)
 
-    if not _open:
+async def aclose_position(note: str = "scheduled_squareoff") -> Dict:
+    """close_position() for the event loop."""
+    pos = _open
+    if not pos:
         return {"status": "noop", "message": "no open position"}
+    with priority(Priority.TRADE):
+        ltp_ce, ltp_pe = await _aleg_ltps(pos.ce.symbol, pos.pe.symbol, max_age_s=0)
+    return await asyncio.to_thread(_apply_close, note, ltp_ce, ltp_pe, pos)
+
+def _apply_close(note: str, ltp_ce: Optional[float], ltp_pe: Optional[float],
+                 pos: Optional[Position] = None) -> Dict:
+    """Realize pos (default: the open position); a noop if another caller closed it while quotes were fetched."""
+    with _BOOK_LOCK:
+        if not _open or (pos is not None and pos is not _open):
+            return {"status": "noop", "message": "no open position"}
+        return _apply_close_locked(note, ltp_ce, ltp_pe)
+
+def _apply_close_locked(note: str, ltp_ce: Optional[float], ltp_pe: Optional[float]) -> Dict:
+    global _open, _balance, _realized, _used
 
-    ltp_ce = get_quote(_open.ce.symbol)
-    ltp_pe = get_quote(_open.pe.symbol)
     if ltp_ce is None or ltp_pe is None:
         raise RuntimeError("Failed to fetch LTP for CE/PE while closing position")
 
@@ -100,10 +193,7 @@ def close_position(note: str = "scheduled_squareoff") -> Dict:
     pnl_pe = (_open.pe.exit - _open.pe.entry) * _open.pe.lots * LOT_SIZE
     pnl_total = float(pnl_ce + pnl_pe)
 
-    _balance += pnl_total
-    _realized += pnl_total
-
-    _append_trade_row({
+    trade = {
         "action": "SQUAREOFF",
         "symbol_ce": _open.ce.symbol.get("tradingsymbol"),
         "symbol_pe": _open.pe.symbol.get("tradingsymbol"),
@@ -117,25 +207,80 @@ def close_position(note: str = "scheduled_squareoff") -> Dict:
         "pnl_pe": round(pnl_pe, 2),
         "pnl_total": round(pnl_total, 2),
         "note": note,
-    })
+    }
+    # leg exits, SELL fills and trade row commit together
+    ledger.record_close(_open.id, {"ce": _open.ce.exit, "pe": _open.pe.exit}, trade,
+                        _balance + pnl_total, _realized + pnl_total)
+    _balance += pnl_total
+    _realized += pnl_total
+    history.get_history().record(None, _open.ce.exit, _open.pe.exit, pnl_total, force=True)
 
+    _unwatch_legs(_open)
     _open = None
     _used = 0.0
-    _write_position_clear()
-    _write_funds_snapshot()
+    reports.submit_funds(_balance, _realized, _used, None)
 
     return {"status": "ok", "pnl": pnl_total}
 
+def _unwatch_legs(pos: Position) -> None:
+    """Stop streaming pos's legs, except those an open paper variant still holds."""
+    from . import portfolios  # imported here: portfolios imports this module
+    still = {quote_key(s) for pf in portfolios.all_portfolios() if pf.open for s in (pf.open.ce.symbol, pf.open.pe.symbol)}
+    ticks.unwatch([s for s in (pos.ce.symbol, pos.pe.symbol) if quote_key(s) not in still])
+
 def funds_snapshot() -> Dict:
-    """Used by API/UI to show Balance, P&L, Used."""
-    mtm_val = _mtm(_open) if _open else None
+    """Used by API/UI to show Balance, P&L, Used (and the open legs' Greeks)."""
+    pos = _open
+    if not pos:
+        return _funds_payload(None)
+    l_ce, l_pe = _leg_ltps(pos.ce.symbol, pos.pe.symbol)
+    return _funds_payload(*_mark(pos, l_ce, l_pe, risk.spot()))
+
+async def afunds_snapshot() -> Dict:
+    """funds_snapshot() for async routes: leg quotes and spot are fetched concurrently."""
+    pos = _open
+    if not pos:
+        return _funds_payload(None)
+    (l_ce, l_pe), spot = await asyncio.gather(_aleg_ltps(pos.ce.symbol, pos.pe.symbol), risk.aspot())
+    return _funds_payload(*_mark(pos, l_ce, l_pe, spot))
+
+def _mark(pos: Position, l_ce: Optional[float], l_pe: Optional[float],
+          spot: Optional[float]) -> Tuple[Optional[float], Optional[Dict]]:
+    # MTM and Greeks at these quotes; the sample also feeds the intraday MTM history
+    mtm_val = _mtm_at(pos, l_ce, l_pe)
+    if pos is _open:
+        history.get_history().record(spot, l_ce, l_pe, mtm_val)
+    return mtm_val, _risk_at(pos, l_ce, l_pe, spot)
+
+def risk_snapshot() -> Optional[Dict]:
+    """IV and Greeks of the open position's legs (None when flat)."""
+    pos = _open
+    if not pos:
+        return None
+    return _risk_at(pos, *_leg_ltps(pos.ce.symbol, pos.pe.symbol), risk.spot())
+
+async def arisk_snapshot() -> Optional[Dict]:
+    pos = _open
+    if not pos:
+        return None
+    (l_ce, l_pe), spot = await asyncio.gather(_aleg_ltps(pos.ce.symbol, pos.pe.symbol), risk.aspot())
+    return _risk_at(pos, l_ce, l_pe, spot)
+
+def _funds_payload(mtm_val: Optional[float], greeks: Optional[Dict] = None) -> Dict:
+    if mtm_val is not None:
+        # the dashboard's MTM doubles as a persisted mark (debounced by the writer)
+        reports.submit_funds(_balance, _realized, _used, mtm_val)
+    ages = [quote_age(_open.ce.symbol), quote_age(_open.pe.symbol)] if _open else []
     return {
         "balance": round(_balance, 2),
         "pnl": None if mtm_val is None else round(mtm_val, 2),
+        # age (s) of the older leg quote behind pnl
+        "quote_age_s": None if not ages or None in ages else round(max(ages), 2),
         "used": "-" if _used == 0 else round(_used, 2),
         "open": None if not _open else {
             "side": _open.side,
             "ce": {"symbol": _open.ce.symbol.get("tradingsymbol"), "lots": _open.ce.lots, "entry": _open.ce.entry},
             "pe": {"symbol": _open.pe.symbol.get("tradingsymbol"), "lots": _open.pe.lots, "entry": _open.pe.entry},
-        }
+        },
+        "greeks": greeks,
     }
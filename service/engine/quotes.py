@@ -1,91 +1,59 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import time
 import json
 import logging
-from typing import Optional, Dict, Any
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterable, List, Tuple
 
-import requests
-import pyotp
+from . import metrics, ticks
+from .instruments import IST, INSTR_JSON, instruments_version
+from .ratelimit import RateLimited
+from .session import base_url, get_session, headers as _headers
+from .transport import get_transport, get_async_transport
 
 log = logging.getLogger("service.quotes")
-BASE = "https://apiconnect.angelone.in"
-
-# Cache session (simple)
-_SESSION: Dict[str, Any] = {"jwt": None, "expiry": 0.0}
-
-def _now() -> float:
-    return time.time()
-
-def _env(name: str, default: str = "") -> str:
-    v = os.getenv(name, default)
-    return v if v is not None else default
-
-def _headers(jwt: Optional[str] = None) -> Dict[str, str]:
-    # Angel expects these client headers
-    h = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "X-SourceID": "WEB",
-        "X-ClientType": "USER",
-        "X-ClientLocalIP": _env("SMARTAPI_LOCAL_IP", "127.0.0.1"),
-        "X-ClientPublicIP": _env("SMARTAPI_PUBLIC_IP", "127.0.0.1"),
-        "X-MACAddress": _env("SMARTAPI_MAC", "AA:BB:CC:DD:EE:FF"),
-        "X-PrivateKey": _env("SMARTAPI_API_KEY", ""),
-    }
-    if jwt:
-        h["Authorization"] = f"Bearer {jwt}"
-    return h
 
-def _ensure_session() -> str:
-    """Login (TOTP) if our cached JWT is missing/expired."""
-    if _SESSION["jwt"] and _SESSION["expiry"] > _now() + 15:
-        return _SESSION["jwt"]
+# Market quote endpoint accepts at most this many tokens per request
+MARKET_QUOTE_MAX = 50
+MARKET_QUOTE_MODES = ("LTP", "OHLC", "FULL")
 
-    api_key = _env("SMARTAPI_API_KEY")
-    client_code = _env("SMARTAPI_CLIENT_CODE")
-    pin = _env("SMARTAPI_PIN")
-    totp_secret = _env("SMARTAPI_TOTP_SECRET")
+# LTP cache in front of REST: dashboard polls within QUOTE_TTL_S share one fetch,
+# and concurrent misses for a token coalesce onto a single in-flight request.
+# Both are keyed by (exchange, quote_key): tokens are only unique within a segment.
+QUOTE_TTL_S = 3.0          # matches the dashboard's refreshFunds() interval
+_QCACHE: Dict[Tuple[str, str], Tuple[float, float]] = {}   # (exchange, quote_key) -> (ltp, monotonic fetch time)
+_INFLIGHT: Dict[Tuple[str, str], "_Flight"] = {}
+_QLOCK = threading.Lock()
 
-    if not (api_key and client_code and pin and totp_secret):
-        raise RuntimeError("SMARTAPI_* env vars are not fully set (API_KEY, CLIENT_CODE, PIN, TOTP_SECRET)")
+# Corrected (exchange, tradingsymbol) -> (tradingsymbol, token) found by searchScrip,
+# persisted next to the instruments file and dropped when that file changes
+_RESOLVED: Dict[str, Any] = {"version": None, "loaded": False, "symbols": {}}
+_RESOLVED_LOCK = threading.Lock()
 
-    # TOTP
-    otp = pyotp.TOTP(totp_secret).now()
-    payload = {
-        "clientcode": client_code,
-        "password": pin,
-        "totp": otp,
-    }
-    url = f"{BASE}/rest/auth/angelbroking/user/v1/loginByPassword"
-    r = requests.post(url, headers=_headers(), data=json.dumps(payload), timeout=10)
-    try:
-        data = r.json()
-    except Exception:
-        raise RuntimeError(f"SmartAPI login failed: HTTP {r.status_code} {r.text[:200]}")
+def _ensure_session() -> str:
+    """JWT from the shared session manager (kept fresh in the background)."""
+    return get_session().token()
 
-    if not data.get("status"):
-        raise RuntimeError(f"SmartAPI login failed: {data}")
+async def _aensure_session() -> str:
+    return await get_session().atoken()
 
-    jwt = data["data"]["jwtToken"]
-    # Session is usually short; refresh proactively in ~10 minutes
-    _SESSION["jwt"] = jwt
-    _SESSION["expiry"] = _now() + 600.0
-    log.info("SmartAPI login OK for %s", client_code)
-    return jwt
+# ---------- Requests / parsers (shared by the sync and async clients) ----------
+def _search_request(exchange: str, query: str) -> Tuple[str, Dict[str, Any]]:
+    url = f"{base_url()}/rest/secure/angelbroking/order/v1/searchScrip"
+    # Angel docs show both 'symbol' and 'searchsymbol' in different places; try both server-side.
+    # The backend accepts 'searchsymbol'.
+    return url, {"exchange": exchange, "searchsymbol": query}
 
-def _search_scrip(jwt: str, exchange: str, query: str) -> Optional[Dict[str, str]]:
+def _pick_search_hit(data: Dict[str, Any], exchange: str, query: str) -> Optional[Dict[str, str]]:
     """
     Best-effort token discovery. Returns first hit that has a symboltoken and tradingsymbol.
     We match 'tradingsymbol' EXACTLY first; otherwise return top hit from the exchange.
     """
-    url = f"{BASE}/rest/secure/angelbroking/order/v1/searchScrip"
-    # Angel docs show both 'symbol' and 'searchsymbol' in different places; try both server-side.
-    # The backend accepts 'searchsymbol'.
-    payload = {"exchange": exchange, "searchsymbol": query}
-    r = requests.post(url, headers=_headers(jwt), data=json.dumps(payload), timeout=10)
-    data = r.json()
     if not data.get("status"):
         log.warning("searchScrip failed: %s", data)
         return None
@@ -108,15 +76,15 @@ def _search_scrip(jwt: str, exchange: str, query: str) -> Optional[Dict[str, str
     # Fallback to first item
     return items[0]
 
-def _ltp(jwt: str, exchange: str, tradingsymbol: str, symboltoken: str) -> Optional[float]:
-    url = f"{BASE}/rest/secure/angelbroking/order/v1/getLtpData"
-    payload = {
+def _ltp_request(exchange: str, tradingsymbol: str, symboltoken: str) -> Tuple[str, Dict[str, Any]]:
+    url = f"{base_url()}/rest/secure/angelbroking/order/v1/getLtpData"
+    return url, {
         "exchange": exchange,
         "tradingsymbol": tradingsymbol,
         "symboltoken": str(symboltoken),
     }
-    r = requests.post(url, headers=_headers(jwt), data=json.dumps(payload), timeout=10)
-    data = r.json()
+
+def _parse_ltp(data: Dict[str, Any], exchange: str, tradingsymbol: str, symboltoken: str) -> Optional[float]:
     if data.get("status") and data.get("data"):
         try:
             return float(data["data"]["ltp"])
@@ -125,37 +93,516 @@ def _ltp(jwt: str, exchange: str, tradingsymbol: str, symboltoken: str) -> Optio
     log.warning("getLtpData failed for %s/%s token=%s -> %s", exchange, tradingsymbol, symboltoken, data)
     return None
 
-def get_quote(symbol: Dict[str, Any]) -> Optional[float]:
+def _market_quote_request(mode: str, exchange_tokens: Dict[str, List[str]]) -> Tuple[str, Dict[str, Any]]:
+    url = f"{base_url()}/rest/secure/angelbroking/market/v1/quote/"
+    return url, {"mode": mode, "exchangeTokens": exchange_tokens}
+
+def _parse_market_quote(data: Dict[str, Any], exchange_tokens: Dict[str, List[str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Fetched rows keyed by (exchange, token)."""
+    if not data.get("status") or not data.get("data"):
+        log.warning("market quote failed for %s -> %s", exchange_tokens, data)
+        return {}
+    out: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for row in data["data"].get("fetched") or []:
+        ex = (row.get("exchange") or "").upper()
+        tok = str(row.get("symbolToken") or row.get("symboltoken") or "")
+        out[(ex, tok)] = row
+    return out
+
+def _market_quote_chunks(wanted: Dict[str, Tuple[str, str, str]]) -> List[Dict[str, List[str]]]:
+    """exchangeTokens payloads of at most MARKET_QUOTE_MAX tokens each."""
+    with_token = [(ex, tok) for ex, _, tok in wanted.values() if tok]
+    chunks = []
+    for i in range(0, len(with_token), MARKET_QUOTE_MAX):
+        chunk: Dict[str, List[str]] = {}
+        for ex, tok in with_token[i:i + MARKET_QUOTE_MAX]:
+            chunk.setdefault(ex, []).append(tok)
+        chunks.append(chunk)
+    return chunks
+
+def _assemble_quotes(wanted: Dict[str, Tuple[str, str, str]], fetched: Dict[Tuple[str, str], Dict[str, Any]],
+                     mode: str) -> Tuple[Dict[str, Any], List[str]]:
+    """Results for keys the market-quote endpoint returned, plus the keys that need the search fallback."""
+    out: Dict[str, Any] = {}
+    misses: List[str] = []
+    for key, (exchange, ts, token) in wanted.items():
+        row = fetched.get((exchange, token)) if token else None
+        if row is not None:
+            if mode != "LTP":
+                out[key] = row
+                continue
+            try:
+                out[key] = float(row["ltp"])
+                continue
+            except Exception:
+                pass
+        misses.append(key)
+    return out, misses
+
+def _fallback_value(mode: str, exchange: str, ts: str, price: Optional[float]) -> Any:
+    if mode == "LTP":
+        return price
+    return None if price is None else {"exchange": exchange, "tradingSymbol": ts, "ltp": price}
+
+def _symbol_fields(symbol: Dict[str, Any]) -> Tuple[str, str, str]:
+    exchange = (symbol.get("exchange") or symbol.get("exch_seg") or "").upper()
+    ts = (symbol.get("tradingsymbol") or symbol.get("symbol") or "").upper()
+    token = str(symbol.get("symboltoken") or symbol.get("token") or "").strip()
+    return exchange, ts, token
+
+def quote_key(symbol: Dict[str, Any]) -> str:
+    """Key used in get_quotes() results: the symbol token, or the tradingsymbol when no token is known."""
+    _, ts, token = _symbol_fields(symbol)
+    return token or ts
+
+def _wanted(symbols: Iterable[Dict[str, Any]], mode: str, caller: str) -> Dict[str, Tuple[str, str, str]]:
+    if mode not in MARKET_QUOTE_MODES:
+        raise ValueError(f"mode must be one of {MARKET_QUOTE_MODES}, got {mode!r}")
+    wanted: Dict[str, Tuple[str, str, str]] = {}
+    for sym in symbols:
+        exchange, ts, token = _symbol_fields(sym)
+        if not exchange or not ts:
+            log.error("%s missing exchange/tradingsymbol: %r", caller, sym)
+            continue
+        wanted.setdefault(token or ts, (exchange, ts, token))
+    return wanted
+
+# ---------- Token resolution cache ----------
+def _resolved_path() -> Path:
+    return INSTR_JSON.with_name("resolved_tokens.json")
+
+def _resolved_symbols() -> Dict[str, List[str]]:
+    """The resolution map for the current instruments version (loaded from disk once per version)."""
+    version = instruments_version()
+    if _RESOLVED["loaded"] and _RESOLVED["version"] == version:
+        return _RESOLVED["symbols"]
+    with _RESOLVED_LOCK:
+        symbols: Dict[str, List[str]] = {}
+        try:
+            d = json.loads(_resolved_path().read_text(encoding="utf-8"))
+            if d.get("version") == version:
+                symbols = d.get("symbols") or {}
+        except Exception:
+            pass
+        _RESOLVED.update(version=version, loaded=True, symbols=symbols)
+        return symbols
+
+def _save_resolved() -> None:
+    payload = {
+        "version": _RESOLVED["version"],
+        "saved_at_ist": datetime.now(tz=IST).strftime("%Y-%m-%d %H:%M:%S"),
+        "symbols": _RESOLVED["symbols"],
+    }
+    try:
+        path = _resolved_path()
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        tmp.replace(path)
+    except Exception as e:
+        log.warning("failed to save token resolution cache: %s", e)
+
+def _resolve(exchange: str, ts: str, token: str) -> Tuple[str, str, str]:
+    """(exchange, tradingsymbol, token) to quote with: the searched correction if we have one."""
+    try:
+        hit = _resolved_symbols().get(f"{exchange}|{ts}")
+    except Exception:
+        return exchange, ts, token
+    if not hit:
+        return exchange, ts, token
+    metrics.inc("quotes.resolve_hits")
+    return exchange, hit[0], hit[1]
+
+def _remember_resolution(exchange: str, ts: str, new_ts: str, new_tok: str) -> None:
+    try:
+        symbols = _resolved_symbols()
+    except Exception:
+        return
+    key = f"{exchange}|{ts}"
+    with _RESOLVED_LOCK:
+        if symbols.get(key) == [new_ts, new_tok]:
+            return
+        symbols[key] = [new_ts, new_tok]
+        _save_resolved()
+    metrics.inc("quotes.resolve_stores")
+
+def _forget_resolution(exchange: str, ts: str) -> None:
+    symbols = _RESOLVED["symbols"]
+    with _RESOLVED_LOCK:
+        if symbols.pop(f"{exchange}|{ts}", None) is not None:
+            _save_resolved()
+
+def _searched_triple(found: Optional[Dict[str, str]], ts: str, token: str) -> Optional[Tuple[str, str]]:
+    if not found:
+        return None
+    new_ts = (found.get("tradingsymbol") or found.get("symbol") or ts).upper()
+    new_tok = str(found.get("symboltoken") or found.get("token") or token)
+    return (new_ts, new_tok) if new_tok else None
+
+# ---------- Sync client ----------
+def _post_json(endpoint: str, jwt: Optional[str], req: Tuple[str, Dict[str, Any]]) -> Dict[str, Any]:
+    url, payload = req
+    return get_transport().post(endpoint, url, headers=_headers(jwt), data=json.dumps(payload)).json()
+
+def _search_scrip(jwt: str, exchange: str, query: str) -> Optional[Dict[str, str]]:
+    return _pick_search_hit(_post_json("search", jwt, _search_request(exchange, query)), exchange, query)
+
+def _ltp(jwt: str, exchange: str, tradingsymbol: str, symboltoken: str) -> Optional[float]:
+    data = _post_json("ltp", jwt, _ltp_request(exchange, tradingsymbol, symboltoken))
+    return _parse_ltp(data, exchange, tradingsymbol, symboltoken)
+
+def _market_quote(jwt: str, mode: str, exchange_tokens: Dict[str, List[str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """One market-quote request; returns fetched rows keyed by (exchange, token)."""
+    data = _post_json("quote", jwt, _market_quote_request(mode, exchange_tokens))
+    return _parse_market_quote(data, exchange_tokens)
+
+def _ltp_via_search(jwt: str, exchange: str, ts: str, token: str) -> Optional[float]:
+    """Discover the token with searchScrip, retry getLtpData and remember the correction."""
+    _forget_resolution(exchange, ts)
+    fixed = _searched_triple(_search_scrip(jwt, exchange, ts), ts, token)
+    if not fixed:
+        return None
+    price = _ltp(jwt, exchange, *fixed)
+    if price is not None:
+        _remember_resolution(exchange, ts, *fixed)
+    return price
+
+# ---------- Async client ----------
+async def _apost_json(endpoint: str, jwt: Optional[str], req: Tuple[str, Dict[str, Any]]) -> Dict[str, Any]:
+    url, payload = req
+    r = await get_async_transport().post(endpoint, url, headers=_headers(jwt), data=json.dumps(payload))
+    return r.json()
+
+async def _asearch_scrip(jwt: str, exchange: str, query: str) -> Optional[Dict[str, str]]:
+    return _pick_search_hit(await _apost_json("search", jwt, _search_request(exchange, query)), exchange, query)
+
+async def _altp(jwt: str, exchange: str, tradingsymbol: str, symboltoken: str) -> Optional[float]:
+    data = await _apost_json("ltp", jwt, _ltp_request(exchange, tradingsymbol, symboltoken))
+    return _parse_ltp(data, exchange, tradingsymbol, symboltoken)
+
+async def _amarket_quote(jwt: str, mode: str, exchange_tokens: Dict[str, List[str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    data = await _apost_json("quote", jwt, _market_quote_request(mode, exchange_tokens))
+    return _parse_market_quote(data, exchange_tokens)
+
+async def _altp_via_search(jwt: str, exchange: str, ts: str, token: str) -> Optional[float]:
+    _forget_resolution(exchange, ts)
+    fixed = _searched_triple(await _asearch_scrip(jwt, exchange, ts), ts, token)
+    if not fixed:
+        return None
+    price = await _altp(jwt, exchange, *fixed)
+    if price is not None:
+        _remember_resolution(exchange, ts, *fixed)
+    return price
+
+# ---------- LTP cache / single-flight ----------
+def _resolve_future(fut: "asyncio.Future", result: Optional[float]) -> None:
+    if not fut.done():
+        fut.set_result(result)
+
+class _Flight:
+    """One in-flight fetch; thread callers wait on `done`, event-loop callers on a future."""
+    __slots__ = ("done", "result", "fresh", "_waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[float] = None
+        self.fresh = True  # False when the fetching caller was rate-limited and served stale
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future"]] = []
+
+    def finish(self, result: Optional[float], fresh: bool = True) -> None:
+        # called with _QLOCK held
+        self.result = result
+        self.fresh = fresh
+        self.done.set()
+        for loop, fut in self._waiters:
+            loop.call_soon_threadsafe(_resolve_future, fut, result)
+
+    async def wait_async(self, timeout: float) -> Optional[float]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with _QLOCK:
+            if self.done.is_set():
+                return self.result
+            self._waiters.append((loop, fut))
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return self.result
+
+def _quote_ttl() -> float:
+    try:
+        return float(os.getenv("QUOTE_TTL_S", "") or QUOTE_TTL_S)
+    except ValueError:
+        return QUOTE_TTL_S
+
+def _cache_key(key: str, fields: Tuple[str, str, str]) -> Tuple[str, str]:
+    """_QCACHE/_INFLIGHT key of a wanted entry: (exchange, quote_key)."""
+    return fields[0], key
+
+def _claim(wanted: Dict[str, Tuple[str, str, str]], max_age_s: Optional[float]):
+    """
+    Split keys into cache hits, misses this caller must fetch, and misses
+    someone else is already fetching.
+    """
+    ttl = _quote_ttl() if max_age_s is None else max_age_s
+    now = time.monotonic()
+    out: Dict[str, Optional[float]] = {}
+    mine: Dict[str, Tuple[str, str, str]] = {}
+    theirs: Dict[str, _Flight] = {}
+    with _QLOCK:
+        for key, fields in wanted.items():
+            ck = _cache_key(key, fields)
+            hit = _QCACHE.get(ck)
+            if hit is not None and now - hit[1] <= ttl:
+                out[key] = hit[0]
+            elif ck in _INFLIGHT:
+                theirs[key] = _INFLIGHT[ck]
+            else:
+                _INFLIGHT[ck] = _Flight()
+                mine[key] = fields
+    if out:
+        metrics.inc("quotes.cache_hits", len(out))
+    if mine:
+        metrics.inc("quotes.cache_misses", len(mine))
+    if theirs:
+        metrics.inc("quotes.coalesced", len(theirs))
+    return out, mine, theirs
+
+def _publish(mine: Dict[str, Tuple[str, str, str]], got: Dict[str, Optional[float]], fresh: bool = True) -> None:
+    fetched_at = time.monotonic()
+    with _QLOCK:
+        for key, fields in mine.items():
+            ck = _cache_key(key, fields)
+            price = got.get(key)
+            if price is not None and fresh:
+                _QCACHE[ck] = (price, fetched_at)
+            _INFLIGHT.pop(ck).finish(price, fresh)
+
+def _stale(mine: Dict[str, Tuple[str, str, str]]) -> Dict[str, Optional[float]]:
+    """Rate-limited: whatever the cache still holds, however old (quote_age shows how old)."""
+    with _QLOCK:
+        hits = {k: _QCACHE.get(_cache_key(k, f)) for k, f in mine.items()}
+        got = {k: hit[0] for k, hit in hits.items() if hit is not None}
+    metrics.inc("quotes.served_stale", len(got))
+    return got
+
+def _cached_ltps(wanted: Dict[str, Tuple[str, str, str]], max_age_s: Optional[float],
+                 fetch: Callable[[Dict[str, Tuple[str, str, str]]], Dict[str, Optional[float]]]) -> Dict[str, Optional[float]]:
+    """
+    Serve keys from the LTP cache when younger than max_age_s (default QUOTE_TTL_S).
+    Misses are claimed under the lock: this caller fetches the keys nobody else
+    is fetching (in one fetch() call) and waits for the rest.
+    """
+    out, mine, theirs = _claim(wanted, max_age_s)
+    if mine:
+        got: Dict[str, Optional[float]] = {}
+        fresh = True
+        try:
+            got = fetch(mine)
+        except RateLimited:
+            got, fresh = _stale(mine), False
+        finally:
+            _publish(mine, got, fresh)
+        out.update({k: got.get(k) for k in mine})
+    retry: Dict[str, Tuple[str, str, str]] = {}
+    for key, flight in theirs.items():
+        flight.done.wait(timeout=30.0)
+        out[key] = flight.result
+        if not flight.fresh:
+            retry[key] = wanted[key]
+    if retry:
+        # the fetching caller was shed (lower lane); try again under our own lane
+        try:
+            out.update(fetch(retry))
+        except RateLimited:
+            pass
+    return out
+
+async def _acached_ltps(wanted: Dict[str, Tuple[str, str, str]], max_age_s: Optional[float],
+                        fetch: Callable[[Dict[str, Tuple[str, str, str]]], Awaitable[Dict[str, Optional[float]]]]) -> Dict[str, Optional[float]]:
+    """Async twin of _cached_ltps(); shares the same cache and in-flight table."""
+    out, mine, theirs = _claim(wanted, max_age_s)
+    if mine:
+        got: Dict[str, Optional[float]] = {}
+        fresh = True
+        try:
+            got = await fetch(mine)
+        except RateLimited:
+            got, fresh = _stale(mine), False
+        finally:
+            _publish(mine, got, fresh)
+        out.update({k: got.get(k) for k in mine})
+    retry: Dict[str, Tuple[str, str, str]] = {}
+    for key, flight in theirs.items():
+        out[key] = await flight.wait_async(timeout=30.0)
+        if not flight.fresh:
+            retry[key] = wanted[key]
+    if retry:
+        try:
+            out.update(await fetch(retry))
+        except RateLimited:
+            pass
+    return out
+
+def _tick_ltps(wanted: Dict[str, Tuple[str, str, str]]) -> Dict[str, Optional[float]]:
+    """Pop keys that have a fresh tick from the streaming feed and return their LTPs."""
+    out: Dict[str, Optional[float]] = {}
+    for key, (exchange, _, token) in list(wanted.items()):
+        price = ticks.fresh_ltp(exchange, token)
+        if price is not None:
+            out[key] = price
+            del wanted[key]
+    if out:
+        metrics.inc("quotes.tick_hits", len(out))
+    return out
+
+def quote_age(symbol: Dict[str, Any]) -> Optional[float]:
+    """Seconds since the LTP served for this symbol was observed (tick or REST), None if never."""
+    exchange, ts, token = _symbol_fields(symbol)
+    ages = []
+    hit = _QCACHE.get((exchange, token or ts))
+    if hit is not None:
+        ages.append(time.monotonic() - hit[1])
+    tick = ticks.last_tick(exchange, token)
+    if tick is not None:
+        ages.append(tick[1])
+    return min(ages) if ages else None
+
+# ---------- Public API ----------
+def get_quotes(symbols: Iterable[Dict[str, Any]], mode: str = "LTP",
+               max_age_s: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Batched quotes for many symbols in as few round trips as possible.
+    Symbols use the same dict shape as get_quote(). Results are keyed by
+    quote_key(symbol) (the token): in LTP mode each value is a float LTP or None;
+    in OHLC/FULL mode it is the raw market-quote row (or None).
+    Tokens the market-quote endpoint does not return fall back, one by one, to
+    the searchScrip + getLtpData path (OHLC/FULL misses then carry only "ltp").
+    In LTP mode, tokens with a fresh tick from the streaming feed skip REST and
+    REST prices are cached for max_age_s (default QUOTE_TTL_S; pass 0 to force
+    a fetch) with concurrent misses coalesced.
+    """
+    mode = mode.upper()
+    wanted = _wanted(symbols, mode, "get_quotes")
+    if mode != "LTP":
+        return _fetch_quotes(wanted, mode) if wanted else {}
+    out = _tick_ltps(wanted)
+    if wanted:
+        out.update(_cached_ltps(wanted, max_age_s, lambda miss: _fetch_quotes(miss, mode)))
+    return out
+
+def _fetch_quotes(wanted: Dict[str, Tuple[str, str, str]], mode: str) -> Dict[str, Any]:
+    jwt = _ensure_session()
+    effective = {k: _resolve(*f) for k, f in wanted.items()}
+
+    # 1) Market-quote endpoint, chunked to the per-request limit
+    fetched: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for chunk in _market_quote_chunks(effective):
+        try:
+            fetched.update(_market_quote(jwt, mode, chunk))
+        except RateLimited:
+            raise
+        except Exception as e:
+            log.warning("market quote batch failed (%s); falling back per symbol", e)
+    out, misses = _assemble_quotes(effective, fetched, mode)
+
+    # 2) Miss: discover the token with search and retry
+    for key in misses:
+        exchange, ts, token = wanted[key]
+        out[key] = _fallback_value(mode, exchange, ts, _ltp_via_search(jwt, exchange, ts, token))
+    return out
+
+def get_quote(symbol: Dict[str, Any], max_age_s: Optional[float] = None) -> Optional[float]:
     """
     Unified entry used by the rest of the app.
     Expects a dict with at least:
         {'exchange': 'NFO'|'NSE', 'tradingsymbol': '...', 'symboltoken': '...'}
-    Returns float LTP or None.
+    Returns float LTP or None. Served from the LTP cache when younger than
+    max_age_s (default QUOTE_TTL_S).
     """
-    exchange = (symbol.get("exchange") or symbol.get("exch_seg") or "").upper()
-    ts = (symbol.get("tradingsymbol") or symbol.get("symbol") or "").upper()
-    token = str(symbol.get("symboltoken") or symbol.get("token") or "").strip()
+    exchange, ts, token = _symbol_fields(symbol)
 
     if not exchange or not ts:
         log.error("get_quote missing exchange/tradingsymbol: %r", symbol)
         return None
 
+    # 0) Fresh tick from the streaming feed (SMARTAPI_WS=1)
+    price = ticks.fresh_ltp(exchange, token)
+    if price is not None:
+        metrics.inc("quotes.tick_hits")
+        return price
+
+    key = token or ts
+    return _cached_ltps({key: (exchange, ts, token)}, max_age_s,
+                        lambda miss: {key: _fetch_ltp(exchange, ts, token)})[key]
+
+def _fetch_ltp(exchange: str, ts: str, token: str) -> Optional[float]:
     jwt = _ensure_session()
 
-    # 1) Try direct (what we prefer)
-    if token:
-        price = _ltp(jwt, exchange, ts, token)
+    # 1) Try direct (what we prefer), with the searched token if this symbol needed one before
+    _, q_ts, q_tok = _resolve(exchange, ts, token)
+    if q_tok:
+        price = _ltp(jwt, exchange, q_ts, q_tok)
         if price is not None:
             return price
 
     # 2) Discover token with search and retry
-    found = _search_scrip(jwt, exchange, ts)
-    if found:
-        new_ts = (found.get("tradingsymbol") or found.get("symbol") or ts).upper()
-        new_tok = str(found.get("symboltoken") or found.get("token") or token)
-        if new_tok:
-            price = _ltp(jwt, exchange, new_ts, new_tok)
-            if price is not None:
-                return price
+    return _ltp_via_search(jwt, exchange, ts, token)
 
-    return None
+# ---------- Public async API (for the event loop: scheduler jobs, async routes) ----------
+async def aget_quotes(symbols: Iterable[Dict[str, Any]], mode: str = "LTP",
+                      max_age_s: Optional[float] = None) -> Dict[str, Any]:
+    """Async get_quotes(): same batching, fallback, tick and cache semantics, on httpx."""
+    mode = mode.upper()
+    wanted = _wanted(symbols, mode, "aget_quotes")
+    if mode != "LTP":
+        return await _afetch_quotes(wanted, mode) if wanted else {}
+    out = _tick_ltps(wanted)
+    if wanted:
+        out.update(await _acached_ltps(wanted, max_age_s, lambda miss: _afetch_quotes(miss, mode)))
+    return out
+
+async def _afetch_quotes(wanted: Dict[str, Tuple[str, str, str]], mode: str) -> Dict[str, Any]:
+    jwt = await _aensure_session()
+    effective = {k: _resolve(*f) for k, f in wanted.items()}
+
+    chunks = _market_quote_chunks(effective)
+    fetched: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for res in await asyncio.gather(*(_amarket_quote(jwt, mode, c) for c in chunks), return_exceptions=True):
+        if isinstance(res, RateLimited):
+            raise res
+        if isinstance(res, BaseException):
+            log.warning("market quote batch failed (%s); falling back per symbol", res)
+        else:
+            fetched.update(res)
+    out, misses = _assemble_quotes(effective, fetched, mode)
+
+    prices = await asyncio.gather(*(_altp_via_search(jwt, *wanted[k]) for k in misses))
+    for key, price in zip(misses, prices):
+        exchange, ts, _ = wanted[key]
+        out[key] = _fallback_value(mode, exchange, ts, price)
+    return out
+
+async def aget_quote(symbol: Dict[str, Any], max_age_s: Optional[float] = None) -> Optional[float]:
+    """Async get_quote()."""
+    exchange, ts, token = _symbol_fields(symbol)
+
+    if not exchange or not ts:
+        log.error("aget_quote missing exchange/tradingsymbol: %r", symbol)
+        return None
+
+    price = ticks.fresh_ltp(exchange, token)
+    if price is not None:
+        metrics.inc("quotes.tick_hits")
+        return price
+
+    key = token or ts
+
+    async def fetch(miss):
+        jwt = await _aensure_session()
+        _, q_ts, q_tok = _resolve(exchange, ts, token)
+        price = await _altp(jwt, exchange, q_ts, q_tok) if q_tok else None
+        if price is None:
+            price = await _altp_via_search(jwt, exchange, ts, token)
+        return {key: price}
+
+    return (await _acached_ltps({key: (exchange, ts, token)}, max_age_s, fetch))[key]
@@ -0,0 +1,150 @@
+# service/engine/ratelimit.py
+"""
+Client-side SmartAPI rate limiting: one token bucket per endpoint, shared by
+the TRADE, MTM and UI priority lanes. A call that cannot get a token within
+its lane's budget raises RateLimited.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, Iterator, Optional, Tuple
+
+from . import metrics
+
+
+class Priority(IntEnum):
+    TRADE = 0
+    MTM = 1
+    UI = 2
+
+
+class RateLimited(RuntimeError):
+    """No token available for this endpoint within the caller's lane budget."""
+
+
+# Angel's published per-second limits for the endpoints we call; others are not throttled
+DEFAULT_RATES: Dict[str, float] = {"ltp": 10.0, "quote": 10.0, "search": 1.0}
+
+# Per lane: (fraction of the burst kept for higher lanes, max seconds to wait for a token).
+# TRADE is entry/exit quotes, MTM background marking (the default), UI dashboard polls.
+LANES: Dict[Priority, Tuple[float, float]] = {
+    Priority.TRADE: (0.0, 10.0),
+    Priority.MTM: (0.2, 1.0),
+    Priority.UI: (0.5, 0.0),
+}
+
+# A contextvar, so the lane follows the call through asyncio tasks and asyncio.to_thread
+_PRIORITY: contextvars.ContextVar[Priority] = contextvars.ContextVar("smartapi_priority", default=Priority.MTM)
+
+
+def current_priority() -> Priority:
+    return _PRIORITY.get()
+
+
+@contextmanager
+def priority(lane: Priority) -> Iterator[None]:
+    """Run the block (and anything it awaits or hands to to_thread) in `lane`."""
+    tok = _PRIORITY.set(lane)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(tok)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(2.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self, floor: float) -> float:
+        """Take one token if that leaves at least `floor`; else seconds until it would."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens - 1.0 >= floor - 1e-9:
+                self.tokens -= 1.0
+                return 0.0
+            return (floor + 1.0 - self.tokens) / self.rate
+
+
+_BUCKETS: Dict[str, Optional[TokenBucket]] = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def _bucket(endpoint: str) -> Optional[TokenBucket]:
+    if endpoint not in _BUCKETS:
+        with _BUCKETS_LOCK:
+            if endpoint not in _BUCKETS:
+                rate = DEFAULT_RATES.get(endpoint)
+                try:
+                    rate = float(os.getenv(f"SMARTAPI_RATE_{endpoint.upper()}", "") or rate or 0)
+                except ValueError:
+                    pass
+                _BUCKETS[endpoint] = TokenBucket(rate) if rate else None
+    return _BUCKETS[endpoint]
+
+
+def _plan(endpoint: str) -> Tuple[Optional[TokenBucket], Priority, float, float]:
+    bucket = _bucket(endpoint)
+    lane = current_priority()
+    reserve, max_wait = LANES[lane]
+    floor = reserve * bucket.burst if bucket else 0.0
+    return bucket, lane, floor, max_wait
+
+
+def _shed(endpoint: str, lane: Priority) -> RateLimited:
+    metrics.inc(f"ratelimit.{endpoint}.{lane.name.lower()}.shed")
+    return RateLimited(f"{endpoint}: no SmartAPI budget for {lane.name} lane")
+
+
+def _waited(endpoint: str, lane: Priority, waited_s: float) -> None:
+    metrics.inc(f"ratelimit.{endpoint}.{lane.name.lower()}.throttled")
+    metrics.observe_ms(f"ratelimit.{endpoint}.wait_ms", waited_s * 1000.0)
+
+
+def acquire(endpoint: str) -> None:
+    """Block until `endpoint` has budget for the current lane, or raise RateLimited."""
+    bucket, lane, floor, max_wait = _plan(endpoint)
+    if bucket is None:
+        return
+    t0 = time.monotonic()
+    slept = False
+    while True:
+        wait = bucket.try_take(floor)
+        if not wait:
+            if slept:
+                _waited(endpoint, lane, time.monotonic() - t0)
+            return
+        if time.monotonic() - t0 + wait > max_wait:
+            raise _shed(endpoint, lane)
+        time.sleep(wait)
+        slept = True
+
+
+async def aacquire(endpoint: str) -> None:
+    """acquire() for the event loop."""
+    bucket, lane, floor, max_wait = _plan(endpoint)
+    if bucket is None:
+        return
+    t0 = time.monotonic()
+    slept = False
+    while True:
+        wait = bucket.try_take(floor)
+        if not wait:
+            if slept:
+                _waited(endpoint, lane, time.monotonic() - t0)
+            return
+        if time.monotonic() - t0 + wait > max_wait:
+            raise _shed(endpoint, lane)
+        await asyncio.sleep(wait)
+        slept = True
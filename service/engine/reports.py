@@ -0,0 +1,109 @@
+# service/engine/reports.py
+"""
+Background writer for funds snapshots: trade paths submit the row they already
+have and return, and bursts are coalesced into one ledger write per interval.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import ledger, metrics
+from .utils import _now_ist_str, _env_float
+
+log = logging.getLogger("service.reports")
+
+
+class ReportWriter:
+    def __init__(self, interval_s: Optional[float] = None):
+        self.interval_s = _env_float("REPORT_INTERVAL_S", 5.0) if interval_s is None else interval_s
+        self._pending: Dict[str, Tuple[str, Dict[str, Any]]] = {}  # portfolio -> (ts_ist, funds row)
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._last_write = 0.0
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, funds: Dict[str, Any], portfolio: str = ledger.DEFAULT_PORTFOLIO) -> None:
+        """Queue a funds row {"balance","realized","used","mtm"}; replaces the portfolio's row not yet written."""
+        with self._cond:
+            if portfolio in self._pending:
+                metrics.inc("reports.coalesced")
+            self._pending[portfolio] = (_now_ist_str(), dict(funds))
+            if self._thread is None or not self._thread.is_alive():
+                self._stop = False
+                self._thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _take(self) -> List[Tuple[str, Tuple[str, Dict[str, Any]]]]:
+        with self._cond:
+            items, self._pending = list(self._pending.items()), {}
+            return items
+
+    def _write(self, items: List[Tuple[str, Tuple[str, Dict[str, Any]]]]) -> None:
+        with self._write_lock:
+            try:
+                ledger.record_funds_many([(pf, ts, funds) for pf, (ts, funds) in items])
+                metrics.inc("reports.writes")
+            except Exception as e:
+                metrics.inc("reports.write_failures")
+                log.warning("funds snapshot write failed: %s", e)
+            self._last_write = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                # debounce: at most one write per interval; later submits replace pending rows
+                wait = self._last_write + self.interval_s - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            items = self._take()
+            if items:
+                self._write(items)
+
+    def flush(self) -> None:
+        """Write the pending rows now (blocking)."""
+        items = self._take()
+        if items:
+            self._write(items)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+
+_WRITER: Optional[ReportWriter] = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_writer() -> ReportWriter:
+    global _WRITER
+    if _WRITER is None:
+        with _WRITER_LOCK:
+            if _WRITER is None:
+                _WRITER = ReportWriter()
+    return _WRITER
+
+
+def submit_funds(balance: float, realized: float, used: float, mtm: Optional[float],
+                 portfolio: str = ledger.DEFAULT_PORTFOLIO) -> None:
+    get_writer().submit({"balance": balance, "realized": realized, "used": used, "mtm": mtm}, portfolio)
+
+
+def flush() -> None:
+    """Persist anything pending and stop the writer thread (shutdown)."""
+    if _WRITER is not None:
+        _WRITER.stop()
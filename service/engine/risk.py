@@ -0,0 +1,300 @@
+# service/engine/risk.py
+"""
+Vectorized implied volatility and Black-Scholes Greeks for option legs and
+whole chains. IV and rates are decimals, theta is per calendar day, vega per
+vol point and gamma per index point.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.special import ndtr
+
+from . import metrics
+from .instruments import (
+    IST, _NA_INT, get_nifty_spot, instruments_version, load_instruments, nifty_spot_symbol, option_chain_index,
+)
+from .quotes import aget_quotes, get_quotes, quote_key
+from .utils import _env_float
+
+log = logging.getLogger("service.risk")
+
+
+RATE = _env_float("RISK_FREE_RATE", 0.065)
+DIV_YIELD = _env_float("RISK_DIV_YIELD", 0.0)
+SPOT_TTL_S = _env_float("RISK_SPOT_TTL_S", 3.0)
+
+EXPIRY_CLOSE = np.timedelta64(15 * 60 + 30, "m")
+YEAR_S = 365.0 * 86400.0
+IV_LO, IV_HI = 1e-4, 5.0        # solver bracket (0.01% .. 500%)
+IV_TOL = 1e-7                   # tolerance relative to time value (floored at 1e-9 rupees)
+IV_MAX_ITER = 60
+
+_INV_SQRT_2PI = 1.0 / np.sqrt(2.0 * np.pi)
+
+
+# ---------- Black-Scholes ----------
+def _d1(S, K, T, sigma, r, q):
+    vt = sigma * np.sqrt(T)
+    return (np.log(S / K) + (r - q + 0.5 * sigma * sigma) * T) / vt, vt
+
+
+def bs_price(S, K, T, sigma, is_call, r: float = RATE, q: float = DIV_YIELD) -> np.ndarray:
+    """European option prices; arguments broadcast against each other."""
+    w = np.where(is_call, 1.0, -1.0)
+    d1, vt = _d1(S, K, T, sigma, r, q)
+    return w * (S * np.exp(-q * T) * ndtr(w * d1) - K * np.exp(-r * T) * ndtr(w * (d1 - vt)))
+
+
+def greeks(S, K, T, sigma, is_call, r: float = RATE, q: float = DIV_YIELD) -> Dict[str, np.ndarray]:
+    """price, delta, gamma, theta (per day) and vega (per vol point) in one pass."""
+    S, K, T, sigma = (np.asarray(a, dtype=float) for a in (S, K, T, sigma))
+    w = np.where(is_call, 1.0, -1.0)
+    d1, vt = _d1(S, K, T, sigma, r, q)
+    d2 = d1 - vt
+    dq, dr = np.exp(-q * T), np.exp(-r * T)
+    pdf = _INV_SQRT_2PI * np.exp(-0.5 * d1 * d1)
+    n1, n2 = ndtr(w * d1), ndtr(w * d2)
+    theta = (-S * dq * pdf * sigma / (2.0 * np.sqrt(T)) - w * r * K * dr * n2 + w * q * S * dq * n1)
+    return {
+        "price": w * (S * dq * n1 - K * dr * n2),
+        "delta": w * dq * n1,
+        "gamma": dq * pdf / (S * vt),
+        "theta": theta / 365.0,
+        "vega": S * dq * pdf * np.sqrt(T) / 100.0,
+    }
+
+
+def implied_vol(price, S, K, T, is_call, r: float = RATE, q: float = DIV_YIELD) -> np.ndarray:
+    """
+    Implied vols for arrays of option prices. NaN where the price is outside
+    the no-arbitrage bounds, T <= 0, or the solve does not converge.
+    """
+    price, S, K, T = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (price, S, K, T)))
+    is_call = np.broadcast_to(np.asarray(is_call, dtype=bool), price.shape)
+    w = np.where(is_call, 1.0, -1.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fwd_s, fwd_k = S * np.exp(-q * T), K * np.exp(-r * T)
+        lower = np.maximum(w * (fwd_s - fwd_k), 0.0)
+        upper = np.where(is_call, fwd_s, fwd_k)
+        ok = (T > 0) & (S > 0) & (K > 0) & (price > lower) & (price < upper)
+
+    out = np.full(price.shape, np.nan)
+    if not ok.any():
+        return out
+    p, s, k, t, c = price[ok], S[ok], K[ok], T[ok], is_call[ok]
+    tol = np.maximum(IV_TOL * (p - lower[ok]), 1e-9)
+    lo, hi = np.full(p.shape, IV_LO), np.full(p.shape, IV_HI)
+    # Brenner-Subrahmanyam start, clipped into the bracket
+    sigma = np.clip(np.sqrt(2.0 * np.pi / t) * p / s, 0.05, 2.0)
+    done = np.zeros(p.shape, dtype=bool)
+    for _ in range(IV_MAX_ITER):
+        g = greeks(s, k, t, sigma, c, r, q)
+        diff = g["price"] - p
+        done = (np.abs(diff) < tol) | (hi - lo < 1e-10)
+        if done.all():
+            break
+        # price is increasing in sigma: shrink the bracket around the root
+        hi = np.where(diff > 0, sigma, hi)
+        lo = np.where(diff < 0, sigma, lo)
+        vega = g["vega"] * 100.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = sigma - diff / vega
+        bisect = ~np.isfinite(step) | (step <= lo) | (step >= hi) | (vega < 1e-8)
+        sigma = np.where(done, sigma, np.where(bisect, 0.5 * (lo + hi), step))
+    metrics.inc("risk.iv_solved", int(done.sum()))
+    out[ok] = np.where(done, sigma, np.nan)
+    return out
+
+
+def years_to_expiry(expiry: np.ndarray, now: Optional[datetime] = None) -> np.ndarray:
+    """Year fractions from now to the 15:30 IST close of each datetime64[D] expiry (NaN if unknown)."""
+    now = now or datetime.now(tz=IST)
+    now_ist = np.datetime64(now.astimezone(IST).replace(tzinfo=None), "s")
+    close = np.asarray(expiry, dtype="datetime64[D]").astype("datetime64[m]") + EXPIRY_CLOSE
+    secs = (close - now_ist).astype("timedelta64[s]").astype(float)
+    secs[np.isnat(close)] = np.nan
+    return secs / YEAR_S
+
+
+# ---------- Contracts ----------
+_TOKENS: Dict[str, Any] = {"table": None, "index": {}}
+_TOKENS_LOCK = threading.Lock()
+
+
+def _token_index():
+    """token -> table position for NFO option rows; rebuilt when the instruments file changes."""
+    t = load_instruments()
+    with _TOKENS_LOCK:
+        if _TOKENS["table"] is not t:
+            sel = np.flatnonzero(t.exchange_is("NFO") & (t.opt_code > 0))
+            _TOKENS["index"] = dict(zip(t.token[sel].tolist(), sel.tolist()))
+            _TOKENS["table"] = t
+        return t, _TOKENS["index"]
+
+
+def _contract_columns(t, pos: np.ndarray) -> Dict[str, np.ndarray]:
+    strike = t.strikes(pos).astype(float)
+    strike[strike == _NA_INT] = np.nan
+    return {"strike": strike, "expiry": t.expiry[pos], "is_call": t.opt_code[pos] == 1}
+
+
+def contracts(symbols: Sequence[Dict[str, str]]) -> Dict[str, np.ndarray]:
+    """strike / expiry / is_call arrays for leg symbols (NaN strike, NaT expiry when the token is unknown)."""
+    t, index = _token_index()
+    pos = np.array([index.get(str(s.get("symboltoken", "")).strip(), -1) for s in symbols], dtype=np.int64)
+    found = pos >= 0
+    cols = _contract_columns(t, np.where(found, pos, 0))
+    cols["strike"] = np.where(found, cols["strike"], np.nan)
+    cols["expiry"] = np.where(found, cols["expiry"], np.datetime64("NaT", "D"))
+    return cols
+
+
+# ---------- Spot ----------
+_SPOT: Dict[str, Any] = {"version": None, "symbol": None}
+
+
+def _spot_symbol() -> Optional[Dict[str, str]]:
+    """nifty_spot_symbol(), remembered per instruments version once known."""
+    version = instruments_version()
+    if _SPOT["symbol"] is not None and _SPOT["version"] == version:
+        return _SPOT["symbol"]
+    sym = nifty_spot_symbol(version)
+    if sym is not None:
+        _SPOT.update(version=version, symbol=sym)
+    return sym
+
+
+def spot() -> Optional[float]:
+    """
+    NIFTY spot as a quote on the spot token: tick feed, quote cache, rate-limit
+    lane and retries as for any leg. get_nifty_spot() only until the token is known.
+    """
+    try:
+        sym = _spot_symbol()
+        if sym is None:
+            metrics.inc("risk.spot_probes")
+            return get_nifty_spot()
+        return get_quotes([sym], max_age_s=SPOT_TTL_S).get(quote_key(sym))
+    except Exception as e:
+        metrics.inc("risk.spot_failures")
+        log.warning("spot for Greeks unavailable: %s", e)
+        return None
+
+
+async def aspot() -> Optional[float]:
+    try:
+        sym = _spot_symbol()
+        if sym is None:
+            metrics.inc("risk.spot_probes")
+            return await asyncio.to_thread(get_nifty_spot)
+        return (await aget_quotes([sym], max_age_s=SPOT_TTL_S)).get(quote_key(sym))
+    except Exception as e:
+        metrics.inc("risk.spot_failures")
+        log.warning("spot for Greeks unavailable: %s", e)
+        return None
+
+
+# ---------- Legs / chains ----------
+def _r(x: float, nd: int) -> Optional[float]:
+    return None if not np.isfinite(x) else round(float(x), nd)
+
+
+def _mark(S: float, cols: Dict[str, np.ndarray], ltp: np.ndarray, now: Optional[datetime]) -> Dict[str, np.ndarray]:
+    T = years_to_expiry(cols["expiry"], now)
+    iv = implied_vol(ltp, S, cols["strike"], T, cols["is_call"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        g = greeks(S, cols["strike"], T, iv, cols["is_call"])
+    g["iv"], g["T"] = iv, T
+    return g
+
+
+def legs_risk(legs: Sequence[Tuple[str, Dict[str, str], int, Optional[float]]], S: Optional[float],
+              multiplier: float, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    legs: (name, symbol, lots, ltp). Per-leg IV and Greeks plus net position Greeks
+    (each leg's Greek x lots x multiplier). None without a spot.
+    """
+    if S is None or not legs:
+        return None
+    with metrics.timed("risk.legs_ms"):
+        cols = contracts([sym for _, sym, _, _ in legs])
+        ltp = np.array([np.nan if p is None else float(p) for _, _, _, p in legs])
+        g = _mark(float(S), cols, ltp, now)
+    qty = np.array([lots for _, _, lots, _ in legs], dtype=float) * multiplier
+    out: Dict[str, Any] = {"spot": round(float(S), 2), "rate": RATE, "legs": {}, "net": {}}
+    for n, (name, sym, lots, p) in enumerate(legs):
+        out["legs"][name] = {
+            "symbol": sym.get("tradingsymbol"),
+            "strike": _r(cols["strike"][n], 2),
+            "expiry": None if np.isnat(cols["expiry"][n]) else str(cols["expiry"][n]),
+            "days": _r(g["T"][n] * 365.0, 2),
+            "ltp": p,
+            "iv": _r(g["iv"][n], 4),
+            "delta": _r(g["delta"][n], 4),
+            "gamma": _r(g["gamma"][n], 6),
+            "theta": _r(g["theta"][n], 2),
+            "vega": _r(g["vega"][n], 2),
+        }
+    for k, nd in (("delta", 2), ("gamma", 4), ("theta", 2), ("vega", 2)):
+        out["net"][k] = _r(float(np.sum(g[k] * qty)), nd)   # NaN (-> None) if any leg failed
+    return out
+
+
+def _chain_rows(underlying: str, month_key: Optional[str]):
+    idx = option_chain_index()
+    if month_key is None:
+        months = [m for m in idx.months(underlying) if m]
+        this_month = datetime.now(tz=IST).strftime("%Y-%m")
+        month_key = next((m for m in months if m >= this_month), months[-1] if months else None)
+    pos = np.concatenate([idx.chain_positions(underlying, month_key, o) for o in ("CE", "PE")])
+    t = idx.table
+    symbols = [{"exchange": t.exchanges[t.exchange_code[n]], "tradingsymbol": t.tradingsymbol[n],
+                "symboltoken": t.token[n]} for n in pos.tolist()]
+    return month_key, t, pos, symbols
+
+
+def _chain_payload(S: float, month_key, t, pos, symbols, quotes: Dict[str, Any],
+                   now: Optional[datetime]) -> Dict[str, Any]:
+    with metrics.timed("risk.chain_ms"):
+        cols = _contract_columns(t, pos)
+        ltp = np.array([np.nan if quotes.get(quote_key(s)) is None else float(quotes[quote_key(s)])
+                        for s in symbols])
+        g = _mark(S, cols, ltp, now)
+    rows = [{
+        "symbol": s["tradingsymbol"],
+        "type": "CE" if cols["is_call"][n] else "PE",
+        "strike": _r(cols["strike"][n], 2),
+        "ltp": _r(ltp[n], 2),
+        "iv": _r(g["iv"][n], 4),
+        "delta": _r(g["delta"][n], 4),
+        "gamma": _r(g["gamma"][n], 6),
+        "theta": _r(g["theta"][n], 2),
+        "vega": _r(g["vega"][n], 2),
+    } for n, s in enumerate(symbols)]
+    return {"spot": round(S, 2), "rate": RATE, "month": month_key, "rows": rows}
+
+
+def chain_risk(underlying: str = "NIFTY", month_key: Optional[str] = None,
+               now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """IV and Greeks for every strike of one expiry month (default: the nearest), marked in one pass."""
+    S = spot()
+    if S is None:
+        return None
+    month_key, t, pos, symbols = _chain_rows(underlying, month_key)
+    return _chain_payload(S, month_key, t, pos, symbols, get_quotes(symbols), now)
+
+
+async def achain_risk(underlying: str = "NIFTY", month_key: Optional[str] = None,
+                      now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    S = await aspot()
+    if S is None:
+        return None
+    # the index build (and a cold instruments load) is CPU/disk work: keep it off the loop
+    month_key, t, pos, symbols = await asyncio.to_thread(_chain_rows, underlying, month_key)
+    return _chain_payload(S, month_key, t, pos, symbols, await aget_quotes(symbols), now)
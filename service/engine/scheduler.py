@@ -7,17 +7,22 @@ import logging
 from typing import Dict, Tuple, Optional, Any, TYPE_CHECKING
 
 from .instruments import pick_monthly_option_symbols  # strict NIFTY monthly only
-from .utils import _market_window_now_ist, _now_ist_str
+from .utils import _env_float, _market_window_now_ist, _now_ist, _now_ist_str
 from .selector import predict as ml_predict
-from .positions import open_position, close_position
+from .positions import aopen_position, aclose_position, current_position, _aleg_ltps, _mtm_at
+from .ratelimit import Priority, priority
+from . import history, metrics, portfolios
+from .session import get_session
 
 try:
     # Runtime imports (may be missing in paper env)
     from apscheduler.schedulers.asyncio import AsyncIOScheduler
     from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
 except Exception:  # pragma: no cover
     AsyncIOScheduler = None  # type: ignore[assignment]
     CronTrigger = None       # type: ignore[assignment]
+    IntervalTrigger = None   # type: ignore[assignment]
 
 # Type-only imports so Pylance has real types without touching runtime vars
 if TYPE_CHECKING:  # only evaluated by type checkers
@@ -35,6 +40,9 @@ IST = ZoneInfo("Asia/Kolkata")
 # Keep a single scheduler for the process
 _SCHED: Optional["_AsyncIOScheduler"] = None
 
+# MTM history sampling interval (s) while a position is open
+MTM_SAMPLE_S = _env_float("MTM_SAMPLE_S", 30.0)
+
 
 # --------- SYMBOL SELECTION (strict monthly NIFTY index options) ---------
 def select_symbols_for_prediction(direction: str) -> Tuple[Dict, str, Dict, str]:
@@ -52,9 +60,10 @@ def ratio_for(direction: str) -> Tuple[int, int]:
 
 # --------- TASKS (callable both by HTTP and scheduler) ---------
 async def predict_and_buy_1528() -> Dict[str, Any]:
-    direction, conf = ml_predict()
+    # CSV/model loading and instrument selection are blocking: keep them off the event loop
+    direction, conf = await asyncio.to_thread(ml_predict)
 
-    sel = select_symbols_for_prediction(direction)
+    sel = await asyncio.to_thread(select_symbols_for_prediction, direction)
     if not sel or len(sel) != 4:
         raise RuntimeError(
             f"Symbol selection failed (got {sel!r}). "
@@ -69,8 +78,10 @@ async def predict_and_buy_1528() -> Dict[str, Any]:
         _now_ist_str(), direction, conf, ce_lbl, pe_lbl, lots_ratio,
     )
 
-    res = open_position(direction, ce_symbol=ce, pe_symbol=pe, ratio=lots_ratio)
+    res = await aopen_position(direction, ce_symbol=ce, pe_symbol=pe, ratio=lots_ratio)
     payload = {"opened": True, "direction": direction, "confidence": float(conf), "details": res}
+    if portfolios.all_portfolios():
+        payload["variants"] = await _variants(portfolios.aopen_all(direction, float(conf), lots_ratio))
     logger.info("Opened position: %s", payload)
     return payload
 
@@ -80,11 +91,54 @@ async def squareoff_0921() -> Dict[str, Any]:
     Close open position at live LTPs and realize P&L.
     """
     logger.info("[%s] squareoff_0921: trying to close any open position", _now_ist_str())
-    res = close_position("scheduled_squareoff_0921")
+    res = await aclose_position("scheduled_squareoff_0921")
+    if portfolios.all_portfolios():
+        res = dict(res, variants=await _variants(portfolios.aclose_all("scheduled_squareoff_0921")))
     logger.info("Squareoff result: %s", res)
     return res
 
 
+async def _variants(coro) -> Dict[str, Any]:
+    """Paper variants never fail the main book's job."""
+    try:
+        return await coro
+    except Exception as e:
+        logger.exception("paper variants failed: %s", e)
+        return {"error": str(e)}
+
+
+async def warm_session() -> Dict[str, Any]:
+    """Refresh the SmartAPI session ahead of a trade job so it never logs in inline."""
+    sess = get_session()
+    await asyncio.to_thread(sess.ensure_fresh, 1800.0)
+    logger.info("[%s] session warm: %.0fs left", _now_ist_str(), sess.remaining_s())
+    return {"expires_in_s": round(sess.remaining_s())}
+
+
+async def sample_mtm() -> Optional[float]:
+    """Record an MTM history sample for the open position, so the chart fills without /api/funds polls."""
+    pos = current_position()
+    now = _now_ist()
+    if pos is None or now.weekday() >= 5 or not 9 <= now.hour < 16:   # flat, or NSE is shut
+        return None
+    with priority(Priority.MTM):
+        l_ce, l_pe = await _aleg_ltps(pos.ce.symbol, pos.pe.symbol)
+    if pos is not current_position():
+        return None   # closed while the quotes were in flight
+    mtm = _mtm_at(pos, l_ce, l_pe)
+    history.get_history().record(None, l_ce, l_pe, mtm)
+    return mtm
+
+
+async def _sample_guarded() -> None:
+    # runs every MTM_SAMPLE_S: no window-check log, and a failed sample just waits for the next one
+    try:
+        await sample_mtm()
+    except Exception as e:
+        metrics.inc("mtm.sample_failures")
+        logger.warning("MTM sample failed: %s", e)
+
+
 # --------- SCHEDULER WIRING ---------
 def _ensure_scheduler() -> "_AsyncIOScheduler":
     global _SCHED
@@ -102,6 +156,8 @@ def start_scheduler(app: Optional[Any] = None) -> "_AsyncIOScheduler":
     Create and start the AsyncIOScheduler with the two cron jobs:
       - 15:28 IST (Mon–Fri): predict & buy
       - 09:21 IST (Mon–Fri): squareoff next morning
+    plus SmartAPI session warm-ups a few minutes before each, the MTM history
+    sampler, and the background session refresher.
     Call this once on app startup.
     """
     sched = _ensure_scheduler()
@@ -132,6 +188,29 @@ def start_scheduler(app: Optional[Any] = None) -> "_AsyncIOScheduler":
         misfire_grace_time=120,
     )
 
+    # Session warm-ups ahead of both trade jobs
+    for job_id, hour, minute in (("warm_session_0915", 9, 15), ("warm_session_1520", 15, 20)):
+        sched.add_job(
+            func=lambda: asyncio.create_task(_guarded(warm_session)),
+            trigger=CronTrigger(day_of_week="mon-fri", hour=hour, minute=minute, second=0, timezone=IST),
+            id=job_id,
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+            misfire_grace_time=120,
+        )
+
+    # MTM history sampler (a no-op while flat)
+    sched.add_job(
+        func=lambda: asyncio.create_task(_sample_guarded()),
+        trigger=IntervalTrigger(seconds=max(1.0, MTM_SAMPLE_S), timezone=IST),
+        id="sample_mtm",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+    )
+    get_session().start()
+
     if not sched.running:
         sched.start()
         logger.info("AsyncIOScheduler started with IST timezone.")
@@ -183,6 +262,7 @@ def get_next_runs_ist() -> Dict[str, Optional[str]]:
 
 def stop_scheduler() -> None:
     global _SCHED
+    get_session().stop()
     if _SCHED and getattr(_SCHED, "running", False):
         _SCHED.shutdown(wait=False)
         _SCHED = None
@@ -1,9 +1,14 @@
 # service/engine/selector.py
 from __future__ import annotations
 
+import hashlib
+import io
 import os
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Tuple, Optional, List
+from typing import Any, Dict, Tuple, Optional, List
 
 import math
 import warnings
@@ -16,6 +21,7 @@ try:
 except Exception:  # pragma: no cover
     joblib = None  # graceful fallback
 
+from . import catalog, metrics
 
 ROOT = Path(__file__).resolve().parents[2]
 DATA_DIR = ROOT / "data"
@@ -36,27 +42,9 @@ CANDIDATE_FILENAMES: List[str] = [
 ]
 
 def _find_ohlc_csv() -> Optional[Path]:
-    # 1) direct candidates in /data
-    for name in CANDIDATE_FILENAMES:
-        p = DATA_DIR / name
-        if p.exists():
-            return p
-    # 2) any csv under /data that looks like OHLC
-    best: Optional[Path] = None
-    latest_mtime = -1.0
-    for p in DATA_DIR.rglob("*.csv"):
-        try:
-            # quick sniff
-            head = pd.read_csv(p, nrows=1)
-            cols = {c.strip().lower() for c in head.columns}
-            if {"open", "high", "low", "close"}.issubset(cols):
-                m = p.stat().st_mtime
-                if m > latest_mtime:
-                    latest_mtime = m
-                    best = p
-        except Exception:
-            continue
-    return best
+    # 1) direct candidates in /data, else 2) the newest csv under /data that looks like OHLC --
+    # answered from the data/ catalog, which only re-reads files whose mtime/size changed
+    return catalog.get_catalog().find_ohlc(CANDIDATE_FILENAMES)
 
 # -------------------------------
 # Technical Indicators
@@ -190,29 +178,106 @@ def _rule_based_signal(df: pd.DataFrame) -> Tuple[str, float]:
 # -------------------------------
 # ML path (optional)
 # -------------------------------
+# Features of the bare-estimator format (bundles carry their own Xcols)
+DEFAULT_FEATURES: List[str] = ["close", "ema20", "ema50", "rsi14", "macd", "macd_signal", "macd_hist",
+                               "ret1", "ret5", "ema20_slope"]
+
+@dataclass
+class ModelBundle:
+    model: Any
+    xcols: List[str]
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    sha256: str = ""
+    loaded_at: float = 0.0
+
+def _as_bundle(obj: Any, sha: str) -> ModelBundle:
+    """train_direction.py bundle {"model","Xcols","metrics"} or a bare estimator."""
+    if isinstance(obj, dict) and "model" in obj:
+        xcols = list(obj.get("Xcols") or getattr(obj["model"], "feature_names_in_", DEFAULT_FEATURES))
+        return ModelBundle(obj["model"], xcols, dict(obj.get("metrics") or {}), sha, time.time())
+    return ModelBundle(obj, list(getattr(obj, "feature_names_in_", DEFAULT_FEATURES)), {}, sha, time.time())
+
+class ModelCache:
+    """
+    Keeps the unpickled model in memory. Each get() is a stat() of the file; only
+    when (mtime, size) changes is it read and hashed, and only a new hash is
+    unpickled. The new bundle replaces the old one in a single assignment, so
+    callers always see a complete bundle; a failed load keeps the previous one.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._bundle: Optional[ModelBundle] = None
+        self._stat: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[ModelBundle]:
+        if joblib is None:
+            return None
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._stat:
+            metrics.inc("selector.model_cache_hits")
+            return self._bundle
+        with self._lock:
+            if key != self._stat:
+                self._reload(key)
+            return self._bundle
+
+    def _reload(self, key: Tuple[int, int]) -> None:
+        try:
+            data = self.path.read_bytes()   # hash and unpickle the same bytes
+        except OSError:
+            return
+        sha = hashlib.sha256(data).hexdigest()
+        if self._bundle is not None and sha == self._bundle.sha256:
+            metrics.inc("selector.model_touches")   # touched/rewritten, same content
+            self._stat = key
+            return
+        try:
+            with metrics.timed("selector.model_load_ms"):
+                bundle = _as_bundle(joblib.load(io.BytesIO(data)), sha)
+        except Exception:
+            metrics.inc("selector.model_load_failures")
+            self._stat = key    # don't retry a broken file until it changes again
+            return
+        metrics.inc("selector.model_reloads" if self._bundle is not None else "selector.model_loads")
+        self._bundle, self._stat = bundle, key
+
+_MODEL = ModelCache(MODEL_PATH)
+
+def load_model() -> Optional[ModelBundle]:
+    """Load (or revalidate) the cached model; call at startup to keep the unpickling off the trade path."""
+    return _MODEL.get()
+
 def _ml_predict(df: pd.DataFrame) -> Optional[Tuple[str, float]]:
     """
-    If a scikit-learn model exists at ml/models/model.pkl AND joblib is available,
-    we use it. The model is expected to have either:
+    If a model exists at ml/models/model.pkl AND joblib is available, we use it.
+    The file is either train_direction.py's {"model","Xcols","metrics"} bundle
+    (features are fed in Xcols order) or a bare estimator on DEFAULT_FEATURES.
+    The model is expected to have either:
       - predict_proba(X) → [:,1] = prob(UP), or
       - decision_function(X) + a logistic squashing for a pseudo-probability.
-    Features used: close, ema20, ema50, rsi14, macd, macd_signal, macd_hist, ret1, ret5, ema20_slope
     """
-    if not MODEL_PATH.exists() or joblib is None:
+    bundle = _MODEL.get()
+    if bundle is None:
         return None
 
-    try:
-        model = joblib.load(MODEL_PATH)
-    except Exception:
+    model, feats = bundle.model, bundle.xcols
+    if any(f not in df.columns for f in feats):
+        metrics.inc("selector.model_missing_features")
         return None
-
-    feats = ["close","ema20","ema50","rsi14","macd","macd_signal","macd_hist","ret1","ret5","ema20_slope"]
-    X = df[feats].tail(1).values
+    row = df[feats].tail(1)
+    # estimators fitted on a DataFrame want the named columns, others plain arrays
+    X = row if hasattr(model, "feature_names_in_") else row.values
 
     prob_up = None
     try:
         if hasattr(model, "predict_proba"):
-            prob_up = float(model.predict_proba(df[feats].tail(1))[:, 1][0])
+            prob_up = float(model.predict_proba(X)[:, 1][0])
         elif hasattr(model, "decision_function"):
             val = float(model.decision_function(X)[0])
             # logistic squash to 0..1
@@ -0,0 +1,255 @@
+# service/engine/session.py
+"""
+One SmartAPI session per process, shared by quotes, the tick feed and the
+SmartConnect client; a background thread refreshes the JWT before it expires.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from . import metrics
+from .transport import get_transport
+from .utils import _env_float
+
+try:
+    from SmartApi import SmartConnect  # type: ignore
+except Exception:  # pragma: no cover
+    SmartConnect = None  # type: ignore[assignment]
+
+log = logging.getLogger("service.session")
+
+ANGEL_BASE = "https://apiconnect.angelone.in"
+_BASE_OVERRIDE: Optional[str] = None
+LOGIN_PATH = "/rest/auth/angelbroking/user/v1/loginByPassword"
+REFRESH_PATH = "/rest/auth/angelbroking/jwt/v1/generateTokens"
+
+CHECK_EVERY_S = 30.0
+
+
+def _env(name: str, default: str = "") -> str:
+    v = os.getenv(name, default)
+    return v if v is not None else default
+
+
+def base_url() -> str:
+    """
+    REST base URL of every SmartAPI call (login, refresh, quotes, SmartConnect):
+    set_base_url(), else SMARTAPI_BASE_URL, else Angel. Read per call, so one
+    override points everything at the stand-in.
+    """
+    return (_BASE_OVERRIDE or os.getenv("SMARTAPI_BASE_URL", "")).rstrip("/") or ANGEL_BASE
+
+
+def set_base_url(url: Optional[str]) -> None:
+    """Override the base URL at runtime (None goes back to SMARTAPI_BASE_URL / Angel)."""
+    global _BASE_OVERRIDE
+    _BASE_OVERRIDE = url or None
+
+
+def headers(jwt: Optional[str] = None) -> Dict[str, str]:
+    # Angel expects these client headers
+    h = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "X-SourceID": "WEB",
+        "X-ClientType": "USER",
+        "X-ClientLocalIP": _env("SMARTAPI_LOCAL_IP", "127.0.0.1"),
+        "X-ClientPublicIP": _env("SMARTAPI_PUBLIC_IP", "127.0.0.1"),
+        "X-MACAddress": _env("SMARTAPI_MAC", "AA:BB:CC:DD:EE:FF"),
+        "X-PrivateKey": _env("SMARTAPI_API_KEY", "") or _env("SMARTAPI_KEY", ""),
+    }
+    if jwt:
+        h["Authorization"] = f"Bearer {jwt}"
+    return h
+
+
+def credentials() -> Dict[str, str]:
+    """
+    Supports:
+    - SMARTAPI_API_KEY / SMARTAPI_CLIENT_CODE / SMARTAPI_PIN / SMARTAPI_TOTP_SECRET
+    - SMARTAPI_KEY / SMARTAPI_CLIENT_ID / SMARTAPI_PASSWORD / SMARTAPI_TOTP (a ready code)
+    """
+    return {
+        "api_key": _env("SMARTAPI_API_KEY") or _env("SMARTAPI_KEY"),
+        "client_code": _env("SMARTAPI_CLIENT_CODE") or _env("SMARTAPI_CLIENT_ID"),
+        "pin": _env("SMARTAPI_PIN") or _env("SMARTAPI_PASSWORD"),
+        "totp_secret": _env("SMARTAPI_TOTP_SECRET"),
+        "totp": _env("SMARTAPI_TOTP"),
+    }
+
+
+def _jwt_exp(jwt: str) -> Optional[float]:
+    """exp claim of a JWT (epoch seconds), if it has one."""
+    try:
+        payload = jwt.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except Exception:
+        return None
+
+
+class SessionManager:
+    def __init__(self) -> None:
+        self.jwt: Optional[str] = None
+        self.refresh_token: Optional[str] = None
+        self.feed_token: Optional[str] = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self._client: Optional[Any] = None
+        self._client_root: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- state ----------
+    def remaining_s(self) -> float:
+        return self.expires_at - time.time() if self.jwt else 0.0
+
+    def valid(self, min_left_s: float = 15.0) -> bool:
+        return self.remaining_s() > min_left_s
+
+    def _store(self, data: Dict[str, Any]) -> str:
+        jwt = data["jwtToken"]
+        if jwt.lower().startswith("bearer "):
+            jwt = jwt[7:]
+        self.jwt = jwt
+        self.refresh_token = data.get("refreshToken") or self.refresh_token
+        self.feed_token = data.get("feedToken") or self.feed_token
+        self.expires_at = _jwt_exp(jwt) or time.time() + _env_float("SMARTAPI_SESSION_TTL_S", 600.0)
+        metrics.set_gauge("session.expires_in_s", self.remaining_s())
+        if self._client is not None:
+            self._sync_client()
+        return jwt
+
+    # ---------- network ----------
+    def _post(self, endpoint: str, path: str, payload: Dict[str, Any], jwt: Optional[str] = None) -> Dict[str, Any]:
+        r = get_transport().post(endpoint, f"{base_url()}{path}", headers=headers(jwt), data=json.dumps(payload))
+        try:
+            return r.json()
+        except Exception:
+            raise RuntimeError(f"SmartAPI {endpoint} failed: HTTP {r.status_code} {r.text[:200]}")
+
+    def _login(self) -> str:
+        """Full TOTP login (caller holds the lock)."""
+        import pyotp
+
+        c = credentials()
+        if not (c["api_key"] and c["client_code"] and c["pin"] and (c["totp_secret"] or c["totp"])):
+            raise RuntimeError("SMARTAPI_* env vars are not fully set (API_KEY, CLIENT_CODE, PIN, TOTP_SECRET)")
+        otp = pyotp.TOTP(c["totp_secret"]).now() if c["totp_secret"] else c["totp"]
+        data = self._post("login", LOGIN_PATH, {"clientcode": c["client_code"], "password": c["pin"], "totp": otp})
+        if not data.get("status"):
+            raise RuntimeError(f"SmartAPI login failed: {data}")
+        metrics.inc("session.logins")
+        log.info("SmartAPI login OK for %s", c["client_code"])
+        return self._store(data["data"])
+
+    def _refresh(self) -> str:
+        """Renew the JWT with the refresh token; full login if that is not possible (caller holds the lock)."""
+        if self.jwt and self.refresh_token:
+            try:
+                data = self._post("refresh", REFRESH_PATH, {"refreshToken": self.refresh_token}, jwt=self.jwt)
+                if data.get("status") and data.get("data"):
+                    metrics.inc("session.refreshes")
+                    log.info("SmartAPI session refreshed")
+                    return self._store(data["data"])
+                log.warning("token refresh failed: %s; logging in again", data)
+            except Exception as e:
+                log.warning("token refresh failed: %s; logging in again", e)
+            metrics.inc("session.refresh_failures")
+        return self._login()
+
+    # ---------- API ----------
+    def token(self) -> str:
+        """Current JWT. Only logs in inline when there is no usable session at all."""
+        if self.valid():
+            return self.jwt  # type: ignore[return-value]
+        with self._lock:
+            if self.valid():
+                return self.jwt  # type: ignore[return-value]
+            metrics.inc("session.inline_logins")
+            return self._refresh()
+
+    async def atoken(self) -> str:
+        if self.valid():
+            return self.jwt  # type: ignore[return-value]
+        return await asyncio.to_thread(self.token)
+
+    def ensure_fresh(self, min_left_s: Optional[float] = None) -> str:
+        """Refresh now unless at least min_left_s (default SMARTAPI_REFRESH_AHEAD_S) is left."""
+        ahead = _env_float("SMARTAPI_REFRESH_AHEAD_S", 300.0) if min_left_s is None else min_left_s
+        with self._lock:
+            if self.valid(ahead):
+                return self.jwt  # type: ignore[return-value]
+            return self._refresh()
+
+    def _sync_client(self) -> None:
+        c = self._client
+        c.setAccessToken(self.jwt)
+        c.setRefreshToken(self.refresh_token)
+        c.setFeedToken(self.feed_token)
+        c.setUserId(credentials()["client_code"])
+
+    def smart_client(self) -> Optional[Any]:
+        """SmartConnect sharing this session (built once; tokens updated on refresh)."""
+        if not SmartConnect:
+            return None
+        try:
+            self.token()
+        except Exception as e:
+            log.warning("SmartAPI session unavailable: %s", e)
+            return None
+        with self._lock:
+            root = base_url()
+            if self._client is None or self._client_root != root:
+                self._client = SmartConnect(credentials()["api_key"], root=root)
+                self._client_root = root
+            self._sync_client()
+            return self._client
+
+    # ---------- background refresher ----------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            wait = CHECK_EVERY_S
+            try:
+                self.ensure_fresh()
+                metrics.set_gauge("session.expires_in_s", self.remaining_s())
+                # wake up just before the refresh window opens, but at least every CHECK_EVERY_S
+                ahead = _env_float("SMARTAPI_REFRESH_AHEAD_S", 300.0)
+                wait = max(1.0, min(CHECK_EVERY_S, self.remaining_s() - ahead))
+            except Exception as e:
+                log.warning("background session refresh failed: %s", e)
+            self._stop.wait(wait)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="smartapi-session", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+_MANAGER: Optional[SessionManager] = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_session() -> SessionManager:
+    global _MANAGER
+    if _MANAGER is None:
+        with _MANAGER_LOCK:
+            if _MANAGER is None:
+                _MANAGER = SessionManager()
+    return _MANAGER
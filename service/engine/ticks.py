@@ -0,0 +1,325 @@
+# service/engine/ticks.py
+"""
+Optional streaming LTPs over SmartAPI's WebSocket v2 feed (SMARTAPI_WS=1):
+watched symbols land in a last-tick cache that quotes serve from before REST.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from . import metrics
+from .session import credentials, get_session
+from .utils import _env_float
+
+try:
+    import websocket  # websocket-client
+except Exception:  # pragma: no cover
+    websocket = None  # type: ignore[assignment]
+
+log = logging.getLogger("service.ticks")
+
+WS_URL = "wss://smartapisocket.angelone.in/smart-stream"
+HEARTBEAT_S = 10.0
+PONG_TIMEOUT_S = 3 * HEARTBEAT_S   # no "pong" to our text "ping" for this long: reconnect
+RECONNECT_MAX_S = 30.0
+
+LTP_MODE = 1
+SUBSCRIBE_ACTION = 1
+UNSUBSCRIBE_ACTION = 0
+
+# SmartAPI exchangeType codes
+EXCHANGE_TYPES: Dict[str, int] = {"NSE": 1, "NFO": 2, "BSE": 3, "BFO": 4, "MCX": 5, "NCX": 7, "CDS": 13}
+
+# Common prefix of every binary tick: mode, exchangeType, token[25], seq, exch ts (ms), LTP (paise)
+_TICK_HEAD = struct.Struct("<BB25sqqq")
+
+# (exchangeType, token) -> (ltp, monotonic receive time); one assignment per tick, so readers take no lock
+_TICKS: Dict[Tuple[int, str], Tuple[float, float]] = {}
+
+
+def feed_enabled() -> bool:
+    return os.getenv("SMARTAPI_WS", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+# ---------- Frames ----------
+def encode_ltp_frame(token: str, exchange_type: int, ltp: float, seq: int = 0,
+                     exchange_ts_ms: Optional[int] = None) -> bytes:
+    """LTP-mode binary frame as sent by the feed (used by the local stand-in)."""
+    ts = int(time.time() * 1000) if exchange_ts_ms is None else exchange_ts_ms
+    return _TICK_HEAD.pack(LTP_MODE, exchange_type, token.encode()[:25], seq, ts, int(round(ltp * 100)))
+
+
+def parse_tick(frame: bytes) -> Optional[Tuple[str, int, float, int]]:
+    """(token, exchangeType, ltp, exchange_ts_ms) from a binary frame of any mode; None if too short."""
+    if len(frame) < _TICK_HEAD.size:
+        return None
+    _mode, exch, raw_token, _seq, ts_ms, ltp_paise = _TICK_HEAD.unpack_from(frame)
+    token = raw_token.split(b"\x00", 1)[0].decode("ascii", "ignore")
+    return token, exch, ltp_paise / 100.0, ts_ms
+
+
+# ---------- Cache ----------
+def record_tick(exchange_type: int, token: str, ltp: float) -> None:
+    _TICKS[(exchange_type, token)] = (ltp, time.monotonic())
+
+
+def last_tick(exchange: str, token: str) -> Optional[Tuple[float, float]]:
+    """(ltp, age in seconds) of the latest tick for exchange ("NFO", ...) and token, or None."""
+    t = _TICKS.get((EXCHANGE_TYPES.get(exchange.upper(), -1), token))
+    if t is None:
+        return None
+    return t[0], time.monotonic() - t[1]
+
+
+def fresh_ltp(exchange: str, token: str, max_age_s: Optional[float] = None) -> Optional[float]:
+    """Cached LTP when the last tick is recent enough, else None (caller goes to REST)."""
+    if not token or not _TICKS:
+        return None
+    t = last_tick(exchange, token)
+    if t is None:
+        return None
+    ltp, age = t
+    if age > (max_age_s if max_age_s is not None else _env_float("TICK_MAX_AGE_S", 2.0)):
+        return None
+    return ltp
+
+
+# ---------- Feed ----------
+def _symbol_key(symbol: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    """(exchangeType, token) of a symbol dict: the subscription and tick-cache key."""
+    exch = (symbol.get("exchange") or symbol.get("exch_seg") or "").upper()
+    token = str(symbol.get("symboltoken") or symbol.get("token") or "").strip()
+    if not token or exch not in EXCHANGE_TYPES:
+        return None
+    return EXCHANGE_TYPES[exch], token
+
+
+def _token_list(subs: Iterable[Tuple[int, str]]) -> list:
+    by_exch: Dict[int, list] = {}
+    for exch, token in subs:
+        by_exch.setdefault(exch, []).append(token)
+    return [{"exchangeType": e, "tokens": toks} for e, toks in sorted(by_exch.items())]
+
+
+def _auth_headers() -> Dict[str, str]:
+    sess = get_session()
+    jwt = sess.token()
+    creds = credentials()
+    return {
+        "Authorization": jwt,
+        "x-api-key": creds["api_key"],
+        "x-client-code": creds["client_code"],
+        "x-feed-token": sess.feed_token or "",
+    }
+
+
+class TickFeed:
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or os.getenv("SMARTAPI_WS_URL") or WS_URL
+        self._subs: Set[Tuple[int, str]] = set()  # (exchangeType, token)
+        self._lock = threading.Lock()
+        self._ws: Optional[Any] = None
+        self._conn: Optional[Any] = None   # the session's WebSocket, released when run_forever returns
+        self._thread: Optional[threading.Thread] = None
+        self._beat: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.connected = threading.Event()
+        self._last_pong = 0.0
+
+    # -- subscriptions --
+    def _send(self, action: int, subs: Iterable[Tuple[int, str]]) -> None:
+        tokens = _token_list(subs)
+        ws = self._ws
+        if not tokens or ws is None or not self.connected.is_set():
+            return  # (re)sent from _on_open once connected
+        msg = {"correlationID": "niftybot01", "action": action,
+               "params": {"mode": LTP_MODE, "tokenList": tokens}}
+        try:
+            ws.send(json.dumps(msg))
+        except Exception as e:
+            log.warning("tick feed send failed: %s", e)
+
+    def subscribe(self, symbols: Iterable[Dict[str, Any]]) -> None:
+        new = []
+        with self._lock:
+            for sym in symbols:
+                key = _symbol_key(sym)
+                if key and key not in self._subs:
+                    self._subs.add(key)
+                    new.append(key)
+        self._send(SUBSCRIBE_ACTION, new)
+
+    def unsubscribe(self, symbols: Iterable[Dict[str, Any]]) -> None:
+        gone = []
+        with self._lock:
+            for sym in symbols:
+                key = _symbol_key(sym)
+                if key and key in self._subs:
+                    self._subs.discard(key)
+                    gone.append(key)
+                    _TICKS.pop(key, None)
+        self._send(UNSUBSCRIBE_ACTION, gone)
+
+    # -- websocket callbacks --
+    def _on_open(self, ws) -> None:
+        self._conn = ws.sock
+        if self._stop.is_set():
+            ws.close()  # stop() ran before this socket connected; its shutdown found nothing to close
+            return
+        self._last_pong = time.monotonic()
+        self.connected.set()
+        metrics.set_gauge("ticks.connected", 1)
+        with self._lock:
+            subs = list(self._subs)
+        log.info("tick feed connected; subscribing %d token(s)", len(subs))
+        self._send(SUBSCRIBE_ACTION, subs)
+
+    def _on_message(self, ws, message) -> None:
+        if not isinstance(message, (bytes, bytearray)):
+            if message == "pong":
+                self._last_pong = time.monotonic()
+                metrics.inc("ticks.pongs")
+            return  # else error text
+        tick = parse_tick(message)
+        if tick is None:
+            return
+        record_tick(tick[1], tick[0], tick[2])
+        metrics.inc("ticks.received")
+
+    def _on_close(self, ws, *args) -> None:
+        self.connected.clear()
+        metrics.set_gauge("ticks.connected", 0)
+
+    def _on_error(self, ws, error) -> None:
+        log.warning("tick feed error: %s", error)
+
+    # -- lifecycle --
+    def _heartbeat(self) -> None:
+        """Text "ping" every HEARTBEAT_S while connected; drop a connection whose pongs stopped."""
+        while not self._stop.wait(HEARTBEAT_S):
+            ws = self._ws
+            if ws is None or not self.connected.is_set():
+                continue
+            if time.monotonic() - self._last_pong > PONG_TIMEOUT_S:
+                log.warning("tick feed: no pong for %.0fs; reconnecting", time.monotonic() - self._last_pong)
+                metrics.inc("ticks.heartbeat_timeouts")
+                self._drop(ws)
+                continue
+            try:
+                ws.send("ping")
+            except Exception as e:
+                log.warning("tick feed ping failed: %s", e)
+
+    def _drop(self, ws) -> None:
+        # Shut the raw socket down rather than ws.close(): the feed thread is the one
+        # reading, so a close handshake from here waits out its timeout, and closing
+        # the fd alone does not wake the feed thread's select().
+        try:
+            ws.sock.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+
+    def _run(self) -> None:
+        attempt = 0
+        while not self._stop.is_set():
+            try:
+                headers = _auth_headers()
+                self._ws = websocket.WebSocketApp(
+                    self.url, header=headers, on_open=self._on_open, on_message=self._on_message,
+                    on_close=self._on_close, on_error=self._on_error,
+                )
+                t0 = time.monotonic()
+                self._ws.run_forever()
+                if time.monotonic() - t0 > HEARTBEAT_S:
+                    attempt = 0  # it was a healthy session; reconnect quickly
+            except Exception as e:
+                log.warning("tick feed connect failed: %s", e)
+            finally:
+                self._on_close(self._ws)
+                self._release()
+            if self._stop.is_set():
+                break
+            metrics.inc("ticks.reconnects")
+            self._stop.wait(random.uniform(0, min(RECONNECT_MAX_S, 0.5 * (2 ** attempt))))
+            attempt += 1
+
+    def _release(self) -> None:
+        # websocket-client leaves the fd open (CLOSE-WAIT until GC) when the server closed first
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.shutdown()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        if websocket is None:
+            raise RuntimeError("websocket-client not installed. Add 'websocket-client' to requirements.")
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tick-feed", daemon=True)
+        self._thread.start()
+        self._beat = threading.Thread(target=self._heartbeat, name="tick-feed-heartbeat", daemon=True)
+        self._beat.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            ws.keep_running = False
+            self._drop(ws)
+        for t in (self._thread, self._beat):
+            if t:
+                t.join(timeout=5)
+        self._thread = self._beat = None
+
+
+_FEED: Optional[TickFeed] = None
+_FEED_LOCK = threading.Lock()
+
+
+def get_feed() -> Optional[TickFeed]:
+    """The process-wide feed, started on first use; None when streaming is disabled."""
+    global _FEED
+    if not feed_enabled():
+        return None
+    if _FEED is None:
+        with _FEED_LOCK:
+            if _FEED is None:
+                feed = TickFeed()
+                feed.start()
+                _FEED = feed
+    return _FEED
+
+
+def watch(symbols: Iterable[Dict[str, Any]]) -> None:
+    """Subscribe symbols on the feed (no-op when streaming is disabled)."""
+    try:
+        feed = get_feed()
+        if feed is not None:
+            feed.subscribe(symbols)
+    except Exception as e:
+        log.warning("tick feed watch failed: %s", e)
+
+
+def unwatch(symbols: Iterable[Dict[str, Any]]) -> None:
+    feed = _FEED
+    if feed is not None:
+        feed.unsubscribe(symbols)
+
+
+def stop_feed() -> None:
+    global _FEED
+    with _FEED_LOCK:
+        if _FEED is not None:
+            _FEED.stop()
+            _FEED = None
@@ -0,0 +1,217 @@
+# service/engine/transport.py
+"""
+Shared HTTP transport for SmartAPI REST calls: pooled keep-alive clients
+(requests, and httpx per event loop) with per-endpoint timeouts, jittered
+retries and rate limiting.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import Any, AsyncGenerator, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore[assignment]
+
+from . import metrics
+from .ratelimit import acquire, aacquire
+from .utils import _env_float
+
+log = logging.getLogger("service.transport")
+
+CONNECT_TIMEOUT_S = 3.05
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Read timeouts per endpoint name (seconds); quotes should fail fast, login may be slow
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "login": 10.0,
+    "refresh": 10.0,
+    "ltp": 5.0,
+    "search": 5.0,
+    "quote": 5.0,
+}
+
+
+class _Policy:
+    """Pool size, retry budget, backoff and per-endpoint timeouts shared by both transports."""
+
+    def __init__(self, pool_size: Optional[int] = None, max_retries: Optional[int] = None,
+                 backoff_s: Optional[float] = None):
+        self.pool_size = int(pool_size or _env_float("SMARTAPI_POOL_SIZE", 10))
+        self.max_retries = int(max_retries if max_retries is not None else _env_float("SMARTAPI_MAX_RETRIES", 2))
+        self.backoff_s = backoff_s if backoff_s is not None else _env_float("SMARTAPI_BACKOFF_S", 0.2)
+
+    def timeout_for(self, endpoint: str) -> float:
+        default = DEFAULT_TIMEOUTS.get(endpoint, _env_float("SMARTAPI_TIMEOUT_S", 10.0))
+        return _env_float(f"SMARTAPI_TIMEOUT_{endpoint.upper()}_S", default)
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": uniform in [0, base * 2^attempt], capped at 2s
+        return random.uniform(0, min(2.0, self.backoff_s * (2 ** attempt)))
+
+
+class Transport(_Policy):
+    def __init__(self, pool_size: Optional[int] = None, max_retries: Optional[int] = None,
+                 backoff_s: Optional[float] = None):
+        super().__init__(pool_size, max_retries, backoff_s)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, endpoint: str, url: str, *, headers: Dict[str, str], data: Any,
+             timeout: Optional[float] = None) -> requests.Response:
+        """
+        POST with pooling/retries. Returns the last response (even a 4xx/5xx one);
+        raises the last network error if every attempt failed to connect.
+        """
+        read_timeout = timeout if timeout is not None else self.timeout_for(endpoint)
+        last_exc: Optional[BaseException] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                metrics.inc(f"smartapi.{endpoint}.retries")
+                time.sleep(self._backoff(attempt - 1))
+            acquire(endpoint)
+            t0 = time.perf_counter()
+            try:
+                r = self.session.post(url, headers=headers, data=data, timeout=(CONNECT_TIMEOUT_S, read_timeout))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.observe_ms(f"smartapi.{endpoint}.latency_ms", (time.perf_counter() - t0) * 1000.0)
+                metrics.inc(f"smartapi.{endpoint}.errors")
+                log.warning("%s attempt %d failed: %s", endpoint, attempt + 1, e)
+                last_exc = e
+                continue
+            metrics.observe_ms(f"smartapi.{endpoint}.latency_ms", (time.perf_counter() - t0) * 1000.0)
+            metrics.inc(f"smartapi.{endpoint}.calls")
+            if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                log.warning("%s HTTP %d; retrying", endpoint, r.status_code)
+                continue
+            return r
+        assert last_exc is not None
+        raise last_exc
+
+
+class AsyncTransport(_Policy):
+    """httpx.AsyncClient with the same pooling/retry/metrics policy; one client per event loop."""
+
+    def __init__(self, pool_size: Optional[int] = None, max_retries: Optional[int] = None,
+                 backoff_s: Optional[float] = None):
+        if httpx is None:
+            raise RuntimeError("httpx not installed. Add 'httpx' to requirements.")
+        super().__init__(pool_size, max_retries, backoff_s)
+        # loop -> (client, its closer); the closer drops the entry once the client is closed
+        self._clients: "weakref.WeakKeyDictionary[Any, Tuple[Any, AsyncGenerator[None, None]]]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    async def _closed_with_loop(self, client: "httpx.AsyncClient") -> AsyncGenerator[None, None]:
+        """
+        Parked right after creation; the loop tracks it as an async generator, so
+        shutdown_asyncgens() resumes it and the client closes while its loop still runs.
+        """
+        try:
+            yield
+        finally:
+            await client.aclose()
+            with self._lock:
+                for loop, (c, _) in list(self._clients.items()):
+                    if c is client:
+                        del self._clients[loop]
+
+    async def _client_for_loop(self) -> "httpx.AsyncClient":
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(loop)
+            new = entry is None
+            if new:
+                limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                client = httpx.AsyncClient(limits=limits)
+                entry = self._clients[loop] = (client, self._closed_with_loop(client))
+        if new:
+            await entry[1].__anext__()
+        return entry[0]
+
+    async def post(self, endpoint: str, url: str, *, headers: Dict[str, str], data: Any,
+                   timeout: Optional[float] = None) -> "httpx.Response":
+        """Async twin of Transport.post()."""
+        client = await self._client_for_loop()
+        read_timeout = timeout if timeout is not None else self.timeout_for(endpoint)
+        to = httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT_S)
+        last_exc: Optional[BaseException] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                metrics.inc(f"smartapi.{endpoint}.retries")
+                await asyncio.sleep(self._backoff(attempt - 1))
+            await aacquire(endpoint)
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(url, headers=headers, content=data, timeout=to)
+            except httpx.TransportError as e:
+                metrics.observe_ms(f"smartapi.{endpoint}.latency_ms", (time.perf_counter() - t0) * 1000.0)
+                metrics.inc(f"smartapi.{endpoint}.errors")
+                log.warning("%s attempt %d failed: %r", endpoint, attempt + 1, e)
+                last_exc = e
+                continue
+            metrics.observe_ms(f"smartapi.{endpoint}.latency_ms", (time.perf_counter() - t0) * 1000.0)
+            metrics.inc(f"smartapi.{endpoint}.calls")
+            if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                log.warning("%s HTTP %d; retrying", endpoint, r.status_code)
+                continue
+            return r
+        assert last_exc is not None
+        raise last_exc
+
+    async def aclose(self) -> None:
+        """Close every loop's client, each on its own loop (app shutdown)."""
+        here = asyncio.get_running_loop()
+        with self._lock:
+            entries = list(self._clients.items())
+            self._clients.clear()
+        for loop, (_, closer) in entries:
+            if loop is here:
+                await closer.aclose()
+            elif loop.is_running():
+                fut = asyncio.run_coroutine_threadsafe(closer.aclose(), loop)
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(fut), 5.0)
+                except Exception as e:
+                    log.warning("closing the async client of another loop failed: %r", e)
+
+
+_TRANSPORT: Optional[Transport] = None
+_LOCK = threading.Lock()
+
+
+def get_transport() -> Transport:
+    global _TRANSPORT
+    if _TRANSPORT is None:
+        with _LOCK:
+            if _TRANSPORT is None:
+                _TRANSPORT = Transport()
+    return _TRANSPORT
+
+
+_ASYNC_TRANSPORT: Optional[AsyncTransport] = None
+
+
+def get_async_transport() -> AsyncTransport:
+    global _ASYNC_TRANSPORT
+    if _ASYNC_TRANSPORT is None:
+        with _LOCK:
+            if _ASYNC_TRANSPORT is None:
+                _ASYNC_TRANSPORT = AsyncTransport()
+    return _ASYNC_TRANSPORT
+
+
+async def close_async_transport() -> None:
+    if _ASYNC_TRANSPORT is not None:
+        await _ASYNC_TRANSPORT.aclose()
@@ -1,10 +1,9 @@
 # service/engine/utils.py
 import os
-import csv
 import json
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict
 
 IST = timezone(timedelta(hours=5, minutes=30))
 
@@ -16,6 +15,13 @@ LOGS_DIR = ROOT / "logs"
 for p in (DATA_DIR, REPORTS_DIR, LOGS_DIR):
     p.mkdir(parents=True, exist_ok=True)
 
+# ---------- Env ----------
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
 # ---------- Time ----------
 def _utc_now_str() -> str:
     return datetime.utcnow().replace(tzinfo=timezone.utc).isoformat(timespec="seconds")
@@ -45,6 +51,7 @@ def _market_window_now_ist() -> Dict[str, Any]:
     }
 
 # ---------- Storage helpers ----------
+# Pre-ledger report files; service/engine/ledger.py imports them once into data/trades.db
 FUNDS_FILE = REPORTS_DIR / "funds.json"
 POSITIONS_FILE = REPORTS_DIR / "open_position.json"
 TRADES_CSV = REPORTS_DIR / "trades.csv"
@@ -61,42 +68,3 @@ def _write_json(path: Path, payload: Any) -> None:
     tmp = path.with_suffix(".tmp")
     tmp.write_text(json.dumps(payload, indent=2, ensure_ascii=False))
     tmp.replace(path)
-
-def _append_csv_row(path: Path, row: Dict[str, Any]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    new_file = not path.exists()
-    with path.open("a", newline="") as f:
-        w = csv.DictWriter(
-            f,
-            fieldnames=[
-                "ts_ist","action","symbol_ce","symbol_pe",
-                "lots_ce","lots_pe","entry_ce","entry_pe",
-                "exit_ce","exit_pe","pnl_ce","pnl_pe","pnl_total","note"
-            ],
-        )
-        if new_file:
-            w.writeheader()
-        w.writerow(row)
-
-# ---------- Domain writes used by positions.py ----------
-def _write_funds(balance: float, realized: float, used: float, mtm: Optional[float]) -> None:
-    payload = {
-        "updated_at_ist": _now_ist_str(),
-        "balance": round(float(balance), 2),
-        "realized": round(float(realized), 2),
-        "used": round(float(used), 2),
-        "mtm": None if mtm is None else round(float(mtm), 2),
-    }
-    _write_json(FUNDS_FILE, payload)
-
-def _write_position_open(position: Dict[str, Any]) -> None:
-    position["opened_at_ist"] = _now_ist_str()
-    _write_json(POSITIONS_FILE, position)
-
-def _write_position_clear() -> None:
-    if POSITIONS_FILE.exists():
-        POSITIONS_FILE.unlink()
-
-def _append_trade_row(row: Dict[str, Any]) -> None:
-    row["ts_ist"] = _now_ist_str()
-    _append_csv_row(TRADES_CSV, row)
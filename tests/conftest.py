@@ -0,0 +1,137 @@
+# tests/conftest.py
+import importlib.util
+import json
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from service.engine import instruments, ledger, quotes, ratelimit, session  # noqa: E402
+
+EXPIRIES = ("29OCT2026", "26NOV2026", "31DEC2026")
+
+
+def _opt(token, name, expiry, strike, opt, lotsize=75):
+    return {
+        "token": str(token), "symbol": f"{name}{expiry[:5]}{expiry[7:]}{strike}{opt}",   # NIFTY29OCT2622000CE
+        "name": name, "expiry": expiry, "strike": f"{strike * 100:.6f}", "lotsize": str(lotsize),
+        "instrumenttype": "OPTIDX", "exch_seg": "NFO", "tick_size": "5.000000",
+    }
+
+
+def scrip_master(strikes=range(21000, 23050, 50)):
+    """A small Angel-style scrip master: equities, NSE indices, NIFTY/BANKNIFTY futures and options."""
+    rows = [
+        {"token": "2885", "symbol": "RELIANCE-EQ", "name": "RELIANCE", "expiry": "", "strike": "-1.000000",
+         "lotsize": "1", "instrumenttype": "", "exch_seg": "NSE", "tick_size": "5.000000"},
+        {"token": "99926000", "symbol": "Nifty 50", "name": "NIFTY", "expiry": "", "strike": "0.000000",
+         "lotsize": "1", "instrumenttype": "AMXIDX", "exch_seg": "NSE", "tick_size": "0.000000"},
+        {"token": "99926009", "symbol": "Nifty Bank", "name": "BANKNIFTY", "expiry": "", "strike": "0.000000",
+         "lotsize": "1", "instrumenttype": "AMXIDX", "exch_seg": "NSE", "tick_size": "0.000000"},
+        {"token": "26000", "symbol": "NIFTY-FUT", "name": "NIFTY", "expiry": "", "strike": "-1.000000",
+         "lotsize": "75", "instrumenttype": "FUTIDX", "exch_seg": "NSE", "tick_size": "5.000000"},
+    ]
+    token = 40000
+    for expiry in EXPIRIES:
+        rows.append({"token": str(token), "symbol": f"NIFTY{expiry[:5]}{expiry[7:]}FUT",
+                     "name": "NIFTY", "expiry": expiry, "strike": "-1.000000", "lotsize": "75",
+                     "instrumenttype": "FUTIDX", "exch_seg": "NFO", "tick_size": "10.000000"})
+        token += 1
+        for k in strikes:
+            for opt in ("CE", "PE"):
+                rows.append(_opt(token, "NIFTY", expiry, k, opt))
+                token += 1
+        for k in range(47000, 49100, 100):
+            for opt in ("CE", "PE"):
+                rows.append(_opt(token, "BANKNIFTY", expiry, k, opt, lotsize=35))
+                token += 1
+    return rows
+
+
+def write_dump(path: Path, rows) -> Path:
+    path.write_text(json.dumps(rows), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def instruments_file(tmp_path, monkeypatch):
+    """INSTR_JSON pointed at a temp dir, with the in-process memos cleared."""
+    path = tmp_path / "angel_instruments.json"
+    monkeypatch.setattr(instruments, "INSTR_JSON", path)
+    monkeypatch.setattr(instruments, "_MEMO", {"key": None, "version": None, "rows": None, "chains": None})
+    monkeypatch.setattr(instruments, "_VERSION", {"key": None, "version": None})
+    return path
+
+
+@pytest.fixture
+def update_script(instruments_file, monkeypatch):
+    """scripts/update_instruments.py as a module, writing next to instruments_file."""
+    spec = importlib.util.spec_from_file_location("update_instruments", ROOT / "scripts" / "update_instruments.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    dest = instruments_file
+    monkeypatch.setattr(mod, "DATA_DIR", dest.parent)
+    monkeypatch.setattr(mod, "DEST", dest)
+    monkeypatch.setattr(mod, "META", dest.with_suffix(".meta.json"))
+    monkeypatch.setattr(mod, "DELTA", dest.with_suffix(".delta.json"))
+
+    def run(*argv):
+        monkeypatch.setattr(sys, "argv", ["update_instruments.py", *argv])
+        mod.main()
+
+    mod.run = run
+    return mod
+
+
+@pytest.fixture
+def ledger_db(tmp_path, monkeypatch):
+    """A fresh ledger database in tmp_path (no legacy report files to import)."""
+    ledger.close()
+    monkeypatch.setattr(ledger, "DB_PATH", tmp_path / "trades.db")
+    monkeypatch.setattr(ledger, "TRADES_CSV", tmp_path / "trades.csv")
+    monkeypatch.setattr(ledger, "FUNDS_FILE", tmp_path / "funds.json")
+    monkeypatch.setattr(ledger, "POSITIONS_FILE", tmp_path / "open_position.json")
+    yield tmp_path / "trades.db"
+    ledger.close()
+
+
+@pytest.fixture
+def smartapi(instruments_file, monkeypatch):
+    """
+    scripts/smartapi_standin.py on an ephemeral port, serving scrip_master(),
+    with a fresh session, quote cache and resolution cache and no client-side
+    rate limits. Yields the server; GET /__stats counts live in `.stats`.
+    """
+    spec = importlib.util.spec_from_file_location("smartapi_standin", ROOT / "scripts" / "smartapi_standin.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    write_dump(instruments_file, scrip_master())
+
+    args = SimpleNamespace(instruments=instruments_file, spot=22000.0, vol=0.0, latency=[], rate_limit=[],
+                           error_rate=0.0, session_ttl=3600.0)
+    srv = mod.StandIn(("127.0.0.1", 0), args)
+    srv.module = mod
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+
+    for name, value in (("SMARTAPI_API_KEY", "x"), ("SMARTAPI_CLIENT_CODE", "x"), ("SMARTAPI_PIN", "x"),
+                        ("SMARTAPI_TOTP_SECRET", "JBSWY3DPEHPK3PXP")):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(session, "_MANAGER", None)
+    monkeypatch.setattr(ratelimit, "_BUCKETS", {ep: None for ep in ratelimit.DEFAULT_RATES})
+    monkeypatch.setattr(quotes, "_QCACHE", {})
+    monkeypatch.setattr(quotes, "_INFLIGHT", {})
+    monkeypatch.setattr(quotes, "_RESOLVED", {"version": None, "loaded": False, "symbols": {}})
+    monkeypatch.setattr(quotes, "INSTR_JSON", instruments_file)      # resolved_tokens.json goes next to it
+    session.set_base_url(f"http://127.0.0.1:{srv.server_address[1]}")
+    yield srv
+
+    session.set_base_url(None)
+    srv.shutdown()
+    srv.server_close()
+    thread.join(5)
@@ -0,0 +1,99 @@
+# tests/test_catalog.py
+import os
+
+import pytest
+
+from service.engine import catalog
+from service.engine.catalog import Catalog
+
+OHLC = "datetime,open,high,low,close,volume\n"
+
+
+def _csv(path, header, rows, mtime_s=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(header + "".join(f"2026-10-{d:02d} 09:15,1,2,0.5,1.5,100\n" for d in rows), encoding="utf-8")
+    if mtime_s is not None:
+        os.utime(path, (mtime_s, mtime_s))
+    return path
+
+
+@pytest.fixture
+def data(tmp_path):
+    root = tmp_path / "data"
+    _csv(root / "old_5min.csv", OHLC, range(1, 4), mtime_s=1_700_000_000)
+    _csv(root / "sub" / "new_15min.csv", OHLC, range(5, 15), mtime_s=1_700_000_500)
+    _csv(root / "trades.csv", "ts_ist,action,pnl_total\n", range(1, 2), mtime_s=1_700_009_999)
+    (root / "notes.txt").write_text("not a csv")
+    return root
+
+
+def _catalog(data, ttl_s=0.0):
+    return Catalog(root=data, path=data.parent / "ohlc_catalog.json", ttl_s=ttl_s)
+
+
+def test_sniff_reads_head_and_tail(data):
+    path = data / "sub" / "new_15min.csv"
+    e = catalog.sniff(path, path.stat().st_size)
+    assert e["ohlc"] and e["rows"] == 10 and e["time_column"] == "datetime"
+    assert (e["start"], e["end"]) == ("2026-10-05 09:15", "2026-10-14 09:15")
+
+    path.write_text(path.read_text().rstrip("\n"))          # no trailing newline on the last row
+    assert catalog.sniff(path, path.stat().st_size)["rows"] == 10
+
+
+def test_candidate_else_newest_ohlc(data):
+    cat = _catalog(data)
+    assert cat.find_ohlc() == data / "sub" / "new_15min.csv"               # trades.csv is newer but not OHLC
+    assert cat.find_ohlc(["missing.csv", "old_5min.csv"]) == data / "old_5min.csv"
+    assert {e["path"] for e in cat.entries(ohlc_only=True)} == {"old_5min.csv", "sub/new_15min.csv"}
+    assert {e["path"] for e in cat.entries()} == {"old_5min.csv", "sub/new_15min.csv", "trades.csv"}
+
+
+def test_changed_and_deleted_files(data):
+    cat = _catalog(data, ttl_s=3600)
+    assert cat.find_ohlc() == data / "sub" / "new_15min.csv"
+
+    _csv(data / "old_5min.csv", OHLC, range(1, 30), mtime_s=1_700_001_000)
+    assert cat.refresh() == 1
+    assert cat.files["old_5min.csv"]["rows"] == 29
+    assert cat.find_ohlc() == data / "old_5min.csv"
+
+    (data / "old_5min.csv").unlink()                        # vanished pick: re-walked right away despite the TTL
+    assert cat.find_ohlc() == data / "sub" / "new_15min.csv"
+    assert "old_5min.csv" not in cat.files
+
+
+def test_persisted_catalog_is_reused(data, monkeypatch):
+    assert _catalog(data).refresh() == 3
+    sniffed = []
+    real = catalog.sniff
+    monkeypatch.setattr(catalog, "sniff", lambda p, size: sniffed.append(p) or real(p, size))
+    again = _catalog(data)
+    assert again.refresh() == 0 and sniffed == []
+    assert again.find_ohlc() == data / "sub" / "new_15min.csv"
+
+    os.utime(data / "trades.csv", (1_700_010_000, 1_700_010_000))
+    assert _catalog(data).refresh() == 1 and sniffed == [data / "trades.csv"]
+
+
+def test_files_added_after_a_walk_are_seen_at_once(data):
+    cat = _catalog(data, ttl_s=3600)
+    assert cat.find_ohlc(["nifty_5min.csv"]) == data / "sub" / "new_15min.csv"
+
+    _csv(data / "nifty_5min.csv", OHLC, range(1, 3), mtime_s=1_600_000_000)   # a candidate, however old
+    assert cat.find_ohlc(["nifty_5min.csv"]) == data / "nifty_5min.csv"
+
+    _csv(data / "sub" / "vendor_1min.csv", OHLC, range(1, 5), mtime_s=1_700_000_900)
+    assert cat.find_ohlc() == data / "sub" / "vendor_1min.csv"                 # sub/ changed: re-walked
+    assert cat.files["sub/vendor_1min.csv"]["rows"] == 4
+
+
+def test_saving_inside_root_does_not_force_walks(data, monkeypatch):
+    cat = Catalog(root=data, path=data / "ohlc_catalog.json", ttl_s=3600)
+    assert cat.find_ohlc() == data / "sub" / "new_15min.csv"
+    assert (data / "ohlc_catalog.json").exists()
+    walks = []
+    monkeypatch.setattr(cat, "refresh", lambda: walks.append(1))
+    cat.find_ohlc()
+    cat.find_ohlc(["ohlc.csv"])
+    assert walks == []
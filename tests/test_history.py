@@ -0,0 +1,69 @@
+# tests/test_history.py
+import numpy as np
+import pytest
+
+from service.engine.history import MtmHistory, _minmax_indices
+
+
+@pytest.mark.parametrize("n,points", [(10, 4), (1000, 500), (1001, 500), (65536, 500), (7919, 37), (500, 3)])
+def test_minmax_indices_keep_extremes_within_budget(n, points):
+    rng = np.random.default_rng(n + points)
+    values = np.cumsum(rng.normal(size=n))
+    values[rng.integers(0, n, size=max(1, n // 50))] = np.nan
+    keep = _minmax_indices(values, points)
+
+    assert len(keep) <= max(points, 4)
+    assert np.all(np.diff(keep) > 0)                       # time order, no duplicates
+    assert keep[0] == 0 and keep[-1] == n - 1
+    assert np.nanargmin(values) in keep and np.nanargmax(values) in keep
+
+    width = -(-n // max(1, (points - 2) // 2))
+    for lo in range(0, n, width):
+        bucket = values[lo:lo + width]
+        if np.isnan(bucket).all():
+            continue
+        kept = values[keep[(keep >= lo) & (keep < lo + width)]]
+        assert np.nanmin(kept) == np.nanmin(bucket) and np.nanmax(kept) == np.nanmax(bucket)
+
+
+def test_minmax_indices_all_nan():
+    keep = _minmax_indices(np.full(100, np.nan), 10)
+    assert keep[0] == 0 and keep[-1] == 99 and len(keep) <= 10
+
+
+def test_ring_wraps_and_windows():
+    h = MtmHistory(size=8, min_interval_s=0)
+    for t in range(20):
+        assert h.record(22000 + t, 100 + t, 90 - t, float(t), ts=1_700_000_000 + t)
+    q = h.query()
+    assert q["count"] == 8
+    assert [s["mtm"] for s in q["samples"]] == [float(t) for t in range(12, 20)]   # oldest overwritten
+
+    w = h.query(start=1_700_000_014, end=1_700_000_017)
+    assert [s["mtm"] for s in w["samples"]] == [14.0, 15.0, 16.0]
+    assert w["samples"][0]["ts_ist"] == "2023-11-15 03:43:34"     # epoch 1700000014 in IST
+
+
+def test_min_interval_and_reset():
+    h = MtmHistory(size=16, min_interval_s=1.0)
+    assert h.record(22000, 100, 90, 0.0, ts=100.0)
+    assert not h.record(22000, 100, 90, 1.0, ts=100.5)            # too soon
+    assert h.record(22000, 100, 90, 2.0, ts=100.5, force=True)
+    assert h.record(22000, None, 90, None, ts=102.0)
+    samples = h.query()["samples"]
+    assert [s["mtm"] for s in samples] == [0.0, 2.0, None]
+    assert samples[-1]["ce"] is None
+
+    h.reset(position_id=7)
+    q = h.query()
+    assert q == {"position_id": 7, "count": 0, "samples": []}
+
+
+def test_query_downsamples_long_histories():
+    h = MtmHistory(size=5000, min_interval_s=0)
+    for t in range(5000):
+        h.record(22000, 100, 90, float(np.sin(t / 50.0) * 1000), ts=float(t))
+    q = h.query(points=100)
+    assert q["count"] == 5000 and len(q["samples"]) <= 100
+    mtm = [s["mtm"] for s in q["samples"]]
+    assert max(mtm) == 1000.0 and min(mtm) == -1000.0
@@ -0,0 +1,63 @@
+# tests/test_instrument_cache.py
+import os
+
+from conftest import scrip_master, write_dump
+from service.engine import instruments
+
+
+def _cold(monkeypatch):
+    """Forget the in-process memos so the next load goes through the Arrow cache."""
+    monkeypatch.setattr(instruments, "_MEMO", {"key": None, "version": None, "rows": None, "chains": None})
+    monkeypatch.setattr(instruments, "_VERSION", {"key": None, "version": None})
+
+
+def test_warm_load_reads_the_cache_without_parsing(instruments_file, monkeypatch):
+    write_dump(instruments_file, scrip_master())
+    first = instruments.load_instruments()
+    assert instruments.load_instruments() is first      # same file: in-memory table
+
+    calls = []
+    monkeypatch.setattr(instruments, "_parse_instruments_json", lambda p: calls.append(p) or [])
+    _cold(monkeypatch)
+    warm = instruments.load_instruments()
+    assert calls == []
+    assert warm.token.tolist() == first.token.tolist()
+    assert warm.strikes().tolist() == first.strikes().tolist()
+
+
+def test_touched_file_is_hashed_once(instruments_file, monkeypatch):
+    write_dump(instruments_file, scrip_master())
+    instruments.load_instruments()
+    version = instruments.instruments_version()
+    st = instruments_file.stat()
+    os.utime(instruments_file, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+
+    hashes = []
+    real_sha = instruments._file_sha256
+    monkeypatch.setattr(instruments, "_file_sha256", lambda p: hashes.append(p) or real_sha(p))
+    monkeypatch.setattr(instruments, "_parse_instruments_json", lambda p: (_ for _ in ()).throw(AssertionError("reparsed")))
+
+    _cold(monkeypatch)
+    instruments.load_instruments()
+    assert len(hashes) == 1                              # same content: a sha hit, not a rebuild
+    meta = instruments._read_cache_meta(instruments._cache_path())
+    assert (meta["mtime_ns"], meta["size"]) == tuple(map(str, instruments._stat_key(instruments_file)))
+
+    _cold(monkeypatch)
+    instruments.load_instruments()
+    assert instruments.instruments_version() == version
+    assert len(hashes) == 1                              # stat key rewritten: no second hash
+
+
+def test_instruments_version_is_memoized_per_stat(instruments_file, monkeypatch):
+    assert instruments.instruments_version() is None     # no file yet
+    write_dump(instruments_file, scrip_master())
+    hashes = []
+    real_sha = instruments._file_sha256
+    monkeypatch.setattr(instruments, "_file_sha256", lambda p: hashes.append(p) or real_sha(p))
+
+    v1 = instruments.instruments_version()
+    assert v1 == instruments.instruments_version() and len(hashes) == 1
+    write_dump(instruments_file, scrip_master(strikes=range(21000, 22000, 50)))
+    v2 = instruments.instruments_version()
+    assert v2 != v1 and len(hashes) == 2
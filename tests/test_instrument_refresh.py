@@ -0,0 +1,178 @@
+# tests/test_instrument_refresh.py
+import json
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import _opt, scrip_master, write_dump
+from service.engine import instruments
+
+
+def _v2(rows):
+    """v1 with a changed row mid-table, a removed row and a new token tying an existing strike."""
+    rows = [dict(r) for r in rows]
+    changed = next(r for r in rows if r["symbol"] == "NIFTY26NOV2622000PE")
+    changed["lotsize"] = "65"
+    removed = next(r for r in rows if r["symbol"] == "NIFTY26NOV2621500CE")
+    rows.remove(removed)
+    # same chain and strike as an existing contract; a lower token than every option
+    rows.insert(5, _opt(100, "NIFTY", "26NOV2026", 22050, "CE"))
+    rows.append(_opt(99999, "NIFTY", "26NOV2026", 23500, "PE"))
+    return rows, changed["token"], removed["token"]
+
+
+def _columns(t):
+    return {name: getattr(t, name) for name in ("token", "tradingsymbol", "strike", "lotsize", "opt_code")}
+
+
+def test_patch_from_delta_equals_full_rebuild(tmp_path, instruments_file, update_script, monkeypatch):
+    v1 = write_dump(tmp_path / "v1.json", scrip_master())
+    rows2, changed, removed = _v2(json.loads(v1.read_text()))
+    v2 = write_dump(tmp_path / "v2.json", rows2)
+
+    update_script.run("--src", str(v1))
+    base = instruments.load_instruments()
+    assert instruments._cache_path().exists()
+
+    update_script.run("--src", str(v2))
+    delta = json.loads(update_script.DELTA.read_text())
+    assert [r["token"] for r in delta["changed"]] == [changed]
+    assert delta["removed"] == [removed]
+    assert sorted(r["token"] for r in delta["added"]) == ["100", "99999"]
+
+    parses = []
+    real_parse = instruments._parse_instruments_json
+    monkeypatch.setattr(instruments, "_parse_instruments_json", lambda p: parses.append(p) or real_parse(p))
+    instruments._MEMO.update(key=None, rows=None, chains=None)
+    patched = instruments.load_instruments()
+    assert parses == []                              # applied from the delta, not reparsed
+    full = instruments.InstrumentTable.from_rows(real_parse(instruments_file))
+
+    # same rows with the same values, token by token
+    assert sorted(patched.token.tolist()) == sorted(full.token.tolist())
+    p_at = {t: n for n, t in enumerate(patched.token.tolist())}
+    f_at = {t: n for n, t in enumerate(full.token.tolist())}
+    order = [p_at[t] for t in full.token.tolist()]
+    for name, col in _columns(full).items():
+        assert getattr(patched, name)[order].tolist() == col.tolist(), name
+
+    # changed rows keep their slot; only new tokens move to the end
+    survivors = [t for t in base.token.tolist() if t != removed]
+    assert patched.token[:len(survivors)].tolist() == survivors
+    assert patched.lotsize[p_at[changed]] == 65
+    assert f_at["100"] < f_at[changed] and p_at["100"] > p_at[changed]
+
+    # and every lookup answers the same, including the 22050 tie (lowest token wins either way)
+    a, b = instruments.OptionChainIndex(patched), instruments.OptionChainIndex(full)
+    for und in ("NIFTY", "BANKNIFTY"):
+        for opt in ("CE", "PE"):
+            for k in range(20500, 50000, 25):
+                x, y = a.lookup(opt, k, underlying=und), b.lookup(opt, k, underlying=und)
+                assert (x and x.token) == (y and y.token), (und, opt, k)
+    tie = a.lookup("CE", 22050, underlying="NIFTY", months=("2026-11",))
+    assert tie.token == "100"
+
+
+def test_index_filter_keeps_every_spot_candidate(tmp_path, instruments_file):
+    write_dump(instruments_file, scrip_master())
+    table = instruments.load_instruments()
+    kept = {r.token for r in instruments._possible_nifty_index_rows(table)}
+    assert {"99926000", "26000"} <= kept        # NSE AMXIDX and NSE FUTIDX both survive the ingest filter
+    assert "2885" not in set(table.token.tolist())
+
+
+# ---------- Conditional download ----------
+class _Dumps(ThreadingHTTPServer):
+    """Serves `body` with an ETag/Last-Modified and honours If-None-Match; records request headers."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _DumpHandler)
+        self.requests = []
+        self.set_body(b"[]")
+
+    def set_body(self, body: bytes) -> None:
+        self.body = body
+        self.etag = f'"{hash(body) & 0xFFFFFFFF:08x}"'
+        self.last_modified = formatdate(usegmt=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/OpenAPIScripMaster.json"
+
+
+class _DumpHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        srv = self.server
+        srv.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == srv.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(srv.body)))
+        self.send_header("ETag", srv.etag)
+        self.send_header("Last-Modified", srv.last_modified)
+        self.end_headers()
+        self.wfile.write(srv.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def dump_server():
+    srv = _Dumps()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_conditional_download_etag_and_304(update_script, dump_server):
+    rows = scrip_master()
+    dump_server.set_body(json.dumps(rows).encode())
+    dest = update_script.DEST
+
+    update_script.run("--src", dump_server.url)
+    assert "If-None-Match" not in dump_server.requests[-1]
+    meta = json.loads(update_script.META.read_text())
+    assert meta["etag"] == dump_server.etag and meta["src"] == dump_server.url
+    saved = json.loads(dest.read_text())
+    assert len(saved) == len(rows) - 1                    # the equity row is filtered out
+    first = (dest.stat().st_mtime_ns, update_script.DELTA.read_text())
+
+    # unchanged upstream: validators sent, 304, nothing rewritten
+    update_script.run("--src", dump_server.url)
+    assert dump_server.requests[-1]["If-None-Match"] == dump_server.etag
+    assert dump_server.requests[-1]["If-Modified-Since"] == dump_server.last_modified
+    assert (dest.stat().st_mtime_ns, update_script.DELTA.read_text()) == first
+
+    # new upstream dump: downloaded and diffed against the previous snapshot
+    rows2 = [dict(r) for r in rows]
+    rows2[-1]["lotsize"] = "30"
+    dump_server.set_body(json.dumps(rows2).encode())
+    update_script.run("--src", dump_server.url)
+    delta = json.loads(update_script.DELTA.read_text())
+    assert [r["token"] for r in delta["changed"]] == [rows2[-1]["token"]]
+    assert delta["added"] == [] and delta["removed"] == []
+    assert json.loads(update_script.META.read_text())["etag"] == dump_server.etag
+
+    # --force ignores the stored validators
+    update_script.run("--src", dump_server.url, "--force")
+    assert "If-None-Match" not in dump_server.requests[-1]
+    assert json.loads(update_script.DELTA.read_text())["changed"] == []
+
+
+def test_streamed_and_full_ingest_write_the_same_snapshot(tmp_path, update_script):
+    src = write_dump(tmp_path / "master.json", scrip_master())
+    update_script.run("--src", str(src), "--mode", "full")
+    full = update_script.DEST.read_text()
+    update_script.run("--src", str(src))
+    assert json.loads(update_script.DEST.read_text()) == json.loads(full)
+    delta = json.loads(update_script.DELTA.read_text())
+    assert (delta["added"], delta["removed"], delta["changed"]) == ([], [], [])
@@ -0,0 +1,64 @@
+# tests/test_instrument_table.py
+from datetime import datetime
+
+import numpy as np
+
+from conftest import _opt, scrip_master
+from service.engine import instruments
+from service.engine.instruments import InstrumentRow, InstrumentTable
+
+
+def _parsed(rows=None):
+    return [instruments._instrument_from_row(r) for r in (rows or scrip_master())]
+
+
+def test_rows_view_as_the_instruments_they_came_from():
+    objs = _parsed()
+    t = InstrumentTable.from_rows(objs)
+    assert len(t) == len(objs)
+    assert [r.to_instrument() for r in t] == objs
+    assert t[-1].to_instrument() == objs[-1]
+
+    row = next(r for r in t if r.tradingsymbol == "NIFTY29OCT2622000CE")
+    assert isinstance(row, InstrumentRow)
+    assert (row.exchange, row.strike, row.lotsize, row.optiontype) == ("NFO", 22000, 75, "CE")
+    assert row.expiry_dt == datetime(2026, 10, 29)
+    assert instruments._ts_of(row) == "NIFTY29OCT2622000CE" and instruments._strike_of(row) == 22000
+
+    eq = next(r for r in t if r.token == "2885")
+    assert (eq.strike, eq.expiry_dt, eq.optiontype) == (None, None, None)   # -1 strike and "" expiry are missing
+
+
+def test_columns_are_compact_arrays():
+    t = InstrumentTable.from_rows(_parsed())
+    assert t.exchange_code.dtype == np.int8 and t.opt_code.dtype == np.int8
+    assert t.strike.dtype == np.int32 and t.lotsize.dtype == np.int32
+    assert t.expiry.dtype == np.dtype("datetime64[D]")
+    assert set(t.exchanges) == {"NSE", "NFO"}
+    assert not hasattr(t, "__dict__") and not hasattr(t[0], "__dict__")
+
+
+def test_pool_mask_matches_a_per_row_filter():
+    objs = _parsed()
+    t = InstrumentTable.from_rows(objs)
+    for month in ("2026-10", "2026-11", "2026-12", "2027-01"):
+        want = [i.token for i in objs
+                if i.exchange == "NFO" and "OPTIDX" in i.instrumenttype and instruments._is_core_nifty(i)
+                and instruments._month_key(i.expiry_dt) == month]
+        assert instruments._nifty_monthly_pool(t, month).token.tolist() == want
+        assert instruments._nifty_monthly_pool(objs, month).token.tolist() == want   # plain lists still work
+    assert "BANKNIFTY" not in set(instruments._nifty_monthly_pool(t, "2026-10").name.tolist())
+
+
+def test_take_concat_and_strike_fallback():
+    a = InstrumentTable.from_rows(_parsed([r for r in scrip_master() if r["exch_seg"] == "NSE"]))
+    extra = _opt(90001, "NIFTY", "29OCT2026", 22000, "PE")
+    extra.update(symbol="NIFTY 29 OCT 2026 PE 22000", strike="")  # strike only in the symbol
+    b = InstrumentTable.from_rows(_parsed([extra]))
+    assert b.exchanges == ("NFO",)
+
+    both = a.concat(b)
+    assert [r.exchange for r in both] == ["NSE"] * len(a) + ["NFO"]
+    assert both[-1].strike is None and both.strikes()[-1] == 22000
+    assert both[both.exchange_is("nfo")].token.tolist() == ["90001"]
+    assert both.take([0, len(both) - 1]).token.tolist() == ["2885", "90001"]
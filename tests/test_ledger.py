@@ -0,0 +1,165 @@
+# tests/test_ledger.py
+import csv
+import json
+import random
+import sqlite3
+
+import pytest
+
+from service.engine import ledger, metrics
+
+
+@pytest.fixture
+def db(ledger_db, monkeypatch):
+    """A fresh ledger in tmp_path, snapshotting every 4 events."""
+    monkeypatch.setattr(ledger, "SNAPSHOT_EVERY", 4)
+    return ledger_db
+
+
+def _position(rng, side):
+    lots = (2, 1) if side == "UP" else (1, 2)
+    legs = {kind: {"symbol": {"exchange": "NFO", "tradingsymbol": f"NIFTY29OCT26{22000 + 50 * n}{kind.upper()}",
+                              "symboltoken": str(40000 + n)},
+                   "lots": lots[n], "entry": round(rng.uniform(50, 250), 2)}
+            for n, kind in enumerate(ledger.KINDS)}
+    return {"side": side, "ratio": list(lots), "used": round(rng.uniform(10000, 40000), 2), **legs}
+
+
+def _journal(path):
+    with sqlite3.connect(str(path)) as conn:
+        return conn.execute("SELECT kind, payload FROM journal ORDER BY seq").fetchall()
+
+
+def _snapshot_seqs(path):
+    with sqlite3.connect(str(path)) as conn:
+        return [r[0] for r in conn.execute("SELECT seq FROM snapshots ORDER BY seq")]
+
+
+def test_snapshot_plus_tail_equals_full_replay(db):
+    rng = random.Random(18)
+    books = ("default", "v_up", "v_down")
+    expect = {b: ledger.initial_state() for b in books}
+    open_ids = {}
+    ledger.record_funds_change(300000.0, 0.0, 0.0, portfolio="v_up")
+    expect["v_up"].update(balance=300000.0)
+    for _ in range(40):
+        book = rng.choice(books)
+        st = expect[book]
+        if book in open_ids and rng.random() < 0.6:
+            pnl = round(rng.uniform(-5000, 5000), 2)
+            st.update(balance=round(st["balance"] + pnl, 2), realized=round(st["realized"] + pnl, 2), used=0.0, open=None)
+            ledger.record_close(open_ids.pop(book), {"ce": 120.0, "pe": 80.0}, {"pnl_total": pnl, "note": "test"},
+                                st["balance"], st["realized"], portfolio=book)
+        elif book not in open_ids and rng.random() < 0.7:
+            pos = _position(rng, rng.choice(("UP", "DOWN")))
+            pid = open_ids[book] = ledger.record_open(pos, portfolio=book)
+            st.update(open=dict(pos, id=pid), used=pos["used"])
+        else:
+            st.update(balance=round(st["balance"] + 1000.0, 2))
+            ledger.record_funds_change(st["balance"], st["realized"], portfolio=book)
+
+    full = {}
+    for kind, payload in _journal(db):
+        ledger.apply_event(full, kind, json.loads(payload))
+
+    ledger.close()
+    restored = ledger.load_states()
+    assert restored == full
+    assert json.loads(json.dumps(expect)) == restored
+    assert ledger.load_state("nope") == ledger.initial_state()
+
+    seqs = _snapshot_seqs(db)
+    assert 0 < len(seqs) <= ledger.SNAPSHOTS_KEPT
+    assert metrics.snapshot()["gauges"]["ledger.replayed_events"] < ledger.SNAPSHOT_EVERY
+    assert {p["id"] for p in ledger.open_positions()} == set(open_ids.values())
+
+
+def test_snapshot_compacts_the_tail(db):
+    ledger.record_funds_change(250000.0, 0.0)              # journal: seed + 1 event, below SNAPSHOT_EVERY
+    assert _snapshot_seqs(db) == []
+    ledger.snapshot()
+    assert _snapshot_seqs(db) == [len(_journal(db))]
+    ledger.snapshot()                                      # nothing new to fold in
+    assert len(_snapshot_seqs(db)) == 1
+
+    ledger.close()
+    assert ledger.load_state()["balance"] == 250000.0
+    assert metrics.snapshot()["gauges"]["ledger.replayed_events"] == 0
+
+
+def test_new_ledger_seeds_the_journal(db):
+    assert ledger.load_states() == {"default": ledger.initial_state()}
+    assert [k for k, _ in _journal(db)] == ["funds"]
+
+
+# ---------- Open / close transactions ----------
+def _count(path, table):
+    with sqlite3.connect(str(path)) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_open_and_close_write_every_row_together(db):
+    pos = _position(random.Random(17), "UP")
+    pid = ledger.record_open(pos)
+    opened = ledger.position(pid)
+    assert (opened["status"], opened["side"], opened["used"]) == ("open", "UP", pos["used"])
+    assert [(leg["kind"], leg["lots"], leg["entry"]) for leg in opened["legs"]] == \
+        [(k, pos[k]["lots"], pos[k]["entry"]) for k in ledger.KINDS]
+    assert [f["side"] for f in opened["fills"]] == ["BUY", "BUY"]
+    assert [p["id"] for p in ledger.open_positions()] == [pid]
+
+    tid = ledger.record_close(pid, {"ce": 150.0, "pe": 60.0}, {"action": "CLOSE", "pnl_total": 1234.5, "note": "tp"},
+                              501234.5, 1234.5)
+    closed = ledger.position(pid)
+    assert (closed["status"], closed["pnl"], closed["note"]) == ("closed", 1234.5, "tp")
+    assert {leg["kind"]: leg["exit"] for leg in closed["legs"]} == {"ce": 150.0, "pe": 60.0}
+    assert [f["side"] for f in closed["fills"]] == ["BUY", "BUY", "SELL", "SELL"]
+    trade = ledger.recent_trades(1)[0]
+    assert (trade["id"], trade["position_id"], trade["side"], trade["pnl_total"]) == (tid, pid, "UP", 1234.5)
+    assert ledger.open_positions() == []
+    assert ledger.load_state()["balance"] == 501234.5
+
+
+def test_failed_write_rolls_back_every_row(db):
+    good = _position(random.Random(3), "DOWN")
+    bad = {k: v for k, v in good.items() if k != "pe"}             # the pe leg is missing
+    assert ledger.open_positions() == []
+    rollbacks = metrics.counter("ledger.rollbacks")
+    journal = len(_journal(db))
+
+    with pytest.raises(KeyError):
+        ledger.record_open(bad)
+    with pytest.raises(KeyError):
+        ledger.record_opens([("default", good), ("v_up", bad)])      # a batch is one commit too
+    assert metrics.counter("ledger.rollbacks") == rollbacks + 2
+    assert [_count(db, t) for t in ("positions", "legs", "fills")] == [0, 0, 0]
+    assert len(_journal(db)) == journal
+
+    assert ledger.record_opens([("default", good), ("v_up", good)]) == [1, 2]
+    assert [_count(db, t) for t in ("positions", "legs", "fills")] == [2, 4, 4]
+
+
+def test_legacy_reports_are_imported_once(ledger_db):
+    with ledger.TRADES_CSV.open("w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=ledger.TRADE_FIELDS)
+        w.writeheader()
+        w.writerow({"ts_ist": "2026-10-01 09:21:00", "action": "CLOSE", "symbol_ce": "NIFTY29OCT2622000CE",
+                    "symbol_pe": "NIFTY29OCT2622000PE", "lots_ce": "2", "lots_pe": "1", "entry_ce": "100",
+                    "entry_pe": "90", "exit_ce": "130", "exit_pe": "70", "pnl_ce": "4500", "pnl_pe": "-1500",
+                    "pnl_total": "3000", "note": "legacy"})
+    ledger.FUNDS_FILE.write_text(json.dumps({"balance": 503000.0, "realized": 3000.0, "used": 0.0,
+                                             "updated_at_ist": "2026-10-01 15:28:00"}))
+    legs = _position(random.Random(5), "DOWN")
+    ledger.POSITIONS_FILE.write_text(json.dumps(dict(legs, opened_at_ist="2026-10-02 09:21:00")))
+
+    trade = ledger.recent_trades(5)[0]
+    assert (trade["note"], trade["side"], trade["pnl_total"], trade["lots_ce"]) == ("legacy", "UP", 3000.0, 2)
+    assert ledger.latest_funds()["balance"] == 503000.0
+    (pos,) = ledger.open_positions()
+    assert (pos["side"], pos["opened_at"]) == ("DOWN", "2026-10-02 09:21:00")
+    state = ledger.load_state()
+    assert (state["balance"], state["open"]["id"]) == (503000.0, pos["id"])   # the journal starts from them
+
+    ledger.close()
+    assert len(ledger.recent_trades(5)) == 1 and len(ledger.open_positions()) == 1
+    assert ledger.TRADES_CSV.exists()                                # the files are left in place
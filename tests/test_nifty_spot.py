@@ -0,0 +1,83 @@
+# tests/test_nifty_spot.py
+import pytest
+
+from conftest import scrip_master, write_dump
+from service.engine import instruments, metrics
+
+
+class _Client:
+    """SmartConnect stand-in: ltpData answers from `prices` (token -> LTP) and records every call."""
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def ltpData(self, exchange, tradingsymbol, symboltoken):
+        self.calls.append(symboltoken)
+        ltp = self.prices.get(symboltoken)
+        if ltp is None:
+            return {"status": False, "message": "Invalid Token", "data": None}
+        return {"status": True, "data": {"exchange": exchange, "tradingsymbol": tradingsymbol, "ltp": ltp}}
+
+
+@pytest.fixture
+def spot(instruments_file, monkeypatch):
+    for name in ("NIFTY_SPOT_TRADINGSYMBOL", "NIFTY_SPOT_TOKEN", "SMARTAPI_WS"):
+        monkeypatch.delenv(name, raising=False)
+    write_dump(instruments_file, scrip_master())
+    client = _Client({"99926000": 22010.5, "26000": 22050.0})
+    monkeypatch.setattr(instruments, "_smart_client", lambda: client)
+    return client
+
+
+def test_probe_once_then_one_call_from_the_cache(spot, instruments_file):
+    spot.prices.pop("99926000")                                  # "Nifty 50" has no LTP
+    spot.prices["99926009"] = 50.0                               # "Nifty Bank" is too low to be the index
+    probes = metrics.counter("spot.probe_calls")
+
+    assert instruments.get_nifty_spot() == 22050.0
+    assert spot.calls == ["99926000", "99926009", "26000"]
+    assert metrics.counter("spot.probe_calls") == probes + 3
+    assert instruments.nifty_spot_symbol() == {"exchange": "NSE", "tradingsymbol": "NIFTY-FUT", "symboltoken": "26000"}
+
+    spot.calls.clear()
+    hits = metrics.counter("spot.cache_hits")
+    assert instruments.get_nifty_spot() == 22050.0
+    assert spot.calls == ["26000"]
+    assert metrics.counter("spot.cache_hits") == hits + 1
+    assert metrics.counter("spot.probe_calls") == probes + 3
+
+
+def test_failing_cached_token_is_reprobed(spot):
+    instruments.get_nifty_spot()
+    assert instruments.nifty_spot_symbol()["symboltoken"] == "99926000"
+
+    spot.prices.pop("99926000")
+    spot.calls.clear()
+    reprobes = metrics.counter("spot.reprobes")
+    assert instruments.get_nifty_spot() == 22050.0
+    assert spot.calls == ["99926000", "99926000", "99926009", "26000"]   # cached try, then the probe walk
+    assert metrics.counter("spot.reprobes") == reprobes + 1
+    assert instruments.nifty_spot_symbol()["symboltoken"] == "26000"
+
+
+def test_cache_is_keyed_by_instruments_version(spot, instruments_file):
+    instruments.get_nifty_spot()
+    version = instruments.instruments_version()
+    assert instruments._read_spot_cache(version)["token"] == "99926000"
+
+    write_dump(instruments_file, scrip_master(strikes=range(21000, 23100, 50)))
+    assert instruments.instruments_version() != version
+    assert instruments.nifty_spot_symbol() is None
+    spot.calls.clear()
+    instruments.get_nifty_spot()
+    assert spot.calls == ["99926000"]                            # a fresh probe, which wins on the first row
+
+
+def test_env_pair_skips_the_probe(spot, monkeypatch):
+    monkeypatch.setenv("NIFTY_SPOT_TRADINGSYMBOL", "Nifty 50")
+    monkeypatch.setenv("NIFTY_SPOT_TOKEN", "99926000")
+    assert instruments.get_nifty_spot() == 22010.5
+    assert spot.calls == ["99926000"]
+    assert instruments.nifty_spot_symbol()["symboltoken"] == "99926000"
+    assert instruments._read_spot_cache(instruments.instruments_version()) is None
@@ -0,0 +1,85 @@
+# tests/test_option_chain.py
+import random
+
+import numpy as np
+
+from conftest import EXPIRIES, _opt, scrip_master
+from service.engine import instruments
+from service.engine.instruments import InstrumentTable, OptionChainIndex
+
+
+def _random_master(seed: int):
+    """Sparse, shuffled chains with duplicate strikes under other tokens and some strike-less rows."""
+    rng = random.Random(seed)
+    rows = [r for r in scrip_master() if r["instrumenttype"] != "OPTIDX" or rng.random() < 0.6]
+    tokens = rng.sample(range(100, 39999), 60)
+    for token in tokens[:40]:
+        name, k = rng.choice((("NIFTY", rng.randrange(21000, 23050, 50)), ("BANKNIFTY", rng.randrange(47000, 49100, 100))))
+        rows.append(_opt(token, name, rng.choice(EXPIRIES), k, rng.choice(("CE", "PE"))))
+    for token in tokens[40:]:
+        # strike left blank: points come from the trailing digits of a monthly-style symbol
+        expiry, k, opt = rng.choice(EXPIRIES), rng.randrange(21000, 23050, 50), rng.choice(("CE", "PE"))
+        row = _opt(token, "NIFTY", expiry, k, opt)
+        row.update(symbol=f"NIFTY{expiry[7:]}{expiry[2:5]}{k}{opt}", strike="")
+        rows.append(row)
+    rng.shuffle(rows)
+    return InstrumentTable.from_rows(instruments._instrument_from_row(r) for r in rows if instruments.is_index_row(r))
+
+
+def _brute(t, opt, strike, und=None, months=None, max_dist=None):
+    best = None
+    for n in range(len(t)):
+        r = t.row(n)
+        if r.exchange != "NFO" or r.optiontype != opt:
+            continue
+        k = int(t.strikes([n])[0])
+        u = "NIFTY" if r.name == "NIFTY" else r.name
+        m = r.expiry_dt.strftime("%Y-%m")
+        if k == instruments._NA_INT or (und and u not in und) or (months and m not in months):
+            continue
+        cand = (abs(k - strike), int(r.token), n)
+        best = cand if best is None or cand < best else best
+    if best is None or (max_dist is not None and best[0] > max_dist):
+        return None
+    return t.token[best[2]]
+
+
+def test_lookup_matches_brute_force():
+    for seed in range(3):
+        t = _random_master(seed)
+        idx = OptionChainIndex(t)
+        rng = random.Random(100 + seed)
+        for _ in range(300):
+            opt = rng.choice(("CE", "PE"))
+            strike = rng.randrange(20000, 50500, 5)
+            und = rng.choice((None, ("NIFTY",), ("BANKNIFTY",), ("NIFTY", "BANKNIFTY")))
+            months = rng.choice((None, ("2026-10",), ("2026-11", "2026-12")))
+            max_dist = rng.choice((None, 0, 50, 150))
+            hit = idx.lookup(opt, strike, underlying=und, months=months, max_dist=max_dist)
+            assert (hit and hit.token) == _brute(t, opt, strike, und, months, max_dist), (seed, opt, strike, und, months, max_dist)
+
+
+def test_strict_matcher_nearest_within_150_lowest_token_on_ties():
+    t = _random_master(7)
+    pool = instruments._nifty_monthly_pool(t, "2026-11")
+    assert len(pool) and pool.core_nifty.all()
+    for strike in range(20800, 23300, 25):
+        for opt in ("CE", "PE"):
+            hit = instruments._best_match_option_strict(pool, opt, strike)
+            assert (hit and hit.token) == _brute(pool, opt, strike, max_dist=150), (opt, strike)
+    assert instruments._best_match_option_strict(pool, "XX", 22000) is None
+    # plain Instrument lists are accepted too
+    rows = [r.to_instrument() for r in pool]
+    assert instruments._best_match_option_strict(rows, "CE", 22010).token == \
+        instruments._best_match_option_strict(pool, "CE", 22010).token
+
+
+def test_strikes_are_points_with_symbol_fallback():
+    rows = [_opt(1, "NIFTY", "29OCT2026", 22050, "CE"), _opt(2, "NIFTY", "29OCT2026", 22100, "PE")]
+    rows[1].update(symbol="NIFTY26OCT22100PE", strike="")
+    t = InstrumentTable.from_rows(instruments._instrument_from_row(r) for r in rows)
+    assert t.row(0).strike == 22050
+    assert t.row(1).strike is None                     # unknown in the dump...
+    assert t.strikes().tolist() == [22050, 22100]       # ...recovered from the symbol
+    assert t.strikes(np.array([1])).tolist() == [22100]
+    assert OptionChainIndex(t).lookup("PE", 22090).token == "2"
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from service.engine import ledger, metrics, portfolios, positions, reports
+from service.engine.portfolios import Variant
+from service.engine.quotes import quote_key
+
+
+def _sym(token, kind):
+    return {"exchange": "NFO", "tradingsymbol": f"NIFTY29OCT26{token}{kind}", "symboltoken": str(token)}
+
+
+class _Quotes:
+    """aget_quotes stand-in: one price per token, every call recorded."""
+
+    def __init__(self):
+        self.prices = {}
+        self.calls = []
+
+    async def __call__(self, symbols, mode="LTP", max_age_s=None):
+        self.calls.append([quote_key(s) for s in symbols])
+        return {quote_key(s): self.prices.get(quote_key(s)) for s in symbols}
+
+
+@pytest.fixture
+def book(ledger_db, monkeypatch):
+    monkeypatch.setattr(portfolios, "_REGISTRY", {})
+    monkeypatch.setattr(positions, "_open", None)
+    monkeypatch.setattr(reports, "submit_funds", lambda *a, **k: None)
+    # ATM 22000 CE/PE, shifted by the variant's strike offset
+    monkeypatch.setattr(portfolios, "pick_monthly_option_symbols",
+                        lambda direction, off=0: (_sym(22000 + off, "CE"), "", _sym(22000 + off + 1, "PE"), ""))
+    quotes = _Quotes()
+    monkeypatch.setattr(portfolios, "aget_quotes", quotes)
+    portfolios.register("atm")
+    portfolios.register("atm_1to1", Variant(ratio=(1, 1)))
+    portfolios.register("otm100", Variant(strike_offset=100, starting_funds=200000))
+    portfolios.register("picky", Variant(min_confidence=0.9))
+    return quotes
+
+
+def test_variants_open_and_close_on_one_quote_pass_and_one_commit(book):
+    book.prices = {"22000": 120.0, "22001": 95.5, "22100": 80.25, "22101": 140.0}
+    commits = metrics.counter("ledger.commits")
+    opened = asyncio.run(portfolios.aopen_all("UP", 0.7, (2, 1)))
+
+    assert len(book.calls) == 1 and sorted(book.calls[0]) == ["22000", "22001", "22100", "22101"]
+    assert metrics.counter("ledger.commits") == commits + 1
+    assert set(opened) == {"atm", "atm_1to1", "otm100"}
+    assert all(r["status"] == "ok" for r in opened.values())
+    assert portfolios.get("picky").open is None
+    assert (portfolios.get("atm").open.ce.lots, portfolios.get("atm").open.pe.lots) == (2, 1)
+    assert (portfolios.get("atm_1to1").open.ce.lots, portfolios.get("atm_1to1").open.pe.lots) == (1, 1)
+    assert opened["otm100"]["entry"] == {"ce": 80.25, "pe": 140.0}
+    held = {pf.name: pf.open for pf in portfolios.all_portfolios() if pf.open}
+    assert {p["portfolio"] for p in ledger.open_positions()} == set(held)
+
+    book.prices = {"22000": 131.5, "22001": 90.0, "22100": 70.0, "22101": 151.75}
+    expect = {name: positions._mtm_at(pos, book.prices[pos.ce.symbol["symboltoken"]],
+                                      book.prices[pos.pe.symbol["symboltoken"]]) for name, pos in held.items()}
+    start = {name: portfolios.get(name).balance for name in held}
+    commits = metrics.counter("ledger.commits")
+    closed = asyncio.run(portfolios.aclose_all("test"))
+
+    assert len(book.calls) == 2
+    assert metrics.counter("ledger.commits") == commits + 1
+    for name, pnl in expect.items():
+        assert closed[name] == {"status": "ok", "pnl": pytest.approx(pnl)}
+        pf = portfolios.get(name)
+        assert pf.open is None and pf.balance == pytest.approx(start[name] + pnl)
+        assert pf.realized == pytest.approx(pnl)
+    assert portfolios.get("otm100").balance == pytest.approx(200000 + expect["otm100"])
+
+    trades = {t["portfolio"]: t for t in ledger.recent_trades(portfolio=None)}
+    assert set(trades) == set(held)
+    assert all(trades[n]["pnl_total"] == round(expect[n], 2) for n in held)
+    states = ledger.load_states()
+    assert all(states[n]["balance"] == pytest.approx(portfolios.get(n).balance) for n in held)
+    assert ledger.open_positions() == []
+
+
+def test_unpriced_variant_is_left_flat(book):
+    book.prices = {"22000": 120.0, "22001": 95.5}          # no quotes for the otm100 legs
+    opened = asyncio.run(portfolios.aopen_all("DOWN", 0.95, (1, 2)))
+    assert opened["otm100"] == {"status": "error", "message": "no LTP for CE/PE"}
+    assert portfolios.get("otm100").open is None
+    assert {n for n, r in opened.items() if r["status"] == "ok"} == {"atm", "atm_1to1", "picky"}
+    assert len(ledger.open_positions()) == 3
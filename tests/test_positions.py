@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from service.engine import ledger, positions, reports
+from service.engine.quotes import quote_key
+
+CE = {"exchange": "NFO", "tradingsymbol": "NIFTY29OCT2622000CE", "symboltoken": "111"}
+PE = {"exchange": "NFO", "tradingsymbol": "NIFTY29OCT2622000PE", "symboltoken": "222"}
+
+
+@pytest.fixture
+def book(ledger_db, monkeypatch):
+    for name, value in (("_open", None), ("_balance", ledger.STARTING_FUNDS), ("_realized", 0.0), ("_used", 0.0)):
+        monkeypatch.setattr(positions, name, value)
+    monkeypatch.setattr(reports, "submit_funds", lambda *a, **k: None)
+    prices = {}
+
+    async def aget_quotes(symbols, mode="LTP", max_age_s=None):
+        return {quote_key(s): prices.get(quote_key(s)) for s in symbols}
+
+    monkeypatch.setattr(positions, "aget_quotes", aget_quotes)
+
+    # remember which thread each ledger write ran on
+    writers = []
+    for name in ("record_open", "record_close"):
+        def wrap(*a, _fn=getattr(ledger, name), **k):
+            writers.append(threading.get_ident())
+            return _fn(*a, **k)
+        monkeypatch.setattr(ledger, name, wrap)
+    return prices, writers
+
+
+def test_async_open_and_close_write_the_ledger_off_the_loop(book):
+    prices, writers = book
+
+    async def main():
+        loop_thread = threading.get_ident()
+        prices.update({"111": 120.0, "222": 90.0})
+        opened = await positions.aopen_position("UP", CE, PE, (2, 1))
+        prices.update({"111": 131.0, "222": 84.5})
+        closed = await positions.aclose_position("test")
+        return loop_thread, opened, closed
+
+    loop_thread, opened, closed = asyncio.run(main())
+    assert opened["status"] == "ok" and opened["used"] == (120.0 * 2 + 90.0) * positions.LOT_SIZE
+    assert closed == {"status": "ok", "pnl": pytest.approx((11.0 * 2 - 5.5) * positions.LOT_SIZE)}
+    assert len(writers) == 2 and loop_thread not in writers
+    assert positions.current_position() is None
+    assert ledger.load_state()["balance"] == pytest.approx(ledger.STARTING_FUNDS + closed["pnl"])
+
+
+def test_concurrent_closes_realize_the_position_once(book, monkeypatch):
+    prices, writers = book
+    real = ledger.record_close
+
+    def slow_close(*a, **k):
+        time.sleep(0.1)                 # the second close reaches _apply_close while the first is committing
+        return real(*a, **k)
+
+    async def main():
+        prices.update({"111": 120.0, "222": 90.0})
+        await positions.aopen_position("UP", CE, PE, (2, 1))
+        monkeypatch.setattr(ledger, "record_close", slow_close)
+        prices.update({"111": 131.0, "222": 84.5})
+        return await asyncio.gather(positions.aclose_position("a"), positions.aclose_position("b"))
+
+    results = asyncio.run(main())
+    pnl = (11.0 * 2 - 5.5) * positions.LOT_SIZE
+    assert sorted(r["status"] for r in results) == ["noop", "ok"]
+    assert len(ledger.recent_trades()) == 1
+    assert positions.current_position() is None
+    assert ledger.load_state()["balance"] == pytest.approx(ledger.STARTING_FUNDS + pnl)
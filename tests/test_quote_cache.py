@@ -0,0 +1,136 @@
+# tests/test_quote_cache.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from service.engine import quotes
+from service.engine.ratelimit import RateLimited
+
+WANTED = {"111": ("NFO", "NIFTY29OCT2622000CE", "111"), "222": ("NFO", "NIFTY29OCT2622000PE", "222")}
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(quotes, "_QCACHE", {})
+    monkeypatch.setattr(quotes, "_INFLIGHT", {})
+
+
+class _Fetch:
+    """Counting fetch that takes `delay` seconds; raises RateLimited for the first `shed` calls."""
+
+    def __init__(self, delay=0.2, shed=0):
+        self.delay = delay
+        self.shed = shed
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _next(self, miss):
+        with self._lock:
+            self.calls.append(sorted(miss))
+            n = len(self.calls)
+        if n <= self.shed:
+            raise RateLimited("quote: no SmartAPI budget for UI lane")
+        return {k: 100.0 + n + i for i, k in enumerate(sorted(miss))}
+
+    def __call__(self, miss):
+        time.sleep(self.delay)
+        return self._next(miss)
+
+    async def aio(self, miss):
+        await asyncio.sleep(self.delay)
+        return self._next(miss)
+
+
+def _threads(n, target):
+    start = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        start.wait()
+        results[i] = target()
+
+    ts = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join(10)
+    return results
+
+
+def test_concurrent_misses_share_one_fetch():
+    fetch = _Fetch()
+    results = _threads(8, lambda: quotes._cached_ltps(dict(WANTED), None, fetch))
+    assert len(fetch.calls) == 1
+    assert all(r == {"111": 101.0, "222": 102.0} for r in results)
+    assert quotes._INFLIGHT == {}
+
+    assert quotes._cached_ltps(dict(WANTED), None, fetch) == results[0]      # within the TTL
+    assert len(fetch.calls) == 1
+    quotes._cached_ltps(dict(WANTED), 0, fetch)                              # max_age_s=0 forces a fetch
+    assert len(fetch.calls) == 2
+
+
+def test_async_misses_share_one_fetch():
+    fetch = _Fetch()
+
+    async def main():
+        return await asyncio.gather(*(quotes._acached_ltps(dict(WANTED), None, fetch.aio) for _ in range(8)))
+
+    results = asyncio.run(main())
+    assert len(fetch.calls) == 1
+    assert all(r == {"111": 101.0, "222": 102.0} for r in results)
+
+
+def test_thread_and_async_callers_share_the_in_flight_table():
+    fetch = _Fetch(delay=0.3)
+    box = {}
+    t = threading.Thread(target=lambda: box.update(sync=quotes._cached_ltps(dict(WANTED), None, fetch)))
+    t.start()
+    time.sleep(0.05)
+    got = asyncio.run(quotes._acached_ltps(dict(WANTED), None, fetch.aio))
+    t.join(5)
+    assert len(fetch.calls) == 1
+    assert got == box["sync"]
+
+
+def test_rate_limited_fetch_serves_the_stale_price():
+    fetch = _Fetch(delay=0, shed=1)
+    quotes._QCACHE[("NFO", "111")] = (99.5, time.monotonic() - 60)
+    got = quotes._cached_ltps(dict(WANTED), None, fetch)
+    assert got == {"111": 99.5, "222": None}
+    assert quotes._QCACHE[("NFO", "111")][0] == 99.5 and ("NFO", "222") not in quotes._QCACHE   # nothing cached as fresh
+    assert quotes.quote_age({"exchange": "NFO", "tradingsymbol": "X", "symboltoken": "111"}) >= 60
+
+    assert quotes._cached_ltps(dict(WANTED), None, fetch) == {"111": 102.0, "222": 103.0}
+
+
+def test_waiter_retries_when_the_fetching_caller_was_shed():
+    fetch = _Fetch(delay=0.2, shed=1)
+    box = {}
+    t = threading.Thread(target=lambda: box.update(shed=quotes._cached_ltps(dict(WANTED), None, fetch)))
+    t.start()
+    time.sleep(0.05)
+    mine = quotes._cached_ltps(dict(WANTED), None, fetch)     # coalesces onto the shed flight, then retries
+    t.join(5)
+    assert box["shed"] == {"111": None, "222": None}
+    assert mine == {"111": 102.0, "222": 103.0}
+    assert len(fetch.calls) == 2
+
+
+def test_equal_tokens_on_different_segments_do_not_share_entries():
+    fetch = _Fetch(delay=0.2)
+    nfo = {"111": ("NFO", "NIFTY29OCT2622000CE", "111")}
+    nse = {"111": ("NSE", "SOMESTOCK-EQ", "111")}
+    box = {}
+    t = threading.Thread(target=lambda: box.update(nfo=quotes._cached_ltps(dict(nfo), None, fetch)))
+    t.start()
+    time.sleep(0.05)
+    got_nse = quotes._cached_ltps(dict(nse), None, fetch)     # same token in flight on NFO: not coalesced
+    t.join(5)
+    assert len(fetch.calls) == 2
+    assert set(quotes._QCACHE) == {("NFO", "111"), ("NSE", "111")}
+    assert quotes._cached_ltps(dict(nfo), None, fetch) == box["nfo"]
+    assert quotes._cached_ltps(dict(nse), None, fetch) == got_nse
+    assert len(fetch.calls) == 2
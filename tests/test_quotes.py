@@ -0,0 +1,108 @@
+# tests/test_quotes.py
+import asyncio
+import json
+
+import pytest
+
+from conftest import scrip_master, write_dump
+from service.engine import quotes, ticks
+from service.engine.instruments import instruments_version
+
+
+@pytest.fixture
+def feed(smartapi, monkeypatch):
+    """The stand-in, recording the token count of every market-quote request."""
+    monkeypatch.setattr(ticks, "_TICKS", {})
+    sizes = []
+    real_quote = smartapi.module.Handler._quote
+
+    def _quote(self, body):
+        sizes.append(sum(len(v) for v in (body.get("exchangeTokens") or {}).values()))
+        return real_quote(self, body)
+
+    monkeypatch.setattr(smartapi.module.Handler, "_quote", _quote)
+    smartapi.quote_sizes = sizes
+    return smartapi
+
+
+def _calls(srv, ep):
+    return srv.stats.get(ep, {}).get("requests", 0)
+
+
+def _options(n):
+    rows = [r for r in scrip_master() if r["exch_seg"] == "NFO" and r["instrumenttype"] == "OPTIDX"][:n]
+    return [{"exchange": "NFO", "tradingsymbol": r["symbol"], "symboltoken": r["token"]} for r in rows]
+
+
+STALE = {"exchange": "NFO", "tradingsymbol": "NIFTY29OCT2622000CE", "symboltoken": "1"}
+UNKNOWN = {"exchange": "NFO", "tradingsymbol": "NIFTY29OCT2699999CE", "symboltoken": "2"}
+
+
+def test_get_quotes_batches_by_fifty(feed):
+    symbols = _options(120)
+    out = quotes.get_quotes(symbols)
+    assert sorted(feed.quote_sizes) == [20, 50, 50]
+    assert set(out) == {s["symboltoken"] for s in symbols}
+    assert all(isinstance(v, float) and v > 0 for v in out.values())
+    assert _calls(feed, "search") == 0 and _calls(feed, "ltp") == 0
+
+    assert quotes.get_quotes(symbols) == out                     # within QUOTE_TTL_S: no round trip
+    assert len(feed.quote_sizes) == 3
+
+
+def test_misses_fall_back_per_symbol(feed):
+    symbols = _options(3) + [STALE, UNKNOWN, {"exchange": "NFO", "tradingsymbol": "NIFTY26NOV2621500PE"}]
+    out = quotes.get_quotes(symbols)
+    assert feed.quote_sizes == [5]                               # token-less symbols skip the batch
+    assert all(out[s["symboltoken"]] > 0 for s in symbols[:3])
+    assert out["1"] > 0                                          # stale token -> searchScrip + getLtpData
+    assert out["NIFTY26NOV2621500PE"] > 0                        # no token -> keyed by tradingsymbol
+    assert out["2"] is None                                      # not listed anywhere
+    assert _calls(feed, "search") == 3 and _calls(feed, "ltp") == 2
+
+
+def test_ohlc_rows_and_fallback_shape(feed):
+    sym = _options(1)[0]
+    out = quotes.get_quotes([sym, STALE], mode="ohlc")
+    row = out[sym["symboltoken"]]
+    assert row["symbolToken"] == sym["symboltoken"] and {"open", "high", "low", "close"} <= set(row)
+    assert out["1"]["tradingSymbol"] == "NIFTY29OCT2622000CE" and out["1"]["ltp"] > 0
+    assert set(out["1"]) == {"exchange", "tradingSymbol", "ltp"}
+    with pytest.raises(ValueError):
+        quotes.get_quotes([sym], mode="DEPTH")
+
+
+def test_aget_quotes_matches_sync_batching(feed):
+    symbols = _options(60) + [STALE]
+    out = asyncio.run(quotes.aget_quotes(symbols))
+    assert sorted(feed.quote_sizes) == [11, 50]
+    assert len(out) == 61 and all(v > 0 for v in out.values())
+    assert _calls(feed, "search") == 1 and _calls(feed, "ltp") == 1
+
+
+# ---------- Token resolution cache ----------
+def test_stale_token_costs_one_call_once_resolved(feed, instruments_file):
+    assert quotes.get_quote(STALE) > 0                           # getLtpData, searchScrip, getLtpData
+    assert _calls(feed, "ltp") == 2 and _calls(feed, "search") == 1
+
+    saved = json.loads(instruments_file.with_name("resolved_tokens.json").read_text())
+    assert saved["version"] == instruments_version()
+    assert saved["symbols"]["NFO|NIFTY29OCT2622000CE"][0] == "NIFTY29OCT2622000CE"
+    assert saved["symbols"]["NFO|NIFTY29OCT2622000CE"][1] != "1"
+
+    quotes._RESOLVED.update(version=None, loaded=False, symbols={})   # a restart reads it back from disk
+    assert quotes.get_quote(STALE, max_age_s=0) > 0
+    assert _calls(feed, "ltp") == 3 and _calls(feed, "search") == 1
+
+    quotes.get_quotes([STALE], max_age_s=0)                      # the batch path quotes the resolved token too
+    assert feed.quote_sizes == [1] and _calls(feed, "search") == 1
+
+
+def test_resolutions_are_dropped_when_the_scrip_master_changes(feed, instruments_file):
+    quotes.get_quote(STALE)
+    assert _calls(feed, "search") == 1
+
+    write_dump(instruments_file, scrip_master(strikes=range(21000, 23100, 50)))
+    assert quotes._resolved_symbols() == {}
+    quotes.get_quote(STALE, max_age_s=0)
+    assert _calls(feed, "search") == 2 and _calls(feed, "ltp") == 4
@@ -0,0 +1,95 @@
+# tests/test_ratelimit.py
+import asyncio
+import time
+
+import pytest
+
+from service.engine import metrics, ratelimit
+from service.engine.ratelimit import Priority, RateLimited, TokenBucket, priority
+
+
+def _buckets(monkeypatch, **buckets):
+    monkeypatch.setattr(ratelimit, "_BUCKETS", dict(buckets))
+
+
+def _take_until_shed(endpoint, limit=100):
+    n = 0
+    while n < limit:
+        try:
+            ratelimit.acquire(endpoint)
+        except RateLimited:
+            return n
+        n += 1
+    return n
+
+
+def test_lanes_keep_their_reserves(monkeypatch):
+    # refills ~nothing during the test: every lane sees a fixed burst of 10
+    _buckets(monkeypatch, quote=TokenBucket(0.01, burst=10))
+    shed = metrics.counter("ratelimit.quote.ui.shed")
+    with priority(Priority.UI):
+        assert _take_until_shed("quote") == 5            # leaves 50% for MTM/TRADE
+    assert metrics.counter("ratelimit.quote.ui.shed") == shed + 1
+    assert ratelimit.current_priority() is Priority.MTM  # default lane restored
+    assert _take_until_shed("quote") == 3                 # MTM leaves 20%
+    with priority(Priority.TRADE):
+        assert _take_until_shed("quote") == 2             # TRADE may drain the bucket
+
+
+def test_trade_waits_for_a_token(monkeypatch):
+    _buckets(monkeypatch, ltp=TokenBucket(20.0, burst=2))
+    throttled = metrics.counter("ratelimit.ltp.trade.throttled")
+    with priority(Priority.TRADE):
+        ratelimit.acquire("ltp")
+        ratelimit.acquire("ltp")
+        t0 = time.monotonic()
+        ratelimit.acquire("ltp")                            # waits ~1/20s instead of failing
+    assert 0.02 < time.monotonic() - t0 < 1.0
+    assert metrics.counter("ratelimit.ltp.trade.throttled") == throttled + 1
+    with priority(Priority.UI), pytest.raises(RateLimited):
+        ratelimit.acquire("ltp")                            # UI never waits
+
+
+def test_unthrottled_endpoint(monkeypatch):
+    _buckets(monkeypatch)
+    monkeypatch.delenv("SMARTAPI_RATE_ORDER", raising=False)
+    with priority(Priority.UI):
+        for _ in range(50):
+            ratelimit.acquire("order")
+    assert ratelimit._BUCKETS["order"] is None
+
+
+def test_priority_follows_to_thread_and_tasks(monkeypatch):
+    _buckets(monkeypatch, quote=TokenBucket(0.01, burst=10))
+
+    async def main():
+        with priority(Priority.UI):
+            lane = await asyncio.to_thread(ratelimit.current_priority)
+            in_thread = await asyncio.to_thread(_take_until_shed, "quote")
+            task_lane = await asyncio.create_task(asyncio.sleep(0, ratelimit.current_priority()))
+        return lane, in_thread, task_lane, ratelimit.current_priority()
+
+    lane, in_thread, task_lane, after = asyncio.run(main())
+    assert lane is Priority.UI and task_lane is Priority.UI
+    assert in_thread == 5
+    assert after is Priority.MTM
+
+
+def test_aacquire_lanes(monkeypatch):
+    _buckets(monkeypatch, quote=TokenBucket(20.0, burst=10))
+
+    async def take(n):
+        for _ in range(n):
+            await ratelimit.aacquire("quote")
+
+    async def main():
+        with priority(Priority.UI):
+            await take(5)
+            with pytest.raises(RateLimited):
+                await ratelimit.aacquire("quote")
+        await take(3)                                      # MTM down to its 20% floor
+        t0 = time.monotonic()
+        await take(1)                                      # then waits for a refill (within 1s)
+        return time.monotonic() - t0
+
+    assert 0.02 < asyncio.run(main()) < 1.0
@@ -0,0 +1,77 @@
+# tests/test_reports.py
+import threading
+import time
+
+import pytest
+
+from service.engine import ledger, metrics, reports
+
+
+def _wait(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _funds(n, mtm=None):
+    return {"balance": 500000.0 + n, "realized": float(n), "used": 20000.0, "mtm": mtm}
+
+
+@pytest.fixture
+def writer(ledger_db):
+    w = reports.ReportWriter(interval_s=0.3)
+    yield w
+    w.stop()
+
+
+def test_burst_is_coalesced_into_one_write_per_interval(writer):
+    writer.submit(_funds(0))
+    assert _wait(lambda: len(ledger.funds_history()) == 1)        # the first row goes out at once
+    coalesced = metrics.counter("reports.coalesced")
+
+    for n in range(1, 11):
+        writer.submit(_funds(n, mtm=10.0 * n))
+        writer.submit(_funds(n), portfolio="v_up")
+    assert _wait(lambda: ledger.latest_funds("v_up") is not None)
+    rows = ledger.funds_history()
+    assert [r["balance"] for r in rows] == [500000.0, 500010.0]   # only the last of the burst is kept
+    assert (rows[-1]["mtm"], rows[-1]["realized"]) == (100.0, 10.0)
+    assert ledger.latest_funds("v_up")["balance"] == 500010.0
+    assert metrics.counter("reports.coalesced") >= coalesced + 17  # nearly every submit replaced a pending row
+
+
+def test_submit_does_not_wait_for_the_ledger(writer, monkeypatch):
+    release = threading.Event()
+    real = ledger.record_funds_many
+    monkeypatch.setattr(ledger, "record_funds_many", lambda rows: release.wait(5) and real(rows))
+
+    t0 = time.monotonic()
+    writer.submit(_funds(1))
+    writer.submit(_funds(2))
+    assert time.monotonic() - t0 < 0.1
+    release.set()
+    assert _wait(lambda: ledger.latest_funds() is not None)
+
+
+def test_stop_flushes_what_the_interval_held_back(ledger_db):
+    w = reports.ReportWriter(interval_s=60.0)
+    w.submit(_funds(1))
+    assert _wait(lambda: len(ledger.funds_history()) == 1)
+    w.submit(_funds(2, mtm=-250.0))
+    time.sleep(0.05)
+    assert len(ledger.funds_history()) == 1                        # still inside the interval
+    w.stop()
+    assert [(r["balance"], r["mtm"]) for r in ledger.funds_history()] == [(500001.0, None), (500002.0, -250.0)]
+
+
+def test_module_flush_on_shutdown(ledger_db, monkeypatch):
+    monkeypatch.setattr(reports, "_WRITER", reports.ReportWriter(interval_s=60.0))
+    reports.submit_funds(510000.0, 10000.0, 0.0, None)
+    assert _wait(lambda: ledger.latest_funds() is not None)
+    reports.submit_funds(511000.0, 11000.0, 0.0, 42.0)
+    reports.flush()
+    assert ledger.latest_funds()["balance"] == 511000.0
+    assert ledger.latest_funds()["mtm"] == 42.0
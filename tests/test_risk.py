@@ -0,0 +1,102 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from service.engine import risk
+
+R, Q = 0.065, 0.01
+
+
+def _N(x):
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+def _bs(S, K, T, sigma, call, r=R, q=Q):
+    """Scalar Black-Scholes price and Greeks, in risk.py's units (theta per day, vega per vol point)."""
+    d1 = (math.log(S / K) + (r - q + 0.5 * sigma ** 2) * T) / (sigma * math.sqrt(T))
+    d2 = d1 - sigma * math.sqrt(T)
+    pdf = math.exp(-0.5 * d1 * d1) / math.sqrt(2.0 * math.pi)
+    dq, dr = math.exp(-q * T), math.exp(-r * T)
+    if call:
+        price = S * dq * _N(d1) - K * dr * _N(d2)
+        delta = dq * _N(d1)
+        theta = -S * dq * pdf * sigma / (2 * math.sqrt(T)) - r * K * dr * _N(d2) + q * S * dq * _N(d1)
+    else:
+        price = K * dr * _N(-d2) - S * dq * _N(-d1)
+        delta = -dq * _N(-d1)
+        theta = -S * dq * pdf * sigma / (2 * math.sqrt(T)) + r * K * dr * _N(-d2) - q * S * dq * _N(-d1)
+    return {"price": price, "delta": delta, "gamma": dq * pdf / (S * sigma * math.sqrt(T)),
+            "theta": theta / 365.0, "vega": S * dq * pdf * math.sqrt(T) / 100.0}
+
+
+def _contracts(seed, n=400):
+    rng = random.Random(seed)
+    S = np.array([rng.uniform(18000, 26000) for _ in range(n)])
+    K = np.round(S * np.array([rng.uniform(0.85, 1.15) for _ in range(n)]) / 50) * 50
+    T = np.array([rng.uniform(2, 90) / 365 for _ in range(n)])
+    sigma = np.array([rng.uniform(0.08, 0.8) for _ in range(n)])
+    call = np.array([rng.random() < 0.5 for _ in range(n)])
+    return S, K, T, sigma, call
+
+
+def test_greeks_match_scalar_black_scholes():
+    S, K, T, sigma, call = _contracts(22)
+    g = risk.greeks(S, K, T, sigma, call, R, Q)
+    for n in range(len(S)):
+        want = _bs(S[n], K[n], T[n], sigma[n], call[n])
+        for k, v in want.items():
+            assert g[k][n] == pytest.approx(v, rel=1e-9, abs=1e-9), (n, k)
+    assert risk.bs_price(S, K, T, sigma, call, R, Q) == pytest.approx(g["price"], rel=1e-12)
+
+
+def test_implied_vol_round_trips():
+    S, K, T, sigma, call = _contracts(23)
+    price = np.array([_bs(S[n], K[n], T[n], sigma[n], call[n])["price"] for n in range(len(S))])
+    iv = risk.implied_vol(price, S, K, T, call, R, Q)
+    # far from the money a vol is only pinned down as well as the price is
+    assert np.isfinite(iv).all()
+    assert risk.bs_price(S, K, T, iv, call, R, Q) == pytest.approx(price, rel=1e-6, abs=1e-6)
+    vega = risk.greeks(S, K, T, sigma, call, R, Q)["vega"]
+    sensitive = vega > 1.0
+    assert sensitive.sum() > len(S) // 2
+    assert iv[sensitive] == pytest.approx(sigma[sensitive], abs=1e-6)
+
+
+def test_deep_itm_and_otm_legs_fall_back_to_bisection():
+    S = 22000.0
+    K = np.array([30000.0, 26000.0, 17000.0, 15500.0])
+    T = np.array([0.02, 0.01, 0.03, 0.04])
+    sigma = np.array([0.9, 0.35, 0.7, 1.1])
+    call = np.array([True, True, False, False])
+    price = np.array([_bs(S, K[n], T[n], sigma[n], call[n])["price"] for n in range(len(K))])
+    # the solver's starting point sits where vega is numerically zero, so Newton cannot move
+    start = np.clip(np.sqrt(2 * np.pi / T) * price / S, 0.05, 2.0)
+    assert (risk.greeks(S, K, T, start, call, R, Q)["vega"] * 100 < 1e-8).all()
+
+    iv = risk.implied_vol(price, S, K, T, call, R, Q)
+    assert iv == pytest.approx(sigma, abs=1e-5)
+
+    # deep in the money: the same bracket recovers the vol from a call/put pair's time value
+    itm = risk.bs_price(S, K, T, sigma, ~call, R, Q)
+    assert risk.implied_vol(itm, S, K, T, ~call, R, Q) == pytest.approx(sigma, abs=1e-4)
+
+
+def test_prices_outside_no_arbitrage_bounds_are_nan():
+    S, K, T = 22000.0, np.array([21000.0, 23000.0, 22000.0, 22000.0, 22000.0]), 30 / 365
+    call = np.array([True, False, True, True, False])
+    intrinsic = np.maximum(np.where(call, 1, -1) * (S * math.exp(-Q * T) - K * math.exp(-R * T)), 0)
+    price = intrinsic.copy()
+    price[:2] -= 5.0                       # below intrinsic value
+    price[2] = 0.0                         # no time value at the money
+    price[3] = S * 1.01                    # a call worth more than the index
+    price[4] = np.nan                      # no quote
+    assert np.isnan(risk.implied_vol(price, S, K, T, call, R, Q)).all()
+
+    # expired or unknown expiry
+    ok = _bs(S, 22000.0, T, 0.2, True)["price"]
+    assert np.isnan(risk.implied_vol([ok, ok, ok], S, 22000.0, [0.0, -0.01, np.nan], True, R, Q)).all()
+    # the rest of an array still solves when some entries are NaN
+    iv = risk.implied_vol([ok, 1.0], S, [22000.0, 30000.0], T, [True, False], R, Q)
+    assert iv[0] == pytest.approx(0.2, abs=1e-6) and np.isnan(iv[1])
@@ -0,0 +1,60 @@
+# tests/test_scheduler.py
+import asyncio
+from datetime import datetime
+
+from service.engine import history, positions, scheduler
+from service.engine.instruments import IST
+from service.engine.ratelimit import Priority, current_priority, priority
+
+CE = {"exchange": "NFO", "tradingsymbol": "NIFTY29OCT2622000CE", "symboltoken": "111"}
+PE = {"exchange": "NFO", "tradingsymbol": "NIFTY29OCT2622000PE", "symboltoken": "222"}
+
+
+def test_sampler_fills_mtm_history_without_funds_polls(monkeypatch):
+    pos = positions.Position(ce=positions.Leg(CE, 2, entry=120.0), pe=positions.Leg(PE, 1, entry=90.0),
+                             side="UP", ratio=(2, 1), id=7)
+    monkeypatch.setattr(positions, "_open", pos)
+    monkeypatch.setattr(history, "_HISTORY", history.MtmHistory(size=64, min_interval_s=0))
+    history.get_history().reset(pos.id)
+    monkeypatch.setattr(scheduler, "_now_ist", lambda: datetime(2026, 10, 15, 11, 0, tzinfo=IST))   # a Thursday
+    monkeypatch.setattr(positions, "afunds_snapshot", None)      # nothing polls funds
+
+    lanes = []
+    ticks = iter([(121.0, 89.0), (123.5, 88.0), (125.0, 86.5)])
+
+    async def aleg_ltps(ce, pe, max_age_s=None):
+        lanes.append(current_priority())
+        return next(ticks)
+
+    monkeypatch.setattr(scheduler, "_aleg_ltps", aleg_ltps)
+
+    async def main():
+        with priority(Priority.UI):
+            return [await scheduler.sample_mtm() for _ in range(3)]
+
+    marks = asyncio.run(main())
+    lot = positions.LOT_SIZE
+    assert marks == [(1.0 * 2 - 1.0) * lot, (3.5 * 2 - 2.0) * lot, (5.0 * 2 - 3.5) * lot]
+    assert lanes == [Priority.MTM] * 3
+    q = history.get_history().query()
+    assert q["count"] == 3
+    assert [s["mtm"] for s in q["samples"]] == marks
+
+
+def test_sampler_is_idle_while_flat_or_out_of_hours(monkeypatch):
+    calls = []
+
+    async def aleg_ltps(ce, pe, max_age_s=None):
+        calls.append(ce)
+        return 100.0, 100.0
+
+    monkeypatch.setattr(scheduler, "_aleg_ltps", aleg_ltps)
+    monkeypatch.setattr(positions, "_open", None)
+    monkeypatch.setattr(scheduler, "_now_ist", lambda: datetime(2026, 10, 15, 11, 0, tzinfo=IST))
+    assert asyncio.run(scheduler.sample_mtm()) is None
+
+    monkeypatch.setattr(positions, "_open", positions.Position(
+        ce=positions.Leg(CE, 1, entry=1.0), pe=positions.Leg(PE, 1, entry=1.0), side="UP", ratio=(1, 1)))
+    monkeypatch.setattr(scheduler, "_now_ist", lambda: datetime(2026, 10, 17, 11, 0, tzinfo=IST))   # Saturday
+    assert asyncio.run(scheduler.sample_mtm()) is None
+    assert calls == []
@@ -0,0 +1,81 @@
+# tests/test_scrip_master.py
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from conftest import EXPIRIES, scrip_master
+from service.engine import instruments
+
+
+# ---------- Streaming parser ----------
+@pytest.mark.parametrize("chunk", [7, 64, 1 << 16])
+def test_stream_matches_json_load_across_chunk_boundaries(chunk, monkeypatch):
+    rows = scrip_master()
+    text = json.dumps(rows, indent=1)                 # whitespace and newlines between rows, like Angel's dump
+    monkeypatch.setattr(instruments, "_STREAM_CHUNK", chunk)
+    assert list(instruments.iter_scrip_master(io.StringIO(text))) == rows
+
+
+def test_stream_keeps_only_index_rows():
+    rows = scrip_master() + [
+        {"token": "500325", "symbol": "RELIANCE", "name": "RELIANCE", "expiry": "", "strike": "-1.000000",
+         "lotsize": "1", "instrumenttype": "", "exch_seg": "BSE", "tick_size": "5.000000"},
+        {"token": "1333", "symbol": "HDFCBANK-EQ", "name": "HDFCBANK", "expiry": "", "strike": "-1.000000",
+         "lotsize": "1", "instrumenttype": "", "exch_seg": "NSE", "tick_size": "5.000000"},
+    ]
+    kept = list(instruments.iter_scrip_master(io.StringIO(json.dumps(rows)), keep=instruments.is_index_row))
+    assert kept == [r for r in rows if instruments.is_index_row(r)]
+    assert {r["token"] for r in rows} - {r["token"] for r in kept} == {"2885", "500325", "1333"}
+
+
+def test_stream_rejects_malformed_input():
+    assert list(instruments.iter_scrip_master(io.StringIO(" [ ] "))) == []
+    assert list(instruments.iter_scrip_master(io.StringIO(""))) == []
+    with pytest.raises(ValueError, match="not a JSON array"):
+        list(instruments.iter_scrip_master(io.StringIO('{"token": "1"}')))
+    with pytest.raises(ValueError, match="truncated"):
+        list(instruments.iter_scrip_master(io.StringIO('[{"token": "1"},')))
+    with pytest.raises(json.JSONDecodeError):
+        list(instruments.iter_scrip_master(io.StringIO('[{"token": "1"}, {"token": ')))
+
+
+# ---------- Expiry parsing ----------
+def _every_format(s):
+    """The pre-memo parser: try each format in order."""
+    for f in instruments._EXPIRY_FMTS:
+        try:
+            return datetime.strptime(s.strip(), f)
+        except ValueError:
+            pass
+    return None
+
+
+@pytest.mark.parametrize("raw", [
+    "29OCT2026", "29Oct2026", "2026-10-29", "29-Oct-2026", "29 Oct 2026", "29-October-2026", "29 October 2026",
+    "13/02/2026", "02/13/2026", " 26NOV2026 ", "31FEB2026", "2026/10/29", "", "NA",
+])
+def test_shape_detection_agrees_with_trying_every_format(raw):
+    assert instruments._try_parse_expiry(raw) == _every_format(raw)
+
+
+def test_distinct_expiry_strings_are_parsed_once():
+    instruments._try_parse_expiry.cache_clear()
+    for r in scrip_master():
+        instruments._parse_expiry_any(r["expiry"] or None, r["symbol"])
+    info = instruments._try_parse_expiry.cache_info()
+    assert info.currsize == len(EXPIRIES)
+    assert info.hits > 100 * info.misses
+
+
+def test_expiry_and_month_from_symbol_text():
+    assert instruments._expiry_from_symbol("NIFTY26OCT22000CE") == datetime(2026, 10, 29)    # monthly: last Thursday
+    assert instruments._expiry_from_symbol("NIFTY 29-OCT-2026 22000 CE") == datetime(2026, 10, 29)
+    assert instruments._expiry_from_symbol("RELIANCE-EQ") is None
+    assert instruments._month_key_from_symbol_text("nifty26nov22000pe") == "2026-11"
+    assert instruments._month_key_from_symbol_text("NIFTYDEC2622000CE") == "2026-12"
+    assert instruments._month_key_from_symbol_text("BANKNIFTY 31 DEC 26 48000 CE") == "2026-12"
+    assert instruments._month_key_from_symbol_text("RELIANCE-EQ") is None
+    assert instruments._parse_expiry_any(None, "NIFTY26OCT22000CE") == datetime(2026, 10, 29)
+    assert instruments._parse_expiry_any("26NOV2026", "NIFTY26OCT22000CE") == datetime(2026, 11, 26)
@@ -0,0 +1,67 @@
+# tests/test_selector_model.py
+import os
+
+import joblib
+import pytest
+
+from service.engine import metrics
+from service.engine.selector import DEFAULT_FEATURES, ModelCache
+
+
+def _bump(path, seconds):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 1_000_000_000))
+
+
+def _dump(path, obj, bump_s=0):
+    joblib.dump(obj, path)
+    if bump_s:
+        _bump(path, bump_s)
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    return tmp_path / "model.pkl"
+
+
+def test_missing_file(model_path):
+    assert ModelCache(model_path).get() is None
+
+
+def test_load_hit_touch_and_reload(model_path):
+    _dump(model_path, {"model": {"w": 1}, "Xcols": ["close", "rsi14"], "metrics": {"acc": 0.6}})
+    cache = ModelCache(model_path)
+    first = cache.get()
+    assert first.model == {"w": 1} and first.xcols == ["close", "rsi14"] and first.metrics == {"acc": 0.6}
+    hits = metrics.counter("selector.model_cache_hits")
+    assert cache.get() is first
+    assert metrics.counter("selector.model_cache_hits") == hits + 1
+
+    # rewritten with identical bytes: rehashed, same bundle kept
+    touches = metrics.counter("selector.model_touches")
+    model_path.write_bytes(model_path.read_bytes())
+    _bump(model_path, 1)
+    assert cache.get() is first
+    assert metrics.counter("selector.model_touches") == touches + 1
+
+    # new content: unpickled and swapped in
+    _dump(model_path, {"model": {"w": 2}}, bump_s=2)
+    second = cache.get()
+    assert second is not first and second.model == {"w": 2}
+    assert second.xcols == DEFAULT_FEATURES and second.sha256 != first.sha256
+
+
+def test_broken_file_keeps_the_previous_bundle(model_path):
+    _dump(model_path, {"model": {"w": 1}})
+    cache = ModelCache(model_path)
+    good = cache.get()
+    failures = metrics.counter("selector.model_load_failures")
+    model_path.write_bytes(b"not a pickle")
+    assert cache.get() is good
+    assert cache.get() is good                              # not retried until the file changes again
+    assert metrics.counter("selector.model_load_failures") == failures + 1
+
+    _dump(model_path, {"model": {"w": 3}}, bump_s=1)
+    assert cache.get().model == {"w": 3}
+    model_path.unlink()
+    assert cache.get() is None
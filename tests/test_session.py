@@ -0,0 +1,74 @@
+# tests/test_session.py
+import time
+
+import pytest
+
+from service.engine import metrics, session
+
+
+def _calls(srv, ep):
+    return srv.stats.get(ep, {}).get("requests", 0)
+
+
+def test_cold_start_logs_in_once_and_reads_exp(smartapi):
+    mgr = session.get_session()
+    jwt = mgr.token()
+    assert jwt.endswith(".standin")
+    assert 3500 < mgr.remaining_s() <= 3600          # exp claim of the issued JWT, not the TTL default
+    assert mgr.refresh_token and mgr.feed_token == "standin-feed"
+    assert mgr.token() == jwt
+    assert _calls(smartapi, "login") == 1 and _calls(smartapi, "refresh") == 0
+
+
+def test_refresh_ahead_of_expiry_uses_the_refresh_token(smartapi):
+    mgr = session.get_session()
+    mgr.token()
+    before = metrics.counter("session.refreshes")
+
+    assert mgr.ensure_fresh() == mgr.jwt                        # an hour left: nothing to do
+    assert _calls(smartapi, "refresh") == 0
+
+    mgr.expires_at = time.time() + 60                            # inside SMARTAPI_REFRESH_AHEAD_S
+    mgr.ensure_fresh()
+    assert _calls(smartapi, "refresh") == 1 and _calls(smartapi, "login") == 1
+    assert metrics.counter("session.refreshes") == before + 1
+    assert mgr.remaining_s() > 3500
+
+
+def test_rejected_refresh_falls_back_to_login(smartapi, monkeypatch):
+    mgr = session.get_session()
+    mgr.token()
+    monkeypatch.setattr(smartapi.module.Handler, "_refresh",
+                        lambda self, body: {"status": False, "message": "Invalid Token", "errorcode": "AG8001",
+                                            "data": None})
+    failures = metrics.counter("session.refresh_failures")
+
+    mgr.expires_at = time.time() + 60
+    jwt = mgr.ensure_fresh()
+    assert _calls(smartapi, "refresh") == 1 and _calls(smartapi, "login") == 2
+    assert metrics.counter("session.refresh_failures") == failures + 1
+    assert mgr.jwt == jwt and mgr.remaining_s() > 3500
+
+
+def test_unreachable_refresh_falls_back_to_login(smartapi, monkeypatch):
+    mgr = session.get_session()
+    mgr.token()
+    real_post = session.SessionManager._post
+
+    def post(self, endpoint, path, payload, jwt=None):
+        if endpoint == "refresh":
+            raise ConnectionError("refresh endpoint down")
+        return real_post(self, endpoint, path, payload, jwt)
+
+    monkeypatch.setattr(session.SessionManager, "_post", post)
+    mgr.expires_at = 0.0                                          # expired: the inline path refreshes too
+    mgr.token()
+    assert _calls(smartapi, "login") == 2
+    assert mgr.valid()
+
+
+def test_login_needs_credentials(smartapi, monkeypatch):
+    monkeypatch.delenv("SMARTAPI_PIN")
+    with pytest.raises(RuntimeError, match="not fully set"):
+        session.get_session().token()
+    assert _calls(smartapi, "login") == 0
@@ -0,0 +1,143 @@
+# tests/test_ticks.py
+import asyncio
+import importlib.util
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import websockets
+
+from conftest import ROOT
+from service.engine import metrics, ticks
+
+
+def _wait(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+# ---------- Frames ----------
+def test_frame_round_trip():
+    frame = ticks.encode_ltp_frame("35003", 2, 123.45, seq=7, exchange_ts_ms=1_700_000_000_000)
+    assert ticks.parse_tick(frame) == ("35003", 2, 123.45, 1_700_000_000_000)
+    # quote/snap-quote frames carry more fields after the common head
+    assert ticks.parse_tick(frame + b"\x00" * 100) == ticks.parse_tick(frame)
+    assert ticks.parse_tick(frame[:-1]) is None
+    assert ticks.parse_tick(b"") is None
+
+
+# ---------- Cache ----------
+def test_cache_is_keyed_by_exchange_type(monkeypatch):
+    monkeypatch.setattr(ticks, "_TICKS", {})
+    ticks.record_tick(2, "111", 10.5)
+    ticks.record_tick(1, "111", 22000.0)
+    assert ticks.fresh_ltp("NFO", "111") == 10.5
+    assert ticks.fresh_ltp("nse", "111") == 22000.0
+    assert ticks.fresh_ltp("BSE", "111") is None
+    assert ticks.fresh_ltp("NFO", "") is None
+
+    ltp, age = ticks.last_tick("NFO", "111")
+    assert ltp == 10.5 and 0 <= age < 1
+    now = time.monotonic()
+    monkeypatch.setattr(ticks.time, "monotonic", lambda: now + 10)
+    assert ticks.fresh_ltp("NFO", "111") is None
+    assert ticks.fresh_ltp("NFO", "111", max_age_s=60) == 10.5
+
+
+# ---------- Feed against the local stand-in ----------
+@pytest.fixture
+def standin():
+    """scripts/tick_feed_standin.py served on an ephemeral port from a background loop."""
+    spec = importlib.util.spec_from_file_location("tick_feed_standin", ROOT / "scripts" / "tick_feed_standin.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+
+    args = SimpleNamespace(interval=0.02, drop_every=0.5)
+    replay = [
+        {"token": "111", "exchangeType": 2, "ltp": 101.25},
+        {"token": "111", "exchangeType": 1, "ltp": 22000.0},   # same token on NSE: not subscribed
+        {"token": "222", "exchangeType": 2, "ltp": 55.0},
+    ]
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    box = {}
+
+    async def serve():
+        box["server"] = await websockets.serve(lambda ws: mod._serve_client(ws, args, replay), "127.0.0.1", 0)
+        box["port"] = box["server"].sockets[0].getsockname()[1]
+        started.set()
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(serve(), loop).result(5)
+    assert started.wait(5)
+    yield f"ws://127.0.0.1:{box['port']}"
+
+    async def shutdown():
+        box["server"].close()
+        await box["server"].wait_closed()
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_feed_subscribes_and_resubscribes_after_drops(standin, monkeypatch):
+    monkeypatch.setattr(ticks, "_TICKS", {})
+    monkeypatch.setattr(ticks, "_auth_headers", lambda: {})
+    monkeypatch.setattr(ticks, "RECONNECT_MAX_S", 0.1)
+    reconnects = metrics.counter("ticks.reconnects")
+
+    feed = ticks.TickFeed(url=standin)
+    feed.subscribe([{"exchange": "NFO", "symboltoken": "111"}])
+    feed.start()
+    try:
+        assert _wait(lambda: (2, "111") in ticks._TICKS)
+        assert ticks.fresh_ltp("NFO", "111") == 101.25
+        assert set(ticks._TICKS) == {(2, "111")}      # only the subscribed (exchangeType, token)
+
+        # the stand-in drops every connection after 0.5s; ticks keep coming after each reconnect
+        assert _wait(lambda: metrics.counter("ticks.reconnects") >= reconnects + 2)
+        ticks._TICKS.clear()
+        assert _wait(lambda: (2, "111") in ticks._TICKS)
+
+        feed.unsubscribe([{"exchange": "NFO", "symboltoken": "111"}])
+        feed.subscribe([{"exchange": "NFO", "token": "222"}])
+        assert _wait(lambda: (2, "222") in ticks._TICKS)
+        time.sleep(0.1)
+        ticks._TICKS.clear()
+        time.sleep(0.2)
+        assert (2, "111") not in ticks._TICKS
+    finally:
+        feed.stop()
+    assert not feed.connected.is_set()
+
+
+def test_text_heartbeat_gets_pongs_and_silence_reconnects(standin, monkeypatch):
+    monkeypatch.setattr(ticks, "_TICKS", {})
+    monkeypatch.setattr(ticks, "_auth_headers", lambda: {})
+    monkeypatch.setattr(ticks, "RECONNECT_MAX_S", 0.1)
+    monkeypatch.setattr(ticks, "HEARTBEAT_S", 0.05)
+    monkeypatch.setattr(ticks, "PONG_TIMEOUT_S", 0.2)
+    pongs, timeouts = metrics.counter("ticks.pongs"), metrics.counter("ticks.heartbeat_timeouts")
+
+    feed = ticks.TickFeed(url=standin)
+    feed.start()
+    try:
+        # the stand-in answers the text "ping" with "pong"
+        assert _wait(lambda: metrics.counter("ticks.pongs") >= pongs + 3)
+        assert metrics.counter("ticks.heartbeat_timeouts") == timeouts
+
+        # pongs stop arriving: the heartbeat drops the connection
+        handle = feed._on_message
+        monkeypatch.setattr(feed, "_on_message", lambda ws, m: None if m == "pong" else handle(ws, m))
+        assert _wait(lambda: metrics.counter("ticks.heartbeat_timeouts") > timeouts)
+    finally:
+        feed.stop()
+    assert not feed.connected.is_set()
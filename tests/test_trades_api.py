@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from service.api import app as api
+from service.engine import ledger
+
+BOOKS = ("default", "conf60", "otm100")
+
+
+@pytest.fixture
+def trades(ledger_db, monkeypatch):
+    """~150 closed trades over two months, across three books, written in time order."""
+    rng = random.Random(21)
+    clock = {"t": datetime(2026, 8, 3, 9, 21)}
+    monkeypatch.setattr(ledger, "_now_ist_str", lambda: clock["t"].strftime("%Y-%m-%d %H:%M:%S"))
+    rows = []
+    for n in range(150):
+        clock["t"] += timedelta(hours=rng.choice((3, 9, 18, 24)))
+        book = rng.choice(BOOKS)
+        lots = rng.choice(((2, 1), (1, 2)))
+        pnl = round(rng.uniform(-4000, 6000), 2)
+        trade = {"action": "SQUAREOFF", "symbol_ce": f"CE{n}", "symbol_pe": f"PE{n}",
+                 "lots_ce": lots[0], "lots_pe": lots[1], "pnl_total": pnl, "note": "seed"}
+        tid = ledger.record_close(None, {}, trade, 500000.0 + pnl, pnl, portfolio=book)
+        rows.append({"id": tid, "ts": ledger._now_ist_str(), "portfolio": book,
+                     "side": "UP" if lots[0] > lots[1] else "DOWN"})
+    return rows
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)   # no startup hooks: the scheduler is not started
+
+
+def _pages(client, limit, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        q = dict(params, limit=limit, **({"cursor": cursor} if cursor is not None else {}))
+        body = client.get("/api/trades", params=q).json()
+        ids += [t["id"] for t in body["trades"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+def _expect(rows, start=None, end=None, side=None, portfolio="default"):
+    return [r["id"] for r in reversed(rows)
+            if (start is None or r["ts"][:10] >= start) and (end is None or r["ts"][:10] <= end)
+            and (side is None or r["side"] == side.upper()) and (portfolio == "all" or r["portfolio"] == portfolio)]
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"portfolio": "all"},
+    {"portfolio": "conf60", "side": "up"},
+    {"portfolio": "all", "from": "2026-08-20", "to": "2026-09-10"},
+    {"portfolio": "otm100", "side": "DOWN", "from": "2026-09-01"},
+    {"portfolio": "all", "to": "2026-08-15"},
+    {"portfolio": "all", "from": "2027-01-01"},
+])
+def test_cursor_pages_cover_every_match_once(trades, client, params):
+    want = _expect(trades, params.get("from"), params.get("to"), params.get("side"), params.get("portfolio", "default"))
+    ids, pages = _pages(client, 7, **params)
+    assert ids == want                       # newest first, no gaps, no duplicates
+    assert pages == max(1, -(-len(want) // 7))
+
+
+def test_streams_match_the_json_pages(trades, client):
+    params = {"portfolio": "all", "from": "2026-08-10", "to": "2026-09-20", "side": "up"}
+    ids, _ = _pages(client, 500, **params)
+    page = client.get("/api/trades", params=dict(params, limit=500)).json()["trades"]
+    assert [t["id"] for t in page] == ids
+
+    r = client.get("/api/trades", params=dict(params, format="csv"))
+    assert r.headers["content-type"].startswith("text/csv")
+    got = list(csv.DictReader(io.StringIO(r.text)))
+    assert [int(row["id"]) for row in got] == ids[::-1]   # oldest first
+    for row, t in zip(got, page[::-1]):
+        assert row == {k: "" if t[k] is None else str(t[k]) for k in api.TRADE_COLUMNS}
+
+    r = client.get("/api/trades", params=dict(params, format="ndjson"))
+    assert [json.loads(line) for line in r.text.splitlines()] == page[::-1]
+
+
+def test_bad_dates_are_rejected(client, ledger_db):
+    assert client.get("/api/trades", params={"from": "2026-13-01"}).status_code == 400
+    assert client.get("/api/trades", params={"side": "flat"}).status_code == 422
+
+
+def test_out_of_order_trades_fall_back_to_timestamp_filters(trades, client, monkeypatch):
+    assert ledger._TS_ORDERED
+    # a trade stamped before the ones already written (e.g. a late legacy import)
+    monkeypatch.setattr(ledger, "_now_ist_str", lambda: "2026-08-05 12:00:00")
+    late = ledger.record_close(None, {}, {"lots_ce": 2, "lots_pe": 1, "pnl_total": 1.0}, 0.0, 0.0)
+    assert not ledger._TS_ORDERED
+    rows = trades + [{"id": late, "ts": "2026-08-05 12:00:00", "portfolio": "default", "side": "UP"}]
+
+    params = {"from": "2026-08-05", "to": "2026-08-12"}
+    ids, _ = _pages(client, 3, **params)
+    assert late in ids
+    assert sorted(ids) == sorted(_expect(rows, "2026-08-05", "2026-08-12"))
+
+    ledger.close()                           # re-checked when the ledger is reopened
+    assert sorted(_pages(client, 3, **params)[0]) == sorted(ids)
+    assert not ledger._TS_ORDERED
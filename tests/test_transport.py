@@ -0,0 +1,69 @@
+import asyncio
+import http.server
+import threading
+
+import pytest
+
+from service.engine import transport
+
+
+class _Ok(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so clients hold pooled connections
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Ok)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}/"
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_each_loop_gets_its_own_client_closed_with_the_loop(url):
+    t = transport.AsyncTransport()
+    seen = []
+
+    async def use():
+        await asyncio.gather(*(t.post("quote", url, headers={}, data=b"{}") for _ in range(3)))
+        seen.append(await t._client_for_loop())
+        assert len(t._clients) == 1            # one client per loop, shared by concurrent calls
+
+    for _ in range(5):
+        asyncio.run(use())
+    assert len({id(c) for c in seen}) == 5
+    assert all(c.is_closed for c in seen)      # closed by asyncio.run's shutdown_asyncgens()
+    assert len(t._clients) == 0
+
+
+def test_aclose_closes_the_current_and_other_running_loops(url):
+    t = transport.AsyncTransport()
+    other = asyncio.new_event_loop()
+    thread = threading.Thread(target=other.run_forever, daemon=True)
+    thread.start()
+    try:
+        theirs = asyncio.run_coroutine_threadsafe(t._client_for_loop(), other).result(5)
+
+        async def main():
+            await t.post("quote", url, headers={}, data=b"{}")
+            mine = await t._client_for_loop()
+            await t.aclose()
+            return mine
+
+        mine = asyncio.run(main())
+        assert mine.is_closed and theirs.is_closed
+        assert len(t._clients) == 0
+    finally:
+        other.call_soon_threadsafe(other.stop)
+        thread.join(5)
+        other.close()